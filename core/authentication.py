@@ -3,6 +3,8 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework.authentication import SessionAuthentication
+from rest_framework.request import Request
+from rest_framework.settings import api_settings as drf_settings
 
 from rest_framework_simplejwt.authentication import JWTAuthentication, AuthUser
 from rest_framework_simplejwt.settings import api_settings
@@ -83,3 +85,21 @@ class TokenAuthentication(JWTAuthentication):
                 )
 
         return user
+
+
+def authenticate_query_token(request):
+    """
+    User of a plain Django view's request, authenticated like API requests.
+    Clients that can not send headers, like ``EventSource`` and ``<img>``,
+    may give the access token in the ``token`` parameter.
+    """
+    token = request.GET.get("token")
+    if token and "HTTP_AUTHORIZATION" not in request.META:
+        request.META["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return Request(
+        request,
+        authenticators=[
+            authentication()
+            for authentication in drf_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ],
+    ).user
@@ -1,9 +1,159 @@
+import logging
+import time
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
 from django.db.utils import IntegrityError
 
 from rest_framework import status
 from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.db_routers import use_replica
+
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_COOKIE = "use_primary"
+
+# Pins are neither read nor set until then, after Redis failed
+_redis_down_until = 0
+
+
+def pins_down():
+    return time.monotonic() < _redis_down_until
+
+
+def pins_failed(error):
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + settings.REPLICA_PIN_REDIS_RETRY
+    logger.warning(
+        "Replica pins are off for %ss: %s", settings.REPLICA_PIN_REDIS_RETRY, error
+    )
+
+
+class ReplicaMiddleware:
+    """
+    Let safe requests read from the replicas. A client that sent a write
+    reads from the primary for ``REPLICA_PIN_SECONDS`` afterwards, so it
+    sees its own changes before they reach the replicas.
+
+    The pin is a cookie for browser clients. For token clients it is a key
+    on the access token's user in the shared ``replica_pin`` cache, so every
+    worker sees it and it outlives a token refresh. While that cache is
+    unreachable token clients read from the primary, and it is left alone
+    for ``REPLICA_PIN_REDIS_RETRY`` seconds after a failure.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        key = self.pin_key(request)
+        pinned = PRIMARY_COOKIE in request.COOKIES
+        if safe and not pinned and key is not None:
+            if pins_down():
+                pinned = True
+            else:
+                try:
+                    pinned = caches["replica_pin"].get(key) is not None
+                except redis.RedisError as e:
+                    pins_failed(e)
+                    pinned = True
+
+        token = use_replica.set(safe and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+        if not safe:
+            self.set_cookie(response)
+            if key is not None and not pins_down():
+                try:
+                    caches["replica_pin"].set(key, 1, settings.REPLICA_PIN_SECONDS)
+                except redis.RedisError as e:
+                    pins_failed(e)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        key = self.pin_key(request)
+        pinned = PRIMARY_COOKIE in request.COOKIES
+        if safe and not pinned and key is not None:
+            if pins_down():
+                pinned = True
+            else:
+                try:
+                    pinned = await caches["replica_pin"].aget(key) is not None
+                except redis.RedisError as e:
+                    pins_failed(e)
+                    pinned = True
+
+        token = use_replica.set(safe and not pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+        if not safe:
+            self.set_cookie(response)
+            if key is not None and not pins_down():
+                try:
+                    await caches["replica_pin"].aset(
+                        key, 1, settings.REPLICA_PIN_SECONDS
+                    )
+                except redis.RedisError as e:
+                    pins_failed(e)
+        return response
+
+    def pin_key(self, request):
+        """Key of the access token's user, None without a valid token"""
+        header = request.headers.get("Authorization")
+        if not header:
+            return None
+        try:
+            raw_token = JWTAuthentication().get_raw_token(header.encode())
+            if raw_token is None:
+                return None
+            # Only the signature is checked, the user is not loaded
+            user_id = AccessToken(raw_token)[api_settings.USER_ID_CLAIM]
+        except (AuthenticationFailed, TokenError, KeyError):
+            return None
+        return f"replica-pin:user:{user_id}"
+
+    def set_cookie(self, response):
+        response.set_cookie(
+            PRIMARY_COOKIE,
+            "1",
+            max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
 
 
 # class ErrorMiddleware:
@@ -0,0 +1,38 @@
+import io
+import re
+
+from django.conf import settings
+
+from rest_framework.parsers import JSONParser
+
+from core.renderers import ORJSONRenderer, orjson
+
+
+# orjson turns integers past 64 bits into floats, json keeps them exact
+LONG_NUMBER = re.compile(rb"\d{19,}")
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSON parser backed by orjson. Falls back to DRF's JSONParser when orjson
+    is not installed, rejects the body or could read a number differently,
+    so errors and edge cases behave as before.
+    """
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if LONG_NUMBER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
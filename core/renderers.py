@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# orjson writes floats like json.dumps() only between these bounds, outside
+# them it drops the exponent sign and padding (1e16 instead of 1e+16)
+FLOAT_REPR_MIN = 1e-4
+FLOAT_REPR_MAX = 1e16
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson, producing the same bytes as DRF's
+    JSONRenderer. Falls back to it when orjson is not installed, an indent
+    is requested or the data has values orjson would write differently.
+    """
+
+    encoder = JSONEncoder()
+
+    def default(self, obj):
+        if type(obj) is Decimal:
+            value = float(obj)
+            if value and not FLOAT_REPR_MIN <= abs(value) < FLOAT_REPR_MAX:
+                raise TypeError("Decimal outside of the orjson float range")
+            return value
+        return self.encoder.default(obj)
+
+    def get_options(self):
+        return orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.get_options())
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escape U+2028 and U+2029 like JSONRenderer does
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
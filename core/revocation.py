@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import math
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Set of strings that may answer "maybe" for items it does not hold"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_items(cls, items):
+        bloom = cls(
+            max(2 * len(items), settings.REVOKED_TOKENS_MIN_CAPACITY),
+            settings.REVOKED_TOKENS_ERROR_RATE,
+        )
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item):
+        if isinstance(item, str):
+            item = item.encode()
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """Client of the revocation list Redis, one per process"""
+    return redis.Redis.from_url(
+        settings.REVOKED_TOKENS_REDIS_URL,
+        socket_timeout=settings.REVOKED_TOKENS_REDIS_TIMEOUT,
+        socket_connect_timeout=settings.REVOKED_TOKENS_REDIS_TIMEOUT,
+    )
+
+
+class RevokedTokens:
+    """
+    JWT ids revoked before they expire, kept in a Redis sorted set scored
+    by expiry. Each process mirrors the set in a Bloom filter rebuilt at
+    most every ``REVOKED_TOKENS_SYNC_SECONDS`` when the set changed, so a
+    token that was not revoked is accepted without asking Redis. Another
+    process may accept a revoked token until its next sync.
+    """
+
+    KEY = "revoked_tokens"
+    VERSION_KEY = "revoked_tokens:version"
+
+    def __init__(self):
+        self.bloom = None
+        self.version = None
+        self.synced_at = -math.inf
+
+    def revoke(self, jti, exp):
+        """
+        Add ``jti`` to the revocation list. While Redis is unreachable the
+        token stays valid until it expires, a logout still goes through.
+        """
+        if not settings.REVOKED_TOKENS_REDIS_URL:
+            return
+        try:
+            with get_redis().pipeline() as pipe:
+                pipe.zadd(self.KEY, {jti: exp})
+                pipe.incr(self.VERSION_KEY)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Could not revoke a token: %s", e)
+            return
+        if self.bloom is not None:
+            self.bloom.add(jti)
+
+    def sync(self):
+        """Rebuild the Bloom filter if the revocation list changed"""
+        now = time.monotonic()
+        if now - self.synced_at < settings.REVOKED_TOKENS_SYNC_SECONDS:
+            return
+        # Set first, so an unreachable Redis is not retried on every request
+        self.synced_at = now
+
+        client = get_redis()
+        version = client.get(self.VERSION_KEY)
+        if self.bloom is not None and version == self.version:
+            return
+        client.zremrangebyscore(self.KEY, "-inf", time.time())
+        self.bloom = BloomFilter.from_items(client.zrange(self.KEY, 0, -1))
+        self.version = version
+
+    def is_revoked(self, jti):
+        if not settings.REVOKED_TOKENS_REDIS_URL:
+            return False
+        try:
+            self.sync()
+        except redis.RedisError as e:
+            logger.warning("Could not sync revoked tokens: %s", e)
+
+        if self.bloom is None or jti not in self.bloom:
+            return False
+        try:
+            exp = get_redis().zscore(self.KEY, jti)
+        except redis.RedisError as e:
+            logger.warning("Could not check a revoked token: %s", e)
+            return True
+        return exp is not None and exp > time.time()
+
+
+revoked_tokens = RevokedTokens()
+
+
+class RevocableTokenMixin:
+    def verify(self):
+        super().verify()
+        if revoked_tokens.is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is revoked"))
+
+    def revoke(self):
+        revoked_tokens.revoke(self[api_settings.JTI_CLAIM], self["exp"])
+
+
+class RevocableAccessToken(RevocableTokenMixin, AccessToken):
+    pass
+
+
+class RevocableRefreshToken(RevocableTokenMixin, RefreshToken):
+    access_token_class = RevocableAccessToken
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from django.utils import timezone
@@ -51,6 +52,19 @@ DATABASES = {
     }
 }
 
+# Read replicas, each a dict of overrides for the default database,
+# e.g. DB_REPLICAS = [{"NAME": BASE_DIR / "replica.sqlite3"}]
+DATABASE_REPLICAS = []
+for index, replica in enumerate(getattr(settings, "DB_REPLICAS", [])):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {**DATABASES["default"], **replica, "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.db_routers.ReplicaRouter"]
+
+# Seconds a client reads from the primary after a write
+REPLICA_PIN_SECONDS = getattr(settings, "REPLICA_PIN_SECONDS", 10)
+
 
 # Application definition
 
@@ -66,8 +80,6 @@ INSTALLED_APPS = [
     "rest_framework",
     "rest_framework_simplejwt",
     "django_filters",
-    "drf_spectacular",
-    "drf_spectacular_sidecar",
     # Project apps
     "src",
     "src.management",
@@ -77,6 +89,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -87,7 +100,7 @@ MIDDLEWARE = [
 
 if DEBUG:
     MIDDLEWARE += ("debug_toolbar.middleware.DebugToolbarMiddleware",)
-    INSTALLED_APPS += ("debug_toolbar",)
+    INSTALLED_APPS += ("debug_toolbar", "drf_spectacular", "drf_spectacular_sidecar")
     INTERNAL_IPS = ("127.0.0.1",)
     DEBUG_TOOLBAR_CONFIG = {
         "INTERCEPT_REDIRECTS": False,
@@ -95,6 +108,14 @@ if DEBUG:
 
 ROOT_URLCONF = "core.urls"
 WSGI_APPLICATION = "core.wsgi.application"
+
+# Serve anonymous catalog reads with async views, core/asgi.py turns it on
+ASYNC_READ_VIEWS = getattr(
+    settings,
+    "ASYNC_READ_VIEWS",
+    os.environ.get("DJANGO_ASYNC_READ_VIEWS") == "1",
+)
+
 AUTH_USER_MODEL = "management.User"
 
 
@@ -118,12 +139,20 @@ TEMPLATES = [
 
 # REST settings
 REST_FRAMEWORK = {
-    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_FILTER_BACKENDS": (
         "rest_framework.filters.SearchFilter",
         "rest_framework.filters.OrderingFilter",
         "django_filters.rest_framework.DjangoFilterBackend",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "core.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "core.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "src.pagination.CustomPagination",
     "PAGE_SIZE": 30,
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
@@ -133,8 +162,47 @@ REST_FRAMEWORK = {
     ],
     "DATE_INPUT_FORMATS": ["%Y-%m-%d"],
     "COERCE_DECIMAL_TO_STRING": False,
+    # Token bucket sizes and refill rates of core.throttling scopes
+    "DEFAULT_THROTTLE_RATES": getattr(
+        settings,
+        "THROTTLE_RATES",
+        {"login": "10/min", "public_write": "20/hour", "heavy_read": "60/min"},
+    ),
+    # Proxies in front of the app, each appends to X-Forwarded-For. Client
+    # addresses are taken from there, so a client can not pick its own
+    # throttling bucket. 0 uses REMOTE_ADDR.
+    "NUM_PROXIES": getattr(settings, "NUM_PROXIES", 0),
 }
 
+# Production serves the pre-built schema, see build_schema
+SCHEMA_CLASS = "drf_spectacular.openapi.AutoSchema"
+if DEBUG:
+    REST_FRAMEWORK["DEFAULT_SCHEMA_CLASS"] = SCHEMA_CLASS
+
+# Closed appointments and reports older than this move to the archive
+ARCHIVE_AFTER_DAYS = getattr(settings, "ARCHIVE_AFTER_DAYS", 2 * 365)
+
+# Seconds a doctor's dashboard is served from the cache
+DOCTOR_DASHBOARD_CACHE_SECONDS = getattr(settings, "DOCTOR_DASHBOARD_CACHE_SECONDS", 30)
+
+# Seconds a stored Idempotency-Key response is replayed for
+IDEMPOTENCY_KEY_TTL = getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60)
+
+# Change feed: rows updated in the last CHANGE_FEED_LAG_SECONDS wait for the
+# next sync, so a transaction committing late is not skipped. Tombstones of
+# deleted rows are kept CHANGE_FEED_TOMBSTONE_DAYS, older cursors resync.
+CHANGE_FEED_LAG_SECONDS = getattr(settings, "CHANGE_FEED_LAG_SECONDS", 5)
+CHANGE_FEED_TOMBSTONE_DAYS = getattr(settings, "CHANGE_FEED_TOMBSTONE_DAYS", 90)
+
+# Admin changelists of large tables show the PostgreSQL row estimate past
+# ADMIN_EXACT_COUNT_LIMIT rows and cache other counts, see
+# src.pagination.EstimatedCountPaginator
+ADMIN_EXACT_COUNT_LIMIT = getattr(settings, "ADMIN_EXACT_COUNT_LIMIT", 100_000)
+ADMIN_COUNT_CACHE_SECONDS = getattr(settings, "ADMIN_COUNT_CACHE_SECONDS", 60)
+
+# Built by manage.py build_schema and served by SchemaView
+SCHEMA_PATH = getattr(settings, "SCHEMA_PATH", BASE_DIR / "schema.yml")
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "dr_ikramov",
     "DESCRIPTION": "Dental clinic web-site backend",
@@ -149,6 +217,8 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timezone.timedelta(hours=1),
     "REFRESH_TOKEN_LIFETIME": timezone.timedelta(days=1),
     "TOKEN_OBTAIN_SERIALIZER": "src.serializers.CustomTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "src.serializers.CustomTokenRefreshSerializer",
+    "AUTH_TOKEN_CLASSES": ("core.revocation.RevocableAccessToken",),
 }
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -218,6 +288,31 @@ MEDIA_URL = "media/"
 STATIC_ROOT = BASE_DIR / "static"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# collectstatic names files by their content and writes .gz and .br copies
+# of text files, see core.storage
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG
+            else "core.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
+# Media and static files are checked by Django and sent by the front proxy:
+# "x-accel" for nginx, with internal locations aliasing MEDIA_ROOT and
+# STATIC_ROOT at the prefixes below, "x-sendfile" for Apache or lighttpd,
+# empty to send them from Django. With "x-accel", nginx picks the .gz and
+# .br copies itself with gzip_static and brotli_static.
+FILE_TRANSFER = getattr(settings, "FILE_TRANSFER", "")
+MEDIA_ACCEL_PREFIX = getattr(settings, "MEDIA_ACCEL_PREFIX", "/protected/media/")
+STATIC_ACCEL_PREFIX = getattr(settings, "STATIC_ACCEL_PREFIX", "/protected/static/")
+# Uploads are never overwritten, and hashed static names never change
+MEDIA_CACHE_SECONDS = getattr(settings, "MEDIA_CACHE_SECONDS", 60 * 60 * 24)
+STATIC_CACHE_SECONDS = 60 * 60 * 24 * 365
+
 FILE_UPLOAD_TEMP_DIR = BASE_DIR
 
 # Default primary key field type
@@ -227,14 +322,81 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # SMS code verify
 VERIFY_CODE_MINUTES = getattr(settings, "VERIFY_CODE_MINUTES", 5)
+OTP_RESEND_SECONDS = getattr(settings, "OTP_RESEND_SECONDS", 60)
+OTP_MAX_ATTEMPTS = getattr(settings, "OTP_MAX_ATTEMPTS", 5)
 
 # REDIS related settings
 REDIS_HOST = getattr(settings, "REDIS_HOST", "127.0.0.1")
 REDIS_PORT = getattr(settings, "REDIS_PORT", "6379")
 CELERY_BROKER_URL = "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/0"
-# BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
+# Tasks queued from a request fail at once while the broker is down, instead
+# of retrying for seconds, and callers fall back on their own
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "max_retries": 0,
+    "socket_connect_timeout": getattr(settings, "CELERY_BROKER_CONNECT_TIMEOUT", 0.5),
+}
 CELERY_RESULT_BACKEND = "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/0"
 
+# Token buckets of core.throttling, shared by all workers. Empty turns
+# throttling off, and while Redis is unreachable requests are let through
+# for THROTTLE_REDIS_RETRY seconds.
+THROTTLE_REDIS_URL = getattr(
+    settings, "THROTTLE_REDIS_URL", "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/1"
+)
+THROTTLE_REDIS_TIMEOUT = getattr(settings, "THROTTLE_REDIS_TIMEOUT", 0.25)
+THROTTLE_REDIS_RETRY = getattr(settings, "THROTTLE_REDIS_RETRY", 5)
+# Client addresses that are never throttled, like a load_benchmark host
+THROTTLE_EXEMPT_ADDRESSES = getattr(settings, "THROTTLE_EXEMPT_ADDRESSES", [])
+
+# SMS codes of src.management.services.otp live in Redis, so any worker
+# can check a code another one sent
+OTP_REDIS_URL = getattr(
+    settings, "OTP_REDIS_URL", "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/2"
+)
+# Tokens revoked on logout, see core.revocation. Empty turns revocation off.
+REVOKED_TOKENS_REDIS_URL = getattr(
+    settings,
+    "REVOKED_TOKENS_REDIS_URL",
+    "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/3",
+)
+REVOKED_TOKENS_REDIS_TIMEOUT = getattr(settings, "REVOKED_TOKENS_REDIS_TIMEOUT", 0.25)
+REVOKED_TOKENS_SYNC_SECONDS = getattr(settings, "REVOKED_TOKENS_SYNC_SECONDS", 5)
+REVOKED_TOKENS_MIN_CAPACITY = 1024
+REVOKED_TOKENS_ERROR_RATE = 0.001
+# Appointment and payment events of src.treatment.events, pushed to the
+# /events/ stream. Empty turns publishing off.
+EVENTS_REDIS_URL = getattr(
+    settings, "EVENTS_REDIS_URL", "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/4"
+)
+EVENTS_REDIS_TIMEOUT = getattr(settings, "EVENTS_REDIS_TIMEOUT", 0.25)
+EVENTS_REDIS_RETRY = getattr(settings, "EVENTS_REDIS_RETRY", 5)
+EVENTS_HEARTBEAT_SECONDS = getattr(settings, "EVENTS_HEARTBEAT_SECONDS", 15)
+EVENTS_RETRY_MILLISECONDS = getattr(settings, "EVENTS_RETRY_MILLISECONDS", 3000)
+# Read-your-writes pins of token clients, see core.middleware, shared by
+# all workers. While Redis is unreachable token clients read from the
+# primary for REPLICA_PIN_REDIS_RETRY seconds.
+REPLICA_PIN_REDIS_URL = getattr(
+    settings, "REPLICA_PIN_REDIS_URL", "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/5"
+)
+REPLICA_PIN_REDIS_TIMEOUT = getattr(settings, "REPLICA_PIN_REDIS_TIMEOUT", 0.25)
+REPLICA_PIN_REDIS_RETRY = getattr(settings, "REPLICA_PIN_REDIS_RETRY", 5)
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "otp": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": OTP_REDIS_URL,
+    },
+    "replica_pin": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REPLICA_PIN_REDIS_URL,
+        "OPTIONS": {
+            "socket_timeout": REPLICA_PIN_REDIS_TIMEOUT,
+            "socket_connect_timeout": REPLICA_PIN_REDIS_TIMEOUT,
+        },
+    },
+}
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
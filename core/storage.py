@@ -0,0 +1,57 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _gzip(content):
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def _brotli(content):
+    return brotli.compress(content)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes ``.gz`` and, with brotli installed,
+    ``.br`` copies of the text files, so they are compressed once by
+    collectstatic instead of on every request.
+    """
+
+    compressible = (".css", ".js", ".mjs", ".map", ".svg", ".json", ".txt", ".html")
+    # Smaller files are not worth a second request path
+    min_size = 256
+
+    @property
+    def encodings(self):
+        encodings = {".gz": _gzip}
+        if brotli is not None:
+            encodings[".br"] = _brotli
+        return encodings
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if name.endswith(self.compressible):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < self.min_size:
+            return
+        for extension, compress in self.encodings.items():
+            if self.exists(name + extension):
+                # Hashed names change with the content, the copy is current
+                continue
+            compressed = compress(content)
+            if len(compressed) < len(content):
+                self._save(name + extension, ContentFile(compressed))
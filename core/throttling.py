@@ -0,0 +1,159 @@
+import logging
+import math
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket, ARGV capacity, refill rate in tokens per second, cost.
+# Returns whether the request is allowed and the seconds until it would be.
+# The clock is the Redis server's, so every worker and node agrees on it.
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+# Requests are let through without throttling until then, after Redis failed
+_redis_down_until = 0
+
+
+@lru_cache(maxsize=None)
+def get_token_bucket():
+    """Token bucket script on the throttling Redis, one client per process"""
+    client = redis.Redis.from_url(
+        settings.THROTTLE_REDIS_URL,
+        socket_timeout=settings.THROTTLE_REDIS_TIMEOUT,
+        socket_connect_timeout=settings.THROTTLE_REDIS_TIMEOUT,
+    )
+    return client.register_script(TOKEN_BUCKET)
+
+
+def take_tokens(key, capacity, rate, cost=1):
+    """
+    Take ``cost`` tokens from a bucket refilled with ``rate`` tokens per
+    second up to ``capacity``. Returns whether they were taken and the
+    seconds to wait otherwise. Fails open while Redis is unreachable.
+    """
+    global _redis_down_until
+    if not settings.THROTTLE_REDIS_URL or time.monotonic() < _redis_down_until:
+        return True, 0
+
+    try:
+        allowed, wait = get_token_bucket()(keys=[key], args=[capacity, rate, cost])
+    except redis.RedisError as e:
+        _redis_down_until = time.monotonic() + settings.THROTTLE_REDIS_RETRY
+        logger.warning("Throttling is off for %ss: %s", settings.THROTTLE_REDIS_RETRY, e)
+        return True, 0
+    return bool(allowed), float(wait)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Throttle with a token bucket in Redis shared by all workers. The rate
+    of ``scope`` in ``DEFAULT_THROTTLE_RATES`` is both the burst size and
+    how fast the bucket refills, so "10/min" allows 10 requests at once and
+    one more every 6 seconds. Clients in ``THROTTLE_EXEMPT_ADDRESSES`` are
+    let through.
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def get_cost(self, request, view):
+        """Tokens the request takes from the bucket"""
+        return 1
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if self.rate is None:
+            return True
+        if self.get_ident(request) in settings.THROTTLE_EXEMPT_ADDRESSES:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        cost = min(self.get_cost(request, view), self.num_requests)
+        allowed, wait = take_tokens(
+            key, self.num_requests, self.num_requests / self.duration, cost
+        )
+        if not allowed:
+            self.wait_seconds = wait
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """Limits token requests per client address, each one hashes a password"""
+
+    scope = "login"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident(request)}
+
+
+class PublicWriteThrottle(TokenBucketThrottle):
+    """Limits writes to endpoints open to anonymous clients"""
+
+    scope = "public_write"
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        return super().allow_request(request, view)
+
+
+class HeavyReadThrottle(TokenBucketThrottle):
+    """
+    Limits expensive reports queries. A date range takes one token per
+    started month, so long spans drain the bucket faster.
+    """
+
+    scope = "heavy_read"
+
+    def get_cost(self, request, view):
+        try:
+            start_date = parse_date(request.query_params.get("start_date", ""))
+            end_date = parse_date(request.query_params.get("end_date", ""))
+        except ValueError:
+            return 1
+        if start_date is None or end_date is None or start_date > end_date:
+            return 1
+        return math.ceil(((end_date - start_date).days + 1) / 31)
@@ -1,45 +1,59 @@
 from django.conf import settings
 from django.urls import path, include
 from django.contrib import admin
-from django.conf.urls.static import static
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularRedocView,
-    SpectacularSwaggerView,
-)
-
+from core.throttling import LoginThrottle
+from src.treatment.views import EventStreamView
 from src.urls import router
-from src.views import LogoutView
+from src.views import LogoutView, MediaView, SchemaView, StaticView
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path(
+        "api/token/",
+        TokenObtainPairView.as_view(throttle_classes=[LoginThrottle]),
+        name="token_obtain_pair",
+    ),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api-auth/logout/", LogoutView.as_view(), name="logout"),
     path("api-auth/", include("rest_framework.urls")),
+    path("api/schema/", SchemaView.as_view(), name="schema"),
+    path("events/", EventStreamView.as_view(), name="events"),
+    path(
+        f"{settings.MEDIA_URL.lstrip('/')}<path:path>",
+        MediaView.as_view(),
+        name="media",
+    ),
+    path(
+        f"{settings.STATIC_URL.lstrip('/')}<path:path>",
+        StaticView.as_view(),
+        name="static",
+    ),
     path("", include(router.urls)),
 ]
 
 if settings.DEBUG:
     import debug_toolbar
+    from drf_spectacular.views import (
+        SpectacularAPIView,
+        SpectacularRedocView,
+        SpectacularSwaggerView,
+    )
 
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += [
         path("__debug__/", include(debug_toolbar.urls)),
-        path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+        path("api/schema/live/", SpectacularAPIView.as_view(), name="schema-live"),
         path(
             "api/schema/swagger-ui/",
-            SpectacularSwaggerView.as_view(url_name="schema"),
+            SpectacularSwaggerView.as_view(url_name="schema-live"),
             name="swagger-ui",
         ),
         path(
             "api/schema/redoc/",
-            SpectacularRedocView.as_view(url_name="schema"),
+            SpectacularRedocView.as_view(url_name="schema-live"),
             name="redoc",
         ),
     ]  # noqa
@@ -1,5 +1,16 @@
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404, HttpResponse
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from src.serializers import compile_serializer, expand_serializer
+
 
 class MultiSerializerMixin(GenericViewSet):
     """
@@ -12,3 +23,157 @@ class MultiSerializerMixin(GenericViewSet):
         return self.serializer_action_classes.get(
             self.action, super().get_serializer_class()
         )
+
+
+class CompiledSerializerMixin(GenericViewSet):
+    """
+    Mixin that serializes read actions with compiled serializers, while
+    schema generation and writes keep using the regular serializer classes
+    """
+
+    compiled_actions = ("list", "retrieve")
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.action in self.compiled_actions:
+            compiled_class = compile_serializer(self.get_serializer_class())
+            return compiled_class(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ExpandMixin(GenericViewSet):
+    """
+    Mixin that reads ``?expand=profits,service`` on read actions and nests
+    only those ``expandable_fields`` of the serializer. Without the query
+    param every expandable field is nested.
+    """
+
+    expand_actions = ("list", "retrieve")
+
+    def get_expand(self):
+        """Return the fields to expand, or None when the action does not expand"""
+        request = getattr(self, "request", None)
+        if request is None or self.action not in self.expand_actions:
+            return None
+
+        expandable = super().get_serializer_class().expandable_fields
+        value = request.query_params.get("expand")
+        if value is None:
+            return frozenset(expandable)
+
+        expand = frozenset(name.strip() for name in value.split(",") if name.strip())
+        unknown = expand - set(expandable)
+        if unknown:
+            raise ValidationError(
+                {"expand": f"Unknown fields: {', '.join(sorted(unknown))}."}
+            )
+        return expand
+
+    def get_serializer_class(self):
+        serializer_class = super().get_serializer_class()
+        expand = self.get_expand()
+        if expand is None:
+            return serializer_class
+        return expand_serializer(serializer_class, expand)
+
+
+class AsyncReadMixin(GenericViewSet):
+    """
+    Mixin that serves anonymous JSON ``list`` and ``retrieve`` requests with
+    the async ORM when ``ASYNC_READ_VIEWS`` is on, as it is under ASGI.
+    Every other request runs the regular sync view in a thread.
+    """
+
+    async_actions = ("list", "retrieve")
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_READ_VIEWS or actions.get("get") not in cls.async_actions:
+            return view
+
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method == "GET" and "Authorization" not in request.headers:
+                user = await request.auser()
+                if not user.is_authenticated:
+                    request.user = user
+                    self = cls(**initkwargs)
+                    self.action_map = actions
+                    response = await self.async_dispatch(request, *args, **kwargs)
+                    if response is not None:
+                        return response
+            return await sync_view(request, *args, **kwargs)
+
+        # Keep cls, actions and csrf_exempt for the router and schema generation
+        return update_wrapper(async_view, view)
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """
+        Same as ``dispatch()`` for the async actions. Returns None when the
+        request asks for a non JSON renderer, so the sync view handles it.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.accepted_renderer.format != "json":
+                return None
+            if self.action == "list":
+                response = await self.alist(request)
+            else:
+                response = await self.aretrieve(request)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        response = self.finalize_response(request, response, *args, **kwargs)
+        # Render here, Django would render a template response in a thread
+        response.render()
+        return HttpResponse(
+            response.content,
+            status=response.status_code,
+            headers=dict(response.items()),
+        )
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (
+            queryset.model.DoesNotExist,
+            TypeError,
+            ValueError,
+            DjangoValidationError,
+        ):
+            raise Http404(
+                f"No {queryset.model._meta.object_name} matches the given query."
+            )
+
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(
+            [obj async for obj in queryset.aiterator()], many=True
+        )
+        return Response(serializer.data)
+
+    async def aretrieve(self, request):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+
+from src.pagination import EstimatedCountPaginator
 from .models import (
     User,
     Admin,
@@ -30,8 +32,10 @@ class CustomUserAdmin(admin.ModelAdmin):
         ),
     )
     list_display = ("phone", "is_staff", "is_active")
-    search_fields = ("phone",)
+    search_fields = ("^phone",)
     ordering = ("phone",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Admin)
@@ -42,16 +46,22 @@ class AdminAdmin(admin.ModelAdmin):
 
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
-    list_display = ("id", "phone", "rating", "is_published")
-    search_fields = ("phone", "specialties__name_en")
+    list_display = ("id", "phone", "first_name", "last_name", "rating", "is_published")
+    # Searching specialties joins them and makes the list DISTINCT
+    search_fields = ("^phone", "last_name")
     list_filter = ("is_published", "specialties")
     filter_horizontal = ("specialties",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
-    list_display = ("id", "phone")
-    search_fields = ("phone",)
+    list_display = ("id", "phone", "first_name", "last_name")
+    search_fields = ("^phone", "last_name")
+    ordering = ("-id",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Specialty)
@@ -84,5 +94,9 @@ class InitialRecordAdmin(admin.ModelAdmin):
 @admin.register(Rating)
 class RatingAdmin(admin.ModelAdmin):
     list_display = ("id", "first_name", "last_name", "doctor", "rate", "created_at")
-    search_fields = ("first_name", "last_name", "doctor__phone")
-    list_filter = ("rate", "doctor")
+    list_select_related = ("doctor",)
+    search_fields = ("first_name", "last_name", "^doctor__phone")
+    list_filter = ("rate",)
+    autocomplete_fields = ("doctor",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ManagementConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "src.management"
+
+    def ready(self):
+        # Registers the tasks with workers, which do not load the views
+        from .services import tasks  # noqa: F401
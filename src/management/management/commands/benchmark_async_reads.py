@@ -0,0 +1,98 @@
+import asyncio
+import time
+from types import ModuleType
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from rest_framework.routers import DefaultRouter
+
+from src.management.models import Doctor, Service
+from src.management.views import DoctorViewSet, ServiceViewSet, SpecialtyViewSet
+from src.treatment.management.commands.load_benchmark import percentile
+
+
+def catalog_urlconf(async_views):
+    """Build a urlconf with the catalog viewsets in sync or async mode"""
+    with override_settings(ASYNC_READ_VIEWS=async_views):
+        router = DefaultRouter()
+        router.register(r"doctors", DoctorViewSet, basename="doctor")
+        router.register(r"specialties", SpecialtyViewSet)
+        router.register(r"services", ServiceViewSet)
+        urlconf = ModuleType(f"catalog_urls_{async_views}")
+        urlconf.urlpatterns = router.urls
+        return urlconf
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and async catalog read views under concurrent "
+        "anonymous load through the ASGI handler, and check both return the "
+        "same payloads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+
+    def handle(self, *args, **options):
+        doctor = Doctor.objects.filter(is_published=True).first()
+        service = Service.objects.first()
+        if doctor is None or service is None:
+            raise CommandError("No published doctors or services found.")
+
+        paths = [
+            "/doctors/",
+            f"/doctors/{doctor.pk}/",
+            "/services/",
+            f"/services/{service.slug}/",
+            "/specialties/",
+        ]
+        calls = [paths[i % len(paths)] for i in range(options["requests"])]
+        modes = {"sync": catalog_urlconf(False), "async": catalog_urlconf(True)}
+
+        payloads = {}
+        for name, urlconf in modes.items():
+            with override_settings(ROOT_URLCONF=urlconf):
+                payloads[name] = asyncio.run(self.fetch(paths))
+        if payloads["sync"] != payloads["async"]:
+            raise CommandError("Async views return different payloads")
+
+        for name, urlconf in modes.items():
+            with override_settings(ROOT_URLCONF=urlconf):
+                result = asyncio.run(self.run(calls, options["concurrency"]))
+            self.stdout.write(
+                f"{name:<6} {result['throughput']:>9.2f} req/s  "
+                f"p50 {result['p50']:>8.2f} ms  p95 {result['p95']:>8.2f} ms  "
+                f"p99 {result['p99']:>8.2f} ms  errors {result['errors']}"
+            )
+
+    async def fetch(self, paths):
+        client = AsyncClient()
+        payloads = []
+        for path in paths:
+            response = await client.get(path)
+            payloads.append((response.status_code, response.content))
+        return payloads
+
+    async def run(self, calls, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(path):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(call(path) for path in calls))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency * 1000 for latency, _ in samples]
+        return {
+            "errors": sum(1 for _, status in samples if status >= 400),
+            "throughput": round(len(samples) / elapsed, 2),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+        }
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiYamlRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema served by SchemaView. Run it at build "
+        "time, so workers never introspect the API themselves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file", help="Where to write the schema, defaults to SCHEMA_PATH"
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail if the file is missing or differs instead of writing it",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["file"] or settings.SCHEMA_PATH)
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_SCHEMA_CLASS": settings.SCHEMA_CLASS,
+        }
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            schema = SchemaGenerator().get_schema(request=None, public=True)
+        content = OpenApiYamlRenderer().render(schema, renderer_context={})
+
+        if options["check"]:
+            if not path.exists() or path.read_bytes() != content:
+                raise CommandError(f"{path} is out of date, run build_schema.")
+            self.stdout.write(f"{path} is up to date")
+            return
+
+        path.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f"Schema written to {path}"))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from src.management.services.patient_import import PatientImporter, PatientImportError
+
+
+class Command(BaseCommand):
+    help = (
+        "Import patients from a CSV or XLSX file with phone, first_name, "
+        "last_name, middle_name, birth_date and address columns"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--hash-passwords",
+            action="store_true",
+            help="Hash the default dr-<last name> passwords now, not on first login",
+        )
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        importer = PatientImporter(
+            chunk_size=options["chunk_size"],
+            hash_passwords=options["hash_passwords"],
+            workers=options["workers"],
+            progress=self.progress,
+        )
+        try:
+            with open(options["path"], "rb") as file:
+                report = importer.run(file, options["path"])
+        except (OSError, PatientImportError) as e:
+            raise CommandError(e)
+
+        for error in report["errors"]:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['created']} of {report['rows']} rows, "
+                f"{len(report['errors'])} with errors"
+            )
+        )
+
+    def progress(self, report):
+        self.stdout.write(
+            f"{report['rows']} rows read, {report['created']} patients created, "
+            f"{len(report['errors'])} errors"
+        )
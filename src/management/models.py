@@ -1,13 +1,19 @@
+import logging
 from datetime import date
+from functools import partial
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser
 
+from kombu.exceptions import OperationalError
 from solo.models import SingletonModel
 from imagekit import models as ik_models, processors as ik_processors
 
@@ -15,11 +21,28 @@ from .choices import UserTypeChoices, CategoryChoices, RateChoices
 from .managers import UserManager
 
 
+logger = logging.getLogger(__name__)
+
+
+def _schedule_default_password(user_id):
+    from .services.tasks import hash_default_password
+
+    try:
+        hash_default_password.apply_async(args=[user_id], retry=False)
+    except OperationalError as e:
+        # Hashed on first login instead
+        logger.warning("Default password of user %s not queued: %s", user_id, e)
+
+
 class User(AbstractUser):
     """Main user"""
 
+    # Indexed for the access check of src.views.MediaView
     avatar = models.ImageField(
-        verbose_name=_("Avatar"), upload_to="avatars/", default=settings.NO_AVATAR
+        verbose_name=_("Avatar"),
+        upload_to="avatars/",
+        default=settings.NO_AVATAR,
+        db_index=True,
     )
     phone = models.CharField(verbose_name=_("Phone Number"), max_length=15, unique=True)
 
@@ -36,6 +59,10 @@ class User(AbstractUser):
     user_type = models.CharField(
         verbose_name=_("User type"), max_length=10, choices=UserTypeChoices.choices
     )
+    # Created without a password, and dr-<last name> is not hashed yet
+    default_password_pending = models.BooleanField(
+        verbose_name=_("Default password pending"), default=False, editable=False
+    )
 
     email = None
     groups = None
@@ -49,18 +76,56 @@ class User(AbstractUser):
         db_table = "user"
         verbose_name = _("User")
         verbose_name_plural = _("Users")
+        indexes = [
+            # Change feed keyset of doctors and patients
+            models.Index(fields=["updated_at", "id"], name="user_updated_at_id"),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
     def save(self, *args, **kwargs):
         if not self.password:
-            password = f"dr-{self.last_name}"
-            self.set_password(password)
+            # Hashing is the slowest step of creating a user, so the default
+            # password is hashed by a task or on first login instead
+            self.set_unusable_password()
+            self.default_password_pending = True
 
         self.user_type = self.get_user_type()
         self.username = self.phone
+        created = self._state.adding
         super().save(*args, **kwargs)
+        if created and self.default_password_pending:
+            transaction.on_commit(partial(_schedule_default_password, self.pk))
+
+    @property
+    def default_password(self):
+        return f"dr-{self.last_name}"
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.default_password_pending = False
+
+    def check_password(self, raw_password):
+        if not self.default_password_pending:
+            return super().check_password(raw_password)
+        if not constant_time_compare(raw_password, self.default_password):
+            # Takes as long as a wrong password of any other user
+            make_password(raw_password)
+            return False
+        self.hash_default_password()
+        return True
+
+    def hash_default_password(self):
+        """Store the hash of the default password, unless one was set since"""
+        password = make_password(self.default_password)
+        updated_at = timezone.now()
+        User.objects.filter(pk=self.pk, default_password_pending=True).update(
+            password=password, default_password_pending=False, updated_at=updated_at
+        )
+        self.password = password
+        self.default_password_pending = False
+        self.updated_at = updated_at
 
     def get_user_type(self):
         if isinstance(self, Doctor):
@@ -238,6 +303,10 @@ class Service(models.Model):
     class Meta:
         verbose_name = _("Service")
         verbose_name_plural = _("Services")
+        indexes = [
+            # Change feed keyset
+            models.Index(fields=["updated_at", "id"], name="service_updated_at_id"),
+        ]
 
     def __str__(self) -> str:
         return self.name_en
@@ -1,4 +1,6 @@
 # repositories.py
+from django.utils import timezone
+
 from .models import User, Doctor, Patient, Specialty, Service, InitialRecord, Rating
 
 
@@ -15,6 +17,14 @@ class UserRepository:
     def signup(**data):
         return User.objects.create(**data)
 
+    @staticmethod
+    def activate(phone):
+        # update() does not touch auto_now fields
+        User.objects.filter(phone=phone, is_active=False).update(
+            is_active=True, updated_at=timezone.now()
+        )
+        return User.objects.get(phone=phone)
+
 
 class DoctorRepository:
     @staticmethod
@@ -10,11 +10,13 @@ from src.management.models import (
     InitialRecord,
     Rating,
 )
+from src.management.utils import normalize_phone
 
 
 class ProfileMeta:
     exclude = [
         "password",
+        "default_password_pending",
         "is_active",
         "is_staff",
         "is_superuser",
@@ -63,6 +65,37 @@ class VerifySerializer(serializers.Serializer):
     code = serializers.IntegerField()
 
 
+class ResetPasswordSerializer(PhoneSerializer):
+    """Reset password serializer, without a code it sends one"""
+
+    code = serializers.IntegerField(required=False)
+    new_password = serializers.CharField(write_only=True, required=False)
+
+    def validate(self, attrs):
+        if ("code" in attrs) != ("new_password" in attrs):
+            raise serializers.ValidationError(
+                "code and new_password must be sent together."
+            )
+        return attrs
+
+
+class SignupSerializer(serializers.ModelSerializer):
+    """Signup serializer, the patient stays inactive until verified"""
+
+    password = serializers.CharField(write_only=True)
+
+    class Meta:
+        model = Patient
+        fields = ["id", "phone", "first_name", "last_name", "middle_name", "password"]
+
+    def create(self, validated_data):
+        password = validated_data.pop("password")
+        patient = Patient(**validated_data, is_active=False)
+        patient.set_password(password)
+        patient.save()
+        return patient
+
+
 class AdminSerializer(serializers.ModelSerializer):
     """Admin model serializer"""
 
@@ -98,6 +131,53 @@ class PatientSerializer(serializers.ModelSerializer):
         model = Patient
 
 
+class PatientImportSerializer(serializers.ModelSerializer):
+    """Row of a patient import file"""
+
+    # Uniqueness is checked per chunk by the importer
+    phone = serializers.CharField(max_length=32)
+
+    class Meta:
+        model = Patient
+        fields = [
+            "phone",
+            "first_name",
+            "last_name",
+            "middle_name",
+            "birth_date",
+            "address",
+        ]
+        extra_kwargs = {
+            "first_name": {"required": True},
+            "last_name": {"required": True},
+        }
+
+    def validate_phone(self, value):
+        phone = normalize_phone(value)
+        if phone is None:
+            raise serializers.ValidationError("Enter a valid phone number.")
+        return phone
+
+
+class PatientImportFileSerializer(serializers.Serializer):
+    """Patient import upload"""
+
+    file = serializers.FileField()
+    hash_passwords = serializers.BooleanField(
+        default=False,
+        help_text="Only false is accepted, hashing the passwords up front is "
+        "available through import_patients --hash-passwords.",
+    )
+
+    def validate_hash_passwords(self, value):
+        # Hashing every password up front would tie up a web worker
+        if value:
+            raise serializers.ValidationError(
+                "Use the import_patients command to hash passwords."
+            )
+        return value
+
+
 class MePatientSerializer(serializers.ModelSerializer):
     """ME patient model serializer"""
 
@@ -0,0 +1,82 @@
+import math
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+from kombu.exceptions import OperationalError
+
+from .tasks import send_verify_code
+
+
+class OTPService:
+    """
+    One-time SMS codes kept in the ``otp`` cache, which is Redis outside
+    tests. Only a hash of each code is stored, it expires after
+    ``VERIFY_CODE_MINUTES`` and is dropped after ``OTP_MAX_ATTEMPTS`` wrong
+    guesses, so checking a code never writes to the database.
+    """
+
+    SIGNUP = "signup"
+    RESET_PASSWORD = "reset_password"
+
+    @staticmethod
+    def _key(purpose, phone):
+        return f"otp:{purpose}:{phone}"
+
+    @staticmethod
+    def _hash(purpose, phone, code):
+        return salted_hmac(f"otp:{purpose}", f"{phone}:{code}").hexdigest()
+
+    @staticmethod
+    def send(phone, purpose):
+        """
+        Send a new code to ``phone``. Returns 0, or the seconds left to wait
+        when a code was sent less than ``OTP_RESEND_SECONDS`` ago.
+        """
+        cache = caches["otp"]
+        key = OTPService._key(purpose, phone)
+        # The cooldown stores when it ends, the cache API can not read a TTL
+        resend_at = time.time() + settings.OTP_RESEND_SECONDS
+        if not cache.add(f"{key}:cooldown", resend_at, settings.OTP_RESEND_SECONDS):
+            resend_at = cache.get(f"{key}:cooldown", resend_at)
+            return max(1, math.ceil(resend_at - time.time()))
+
+        code = 100000 + secrets.randbelow(900000)
+        cache.set_many(
+            {key: OTPService._hash(purpose, phone, code), f"{key}:attempts": 0},
+            settings.VERIFY_CODE_MINUTES * 60,
+        )
+        try:
+            send_verify_code.apply_async(args=[phone, code], retry=False)
+        except OperationalError:
+            # Nothing was sent, so the client may ask again right away
+            cache.delete_many([key, f"{key}:attempts", f"{key}:cooldown"])
+            raise
+        return 0
+
+    @staticmethod
+    def check(phone, purpose, code):
+        """Return whether ``code`` is the last one sent, using it up if so"""
+        cache = caches["otp"]
+        key = OTPService._key(purpose, phone)
+        try:
+            attempts = cache.incr(f"{key}:attempts")
+        except ValueError:
+            return False  # Expired or never sent
+
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            cache.delete_many([key, f"{key}:attempts"])
+            return False
+
+        stored = cache.get(key)
+        if stored is None or not constant_time_compare(
+            stored, OTPService._hash(purpose, phone, code)
+        ):
+            return False
+
+        # Only the request that deletes the code may use it
+        used = cache.delete(key)
+        cache.delete(f"{key}:attempts")
+        return used
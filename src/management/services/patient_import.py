@@ -0,0 +1,187 @@
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from zipfile import BadZipFile
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from ..models import Patient, User
+from ..serializers import PatientImportSerializer
+
+try:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+except ImportError:
+    openpyxl = None
+
+
+class PatientImportError(Exception):
+    pass
+
+
+def read_csv(file):
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    try:
+        for row in reader:
+            yield {key.strip().lower(): value for key, value in row.items() if key}
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise PatientImportError(
+            f"Could not read the CSV file after line {reader.line_num}: {e}"
+        )
+
+
+def read_xlsx(file):
+    if openpyxl is None:
+        raise PatientImportError("Importing XLSX files needs openpyxl.")
+    # Read-only workbooks are parsed row by row instead of loaded whole
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, KeyError) as e:
+        raise PatientImportError(f"Not a valid XLSX file: {e}")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or "").strip().lower() for cell in next(rows, ())]
+        for values in rows:
+            yield {key: cell for key, cell in zip(header, values) if key}
+    finally:
+        workbook.close()
+
+
+def clean_cell(value):
+    """Cell as the serializer expects it, None when empty"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, float) and value.is_integer():
+        # Phone numbers typed into a spreadsheet
+        value = int(value)
+    if isinstance(value, int):
+        value = str(value)
+    if isinstance(value, str):
+        value = value.strip()
+    return value if value not in ("", None) else None
+
+
+def default_password(last_name):
+    """``User.save()``'s initial password, hashed"""
+    return make_password(f"dr-{last_name}")
+
+
+class PatientImporter:
+    """
+    Import patients from a CSV or XLSX file without loading it whole. Rows
+    are validated, deduplicated by normalized phone within the file and
+    against existing users, and inserted ``chunk_size`` at a time with one
+    transaction per chunk. Default passwords are hashed on first login, or
+    up front in a process pool when ``hash_passwords`` is set.
+    """
+
+    readers = {".csv": read_csv, ".xlsx": read_xlsx}
+
+    def __init__(
+        self, chunk_size=1000, hash_passwords=False, workers=None, progress=None
+    ):
+        self.chunk_size = chunk_size
+        self.hash_passwords = hash_passwords
+        self.workers = workers
+        self.progress = progress
+        self.report = {"rows": 0, "created": 0, "errors": []}
+
+    def get_reader(self, name):
+        for extension, reader in self.readers.items():
+            if name.lower().endswith(extension):
+                return reader
+        raise PatientImportError("Upload a .csv or .xlsx file.")
+
+    def run(self, file, name):
+        """Import the file and return the rows read, patients created and errors"""
+        reader = self.get_reader(name)
+        # Header is line 1
+        rows = enumerate(reader(file), start=2)
+        seen = {}
+        pool = None
+        if self.hash_passwords:
+            pool = ProcessPoolExecutor(self.workers, initializer=django.setup)
+        try:
+            while chunk := list(islice(rows, self.chunk_size)):
+                valid = self.validate(chunk, seen)
+                self.insert(valid, pool)
+                self.report["rows"] += len(chunk)
+                if self.progress is not None:
+                    self.progress(self.report)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return self.report
+
+    def error(self, line, errors):
+        self.report["errors"].append({"row": line, "errors": errors})
+
+    def validate(self, chunk, seen):
+        valid = []
+        for line, row in chunk:
+            data = {key: clean_cell(value) for key, value in row.items()}
+            serializer = PatientImportSerializer(
+                data={key: value for key, value in data.items() if value is not None}
+            )
+            if not serializer.is_valid():
+                self.error(line, serializer.errors)
+                continue
+            phone = serializer.validated_data["phone"]
+            if phone in seen:
+                self.error(line, {"phone": [f"Duplicate of row {seen[phone]}."]})
+                continue
+            seen[phone] = line
+            valid.append((line, serializer.validated_data))
+
+        existing = set(
+            User.objects.filter(phone__in=[data["phone"] for _, data in valid])
+            .values_list("phone", flat=True)
+        )
+        for line, data in valid:
+            if data["phone"] in existing:
+                self.error(line, {"phone": ["A user with this phone already exists."]})
+        return [data for _, data in valid if data["phone"] not in existing]
+
+    def insert(self, rows, pool):
+        if not rows:
+            return
+        if pool is None:
+            # Hashed on first login, like users saved without a password
+            passwords = [make_password(None) for _ in rows]
+        else:
+            passwords = pool.map(
+                default_password, [data["last_name"] for data in rows], chunksize=64
+            )
+
+        users = [
+            User(
+                phone=data["phone"],
+                username=data["phone"],
+                password=password,
+                user_type="PATIENT",
+                default_password_pending=pool is None,
+                **{
+                    field: value
+                    for field, value in data.items()
+                    if field not in ("phone", "address")
+                },
+            )
+            for data, password in zip(rows, passwords)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            # bulk_create() does not support multi-table inheritance, so
+            # the patient rows are inserted next to their users
+            table = connection.ops.quote_name(Patient._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} ("
+                    f"{connection.ops.quote_name('user_ptr_id')}, "
+                    f"{connection.ops.quote_name('address')}) VALUES (%s, %s)",
+                    [(user.pk, data.get("address")) for user, data in zip(users, rows)],
+                )
+        self.report["created"] += len(users)
@@ -1,5 +1,6 @@
 from core.celery import app
 from src.utils.helpers import send_sms
+from ..models import User
 
 
 @app.task
@@ -21,3 +22,11 @@ def send_verify_code(phone_number, code):
         Ваш код подтверждения: {code}
     """
     return send_sms(phone_number, text)
+
+
+@app.task(ignore_result=True)
+def hash_default_password(user_id):
+    """Hash the default password of a user created without one"""
+    user = User.objects.filter(pk=user_id, default_password_pending=True).first()
+    if user is not None:
+        user.hash_default_password()
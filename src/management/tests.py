@@ -1,3 +1,555 @@
-from django.test import TestCase
+import asyncio
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+
+from kombu.exceptions import OperationalError
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from core.celery import app as celery_app
+from src.testing import FAST_PASSWORD_HASHERS, QueryBudgetMixin, seed_dataset
+from .management.commands.benchmark_async_reads import catalog_urlconf
+from .models import Admin, Patient, User
+from .services.otp import OTPService
+from .services.patient_import import PatientImporter, PatientImportError, openpyxl
+from .services.tasks import hash_default_password
+from .urls import router
+from .views import DoctorViewSet
+
+# SMS codes in process memory and no throttling, as there is no Redis here
+LOCAL_OTP = override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "otp": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    THROTTLE_REDIS_URL="",
+)
+
+
+class ManagementQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """Query budgets for the management endpoints"""
+
+    router = router
+    query_budgets = {
+        "user-list": 3,
+        "user-detail": 2,
+        "user-me": 1,
+        "user-change-avatar": 3,
+        # The first check hashes the seeded admin's default password
+        "user-change-password": 4,
+        # Savepoint around the patient and its verification code
+        "user-signup": 6,
+        "user-verify": 3,
+        "user-regenerate-verify-code": 2,
+        "user-reset-password": 2,
+        "admin-list": 2,
+        "admin-detail": 2,
+        "doctor-list": 4,
+        "doctor-detail": 3,
+        "patient-list": 3,
+        "patient-detail": 2,
+        "patient-import-patients": 6,
+        "specialty-list": 3,
+        "specialty-detail": 2,
+        "service-list": 3,
+        "service-detail": 2,
+        "initialrecord-list": 3,
+        "initialrecord-detail": 2,
+        "rating-list": 3,
+        "rating-detail": 2,
+    }
+
+    def test_user_endpoints(self):
+        self.assertListBudget("user-list")
+        self.assertQueryBudget("user-detail", kwargs={"pk": self.data["doctors"][0].pk})
+        self.assertQueryBudget("user-me")
+
+    def test_user_change_password(self):
+        self.assertQueryBudget(
+            "user-change-password",
+            "post",
+            data={
+                "password": "dr-",
+                "new_password": "new-password",
+                "confirm_password": "new-password",
+            },
+        )
+
+    @LOCAL_OTP
+    @mock.patch("src.management.services.otp.send_verify_code")
+    def test_user_otp(self, send_verify_code):
+        self.addCleanup(caches["otp"].clear)
+        phone = "+998901112233"
+        data = {"phone": phone, "first_name": "New", "last_name": "Patient"}
+        self.assertQueryBudget(
+            "user-signup",
+            "post",
+            data={**data, "password": "secret"},
+            status_code=201,
+        )
+        code = send_verify_code.apply_async.call_args.kwargs["args"][1]
+        self.assertQueryBudget(
+            "user-verify", "post", data={"phone": phone, "code": code}
+        )
+        self.assertQueryBudget(
+            "user-regenerate-verify-code", "post", data={"phone": phone}
+        )
+        self.assertQueryBudget("user-reset-password", "post", data={"phone": phone})
+
+    def test_user_change_avatar(self):
+        image = BytesIO()
+        Image.new("RGB", (1, 1)).save(image, "PNG")
+        avatar = SimpleUploadedFile("avatar.png", image.getvalue(), "image/png")
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.assertQueryBudget(
+                    "user-change-avatar",
+                    "post",
+                    data={"avatar": avatar},
+                    format="multipart",
+                )
+
+    def test_admin_endpoints(self):
+        self.assertQueryBudget("admin-list")
+        self.assertQueryBudget("admin-detail", kwargs={"pk": self.data["admin"].pk})
+
+    def test_doctor_endpoints(self):
+        self.assertListBudget("doctor-list")
+        self.assertQueryBudget("doctor-detail", kwargs={"pk": self.data["doctors"][0].pk})
+
+    def test_doctor_endpoints_anonymous(self):
+        self.client.credentials()
+        self.assertListBudget("doctor-list")
+        self.assertQueryBudget("doctor-detail", kwargs={"pk": self.data["doctors"][0].pk})
+
+    def test_patient_endpoints(self):
+        self.assertListBudget("patient-list")
+        self.assertQueryBudget(
+            "patient-detail", kwargs={"pk": self.data["patients"][0].pk}
+        )
+        file = SimpleUploadedFile(
+            "patients.csv",
+            b"phone,first_name,last_name\n"
+            b"+998901110001,A,One\n+998901110002,B,Two\n+998901110003,C,Three\n",
+        )
+        self.assertQueryBudget(
+            "patient-import-patients", "post", data={"file": file}, format="multipart"
+        )
+
+    def test_specialty_endpoints(self):
+        self.assertListBudget("specialty-list")
+        self.assertQueryBudget(
+            "specialty-detail", kwargs={"pk": self.data["specialties"][0].pk}
+        )
+
+    def test_service_endpoints(self):
+        self.assertListBudget("service-list")
+        self.assertQueryBudget(
+            "service-detail", kwargs={"slug": self.data["services"][0].slug}
+        )
+
+    def test_initial_record_endpoints(self):
+        self.assertListBudget("initialrecord-list")
+        self.assertQueryBudget(
+            "initialrecord-detail", kwargs={"pk": self.data["initial_records"][0].pk}
+        )
+
+    def test_rating_endpoints(self):
+        self.assertListBudget("rating-list")
+        self.assertQueryBudget("rating-detail", kwargs={"pk": self.data["ratings"][0].pk})
+
+
+@LOCAL_OTP
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class OTPTests(APITestCase):
+    """Signup and password reset are confirmed by SMS codes kept in the cache"""
+
+    phone = "+998901112233"
+
+    def setUp(self):
+        patcher = mock.patch("src.management.services.otp.send_verify_code")
+        self.send_verify_code = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(caches["otp"].clear)
+
+    def last_code(self):
+        return self.send_verify_code.apply_async.call_args.kwargs["args"][1]
+
+    def post(self, name, **data):
+        return self.client.post(reverse(name), data, format="json")
+
+    def login(self, password):
+        return self.post("token_obtain_pair", phone=self.phone, password=password)
+
+    def signup(self):
+        return self.post(
+            "user-signup",
+            phone=self.phone,
+            first_name="New",
+            last_name="Patient",
+            password="secret",
+        )
+
+    def test_signup_and_verify(self):
+        self.assertEqual(self.signup().status_code, 201)
+        self.assertFalse(Patient.objects.get(phone=self.phone).is_active)
+        self.assertEqual(self.login("secret").status_code, 401)
+
+        code = self.last_code()
+        with self.assertNumQueries(0):
+            response = self.post("user-verify", phone=self.phone, code=code + 1)
+        self.assertEqual(response.status_code, 400)
+
+        signed_up_at = User.objects.get(phone=self.phone).updated_at
+        response = self.post("user-verify", phone=self.phone, code=code)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data)
+        user = User.objects.get(phone=self.phone)
+        self.assertTrue(user.is_active)
+        # Shows up in the change feed
+        self.assertGreater(user.updated_at, signed_up_at)
+        self.assertEqual(self.login("secret").status_code, 200)
+
+        response = self.post("user-verify", phone=self.phone, code=code)
+        self.assertEqual(response.status_code, 400)
+
+    def test_signup_is_undone_when_the_code_is_not_sent(self):
+        self.send_verify_code.apply_async.side_effect = OperationalError("refused")
+        response = self.signup()
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(phone=self.phone).exists())
+
+        # The phone is free and the resend cooldown was not taken
+        self.send_verify_code.apply_async.side_effect = None
+        self.assertEqual(self.signup().status_code, 201)
+        self.assertEqual(self.send_verify_code.apply_async.call_count, 2)
+
+    def test_attempts_are_limited(self):
+        self.signup()
+        code = self.last_code()
+        for _ in range(5):
+            self.post("user-verify", phone=self.phone, code=code + 1)
+        response = self.post("user-verify", phone=self.phone, code=code)
+        self.assertEqual(response.status_code, 400)
+
+    def test_resend_cooldown(self):
+        with mock.patch("time.time", return_value=1000):
+            self.signup()
+        with mock.patch("time.time", return_value=1045.5):
+            response = self.post("user-regenerate-verify-code", phone=self.phone)
+        self.assertEqual(response.status_code, 429)
+        # What is left of the cooldown
+        self.assertEqual(response["Retry-After"], "15")
+        self.assertEqual(self.send_verify_code.apply_async.call_count, 1)
+
+    def test_resend_without_broker(self):
+        self.signup()
+        caches["otp"].clear()
+        self.send_verify_code.apply_async.side_effect = OperationalError("refused")
+        response = self.post("user-regenerate-verify-code", phone=self.phone)
+        self.assertEqual(response.status_code, 503)
+
+        self.send_verify_code.apply_async.side_effect = None
+        response = self.post("user-regenerate-verify-code", phone=self.phone)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(OTP_RESEND_SECONDS=0)
+    def test_resend_replaces_code(self):
+        self.signup()
+        response = self.post("user-regenerate-verify-code", phone=self.phone)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.send_verify_code.apply_async.call_count, 2)
+        response = self.post("user-verify", phone=self.phone, code=self.last_code())
+        self.assertEqual(response.status_code, 200)
+
+    def test_reset_password(self):
+        Patient.objects.create(phone=self.phone, first_name="Old", last_name="Patient")
+        response = self.post("user-reset-password", phone=self.phone)
+        self.assertEqual(response.status_code, 200)
+
+        code = self.last_code()
+        response = self.post(
+            "user-reset-password", phone=self.phone, code=code + 1, new_password="new"
+        )
+        self.assertEqual(response.status_code, 400)
+        changed_at = User.objects.get(phone=self.phone).updated_at
+        response = self.post(
+            "user-reset-password", phone=self.phone, code=code, new_password="new"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.login("new").status_code, 200)
+        # Shows up in the change feed
+        user = User.objects.get(phone=self.phone)
+        self.assertGreater(user.updated_at, changed_at)
+
+    def test_reset_password_without_broker(self):
+        Patient.objects.create(phone=self.phone, first_name="Old", last_name="Patient")
+        self.send_verify_code.apply_async.side_effect = OperationalError("refused")
+        response = self.post("user-reset-password", phone=self.phone)
+        self.assertEqual(response.status_code, 503)
+
+        self.send_verify_code.apply_async.side_effect = None
+        response = self.post("user-reset-password", phone=self.phone)
+        self.assertEqual(response.status_code, 200)
+
+    def test_codes_are_per_purpose(self):
+        self.signup()
+        OTPService.send(self.phone, OTPService.RESET_PASSWORD)
+        code = self.last_code()
+        self.assertFalse(OTPService.check(self.phone, OTPService.SIGNUP, code))
+        self.assertTrue(OTPService.check(self.phone, OTPService.RESET_PASSWORD, code))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS, THROTTLE_REDIS_URL="")
+class DefaultPasswordTests(APITestCase):
+    """Users created without a password get dr-<last name>, hashed later"""
+
+    phone = "+998901112233"
+
+    def create(self):
+        with mock.patch.object(hash_default_password, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                patient = Patient.objects.create(
+                    phone=self.phone, first_name="New", last_name="Patient"
+                )
+        apply_async.assert_called_once_with(args=[patient.pk], retry=False)
+        return patient
+
+    def login(self, password):
+        return self.client.post(
+            reverse("token_obtain_pair"),
+            {"phone": self.phone, "password": password},
+            format="json",
+        )
+
+    def test_hashed_on_first_login(self):
+        patient = self.create()
+        self.assertTrue(patient.default_password_pending)
+        self.assertFalse(patient.has_usable_password())
+
+        self.assertEqual(self.login("dr-Other").status_code, 401)
+        self.assertEqual(self.login("dr-Patient").status_code, 200)
+        patient.refresh_from_db()
+        self.assertFalse(patient.default_password_pending)
+        self.assertTrue(patient.has_usable_password())
+        self.assertEqual(self.login("dr-Patient").status_code, 200)
+
+    def test_hashed_by_task(self):
+        patient = self.create()
+        hash_default_password(patient.pk)
+        patient.refresh_from_db()
+        self.assertFalse(patient.default_password_pending)
+        self.assertTrue(patient.check_password("dr-Patient"))
+
+    def test_password_set_since(self):
+        patient = self.create()
+        patient.set_password("secret")
+        patient.save()
+        hash_default_password(patient.pk)
+        self.assertEqual(self.login("dr-Patient").status_code, 401)
+        self.assertEqual(self.login("secret").status_code, 200)
+
+    def test_broker_down(self):
+        # Nothing listens on port 1, a fresh pool connects to it
+        self.addCleanup(setattr, celery_app, "_pool", celery_app._pool)
+        self.addCleanup(setattr, celery_app.conf, "broker_write_url", None)
+        celery_app._pool = None
+        celery_app.conf.broker_write_url = "redis://127.0.0.1:1/0"
+        self.addCleanup(lambda: celery_app.pool.force_close_all())
+
+        started = time.monotonic()
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.create(phone=self.phone, last_name="Patient")
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self.login("dr-Patient").status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class AsyncCatalogTests(TestCase):
+    """Async catalog views return the same payloads as the sync ones"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.urlconf = catalog_urlconf(async_views=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def paths(self):
+        return [
+            "/doctors/",
+            "/doctors/?limit=5&page=3",
+            "/doctors/?search=Doctor1",
+            "/doctors/?ordering=-first_name",
+            f"/doctors/{self.data['doctors'][0].pk}/",
+            "/doctors/0/",
+            "/doctors/?page=100",
+            "/specialties/",
+            f"/specialties/{self.data['specialties'][0].pk}/",
+            "/services/",
+            f"/services/{self.data['services'][0].slug}/",
+        ]
+
+    async def test_same_payloads(self):
+        expected = []
+        for path in self.paths():
+            response = await self.async_client.get(path)
+            self.assertTrue(hasattr(response, "data"), path)
+            expected.append((response.status_code, response.content))
+
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            for path, (status_code, content) in zip(self.paths(), expected):
+                response = await self.async_client.get(path)
+                self.assertFalse(hasattr(response, "data"), path)
+                self.assertEqual(response.status_code, status_code, path)
+                self.assertEqual(response.content, content, path)
+
+    async def test_other_requests_use_sync_views(self):
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            response = await self.async_client.get(
+                "/doctors/", headers={"Accept": "text/html"}
+            )
+            self.assertTrue(hasattr(response, "data"))
+
+            response = await self.async_client.post("/services/", {})
+            self.assertEqual(response.status_code, 403)
+
+    def test_sync_mode_keeps_sync_views(self):
+        match = resolve("/doctors/", catalog_urlconf(async_views=False))
+        self.assertFalse(asyncio.iscoroutinefunction(match.func))
+        match = resolve("/doctors/", self.urlconf)
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+        self.assertEqual(match.func.cls, DoctorViewSet)
+        self.assertTrue(match.func.csrf_exempt)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class PatientImportTests(APITestCase):
+    """Patients are imported in chunks, bad and duplicate rows are reported"""
+
+    rows = (
+        "phone,first_name,last_name,birth_date,address\n"
+        "+998 90 111-00-01,Aziz,Karimov,1990-02-03,Tashkent\n"
+        "901110002,Dilnoza,Rakhimova,,\n"
+        "00998901110001,Aziz,Karimov,,\n"
+        "12,Bad,Phone,,\n"
+        "+998901110003,,Nameless,,\n"
+        "+998901110004,Olim,Yusupov,03.02.1990,\n"
+        "+998901119999,Already,Here,,\n"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Admin.objects.create(
+            phone="+998900000000", first_name="Admin", last_name="Admin"
+        )
+        Patient.objects.create(
+            phone="+998901119999", first_name="Old", last_name="Here"
+        )
+
+    def upload(self, name="patients.csv", content=None):
+        return BytesIO((content or self.rows).encode())
+
+    def test_import(self):
+        progress = mock.Mock()
+        report = PatientImporter(chunk_size=3, progress=progress).run(
+            self.upload(), "patients.csv"
+        )
+
+        self.assertEqual(report["rows"], 7)
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(progress.call_count, 3)
+        errors = {error["row"]: error["errors"] for error in report["errors"]}
+        self.assertEqual(sorted(errors), [4, 5, 6, 7, 8])
+        self.assertIn("Duplicate of row 2", str(errors[4]["phone"]))
+        self.assertIn("first_name", errors[6])
+        self.assertIn("birth_date", errors[7])
+        self.assertIn("already exists", str(errors[8]["phone"]))
+
+        patient = Patient.objects.get(phone="+998901110001")
+        self.assertEqual(patient.username, patient.phone)
+        self.assertEqual(patient.user_type, "PATIENT")
+        self.assertEqual(patient.address, "Tashkent")
+        self.assertEqual(str(patient.birth_date), "1990-02-03")
+        self.assertTrue(patient.default_password_pending)
+        self.assertTrue(patient.check_password("dr-Karimov"))
+        self.assertTrue(Patient.objects.filter(phone="+998901110002").exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(self.rows)
+            file.flush()
+            stdout = StringIO()
+            call_command("import_patients", file.name, stdout=stdout, stderr=StringIO())
+        self.assertIn("Imported 2 of 7 rows", stdout.getvalue())
+        self.assertEqual(Patient.objects.count(), 3)
+
+    @unittest.skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_xlsx(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["Phone", "First_Name", "Last_Name", "Birth_Date"])
+        workbook.active.append([998901110001, "Aziz", "Karimov", datetime(1990, 2, 3)])
+        file = BytesIO()
+        workbook.save(file)
+        file.seek(0)
+
+        report = PatientImporter().run(file, "patients.xlsx")
+        self.assertEqual(report["created"], 1, report["errors"])
+        patient = Patient.objects.get(phone="+998901110001")
+        self.assertEqual(str(patient.birth_date), "1990-02-03")
+
+    def test_endpoint(self):
+        url = reverse("patient-import-patients")
+        file = SimpleUploadedFile("patients.csv", self.rows.encode())
+        self.client.force_authenticate(Patient.objects.get())
+        response = self.client.post(url, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        file.seek(0)
+        response = self.client.post(url, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(len(response.data["errors"]), 5)
+
+        file.seek(0)
+        response = self.client.post(
+            url, {"file": file, "hash_passwords": True}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("hash_passwords", response.data)
+        file.seek(0)
+        response = self.client.post(
+            url, {"file": file, "hash_passwords": False}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        file = SimpleUploadedFile("patients.txt", b"phone\n")
+        response = self.client.post(url, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+
+    def test_unreadable_files(self):
+        for name, content in (
+            ("patients.csv", "phone,first_name\n+998901110001,Aziz\n".encode("utf-16")),
+            ("patients.csv", b"phone,address\n+998901110001," + b"x" * 200000),
+            ("patients.xlsx", b"not a zip"),
+        ):
+            if name.endswith(".xlsx") and openpyxl is None:
+                continue
+            with self.subTest(content=content):
+                with self.assertRaises(PatientImportError):
+                    PatientImporter().run(BytesIO(content), name)
@@ -1,7 +1,25 @@
+import re
 
 from django.utils.translation import gettext_lazy as _
 
 
+COUNTRY_CODE = "998"
 
 
-
+def normalize_phone(value):
+    """
+    Phone number as stored, like ``+998901234567``, or None when it is not
+    one. Spaces, dashes and brackets are dropped, a ``00`` prefix becomes
+    ``+`` and local nine digit numbers get the country code.
+    """
+    value = re.sub(r"[\s\-().]", "", str(value))
+    if value.startswith("00"):
+        value = "+" + value[2:]
+    digits = value.lstrip("+")
+    if not digits.isdigit():
+        return None
+    if len(digits) == 9 and not value.startswith("+"):
+        digits = COUNTRY_CODE + digits
+    if not 10 <= len(digits) <= 14:
+        return None
+    return "+" + digits
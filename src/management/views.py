@@ -1,8 +1,16 @@
+import logging
+
+from django.db import transaction
+from kombu.exceptions import OperationalError
+from redis import RedisError
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from src.base import MultiSerializerMixin
+from core.permissions import IsAdmin
+from core.throttling import LoginThrottle, PublicWriteThrottle
+from src.base import AsyncReadMixin, MultiSerializerMixin
+from src.serializers import CustomTokenObtainPairSerializer
 from .models import User, Admin
 from .repositories import (
     UserRepository,
@@ -19,12 +27,15 @@ from .serializers import (
     ChangePasswordSerializer,
     PhoneSerializer,
     VerifySerializer,
+    ResetPasswordSerializer,
+    SignupSerializer,
     AdminSerializer,
     MeAdminSerializer,
     DoctorSerializer,
     MeDoctorSerializer,
     DoctorGetSerializer,
     PatientSerializer,
+    PatientImportFileSerializer,
     MePatientSerializer,
     SpecialtySerializer,
     ServiceSerializer,
@@ -32,6 +43,40 @@ from .serializers import (
     RatingSerializer,
 )
 from .filters import DoctorFilter, PatientFilter, ServiceFilter
+from .services.otp import OTPService
+from .services.patient_import import PatientImporter, PatientImportError
+
+
+logger = logging.getLogger(__name__)
+
+# Broker or code cache unreachable
+CODE_NOT_SENT_ERRORS = (OperationalError, RedisError)
+
+
+def code_sent_response(wait):
+    """Response to a request for an SMS code"""
+    if wait:
+        return Response(
+            {"error": "A code was sent recently, try again later."},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(wait)},
+        )
+    return Response({"detail": "Verification code sent."}, status=status.HTTP_200_OK)
+
+
+def code_not_sent_response(error):
+    """Response when the broker or the code cache is unreachable"""
+    logger.warning("Verification code not sent: %s", error)
+    return Response(
+        {"error": "The verification code could not be sent, try again later."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+def invalid_code_response():
+    return Response(
+        {"error": "Invalid or expired code."}, status=status.HTTP_400_BAD_REQUEST
+    )
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -70,7 +115,8 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer_map = {
             "change_avatar": ChangeAvatarSerializer,
             "change_password": ChangePasswordSerializer,
-            "reset_password": PhoneSerializer,
+            "signup": SignupSerializer,
+            "reset_password": ResetPasswordSerializer,
             "regenerate_verify_code": PhoneSerializer,
             "verify": VerifySerializer,
         }
@@ -123,6 +169,90 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["POST"], throttle_classes=[LoginThrottle])
+    def signup(self, request):
+        """
+        Create an inactive patient and send them a verification code. The
+        patient is not kept when the code can not be sent, so the phone is
+        free to sign up again.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                patient = serializer.save()
+                OTPService.send(patient.phone, OTPService.SIGNUP)
+        except CODE_NOT_SENT_ERRORS as e:
+            return code_not_sent_response(e)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["POST"], throttle_classes=[LoginThrottle])
+    def verify(self, request):
+        """Activate a signed up user by their code and log them in"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        phone = serializer.validated_data["phone"]
+        code = serializer.validated_data["code"]
+
+        if not OTPService.check(phone, OTPService.SIGNUP, code):
+            return invalid_code_response()
+
+        user = UserRepository.activate(phone)
+        refresh = CustomTokenObtainPairSerializer.get_token(user)
+        return Response({"refresh": str(refresh), "access": str(refresh.access_token)})
+
+    @action(
+        url_path="regenerate-verify-code",
+        detail=False,
+        methods=["POST"],
+        throttle_classes=[LoginThrottle],
+    )
+    def regenerate_verify_code(self, request):
+        """Send a new verification code to a user who has not verified yet"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        phone = serializer.validated_data["phone"]
+
+        wait = 0
+        if UserRepository.get().filter(phone=phone, is_active=False).exists():
+            try:
+                wait = OTPService.send(phone, OTPService.SIGNUP)
+            except CODE_NOT_SENT_ERRORS as e:
+                return code_not_sent_response(e)
+        return code_sent_response(wait)
+
+    @action(
+        url_path="reset-password",
+        detail=False,
+        methods=["POST"],
+        throttle_classes=[LoginThrottle],
+    )
+    def reset_password(self, request):
+        """Send a reset code, or set a new password with one"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        phone = data["phone"]
+
+        if "code" not in data:
+            wait = 0
+            if UserRepository.get().filter(phone=phone, is_active=True).exists():
+                try:
+                    wait = OTPService.send(phone, OTPService.RESET_PASSWORD)
+                except CODE_NOT_SENT_ERRORS as e:
+                    return code_not_sent_response(e)
+            return code_sent_response(wait)
+
+        if not OTPService.check(phone, OTPService.RESET_PASSWORD, data["code"]):
+            return invalid_code_response()
+
+        user = UserRepository.get_by_phone(phone)
+        user.set_password(data["new_password"])
+        user.save(
+            update_fields=["password", "default_password_pending", "updated_at"]
+        )
+        return Response(status=status.HTTP_200_OK)
+
 
 class AdminViewSet(viewsets.ModelViewSet):
     """Admin model viewset"""
@@ -138,7 +268,7 @@ class AdminViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
-class DoctorViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
+class DoctorViewSet(AsyncReadMixin, MultiSerializerMixin, viewsets.ModelViewSet):
     """Doctor model viewset"""
 
     serializer_class = DoctorSerializer
@@ -177,8 +307,30 @@ class PatientViewSet(viewsets.ModelViewSet):
     filterset_class = PatientFilter
     permission_classes = [permissions.IsAuthenticated]
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        serializer_class=PatientImportFileSerializer,
+        permission_classes=[IsAdmin],
+    )
+    def import_patients(self, request):
+        """
+        Import patients from a CSV or XLSX file, row errors are reported.
+        Default passwords are hashed on first login, hashing them up front
+        is left to the import_patients command as it takes a process pool.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file = serializer.validated_data["file"]
+        try:
+            report = PatientImporter().run(file, file.name)
+        except PatientImportError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
 
-class SpecialtyViewSet(viewsets.ModelViewSet):
+class SpecialtyViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     """Specialty model viewset"""
 
     queryset = SpecialtyRepository.get()
@@ -186,7 +338,7 @@ class SpecialtyViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     """Service model viewset"""
 
     queryset = ServiceRepository.get()
@@ -201,6 +353,7 @@ class InitialRecordViewSet(viewsets.ModelViewSet):
 
     queryset = InitialRecordRepository.get()
     serializer_class = InitialRecordSerializer
+    throttle_classes = [PublicWriteThrottle]
 
 
 class RatingViewSet(viewsets.ModelViewSet):
@@ -208,3 +361,4 @@ class RatingViewSet(viewsets.ModelViewSet):
 
     queryset = RatingRepository.get()
     serializer_class = RatingSerializer
+    throttle_classes = [PublicWriteThrottle]
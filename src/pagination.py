@@ -1,3 +1,12 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework import pagination
 
@@ -9,6 +18,33 @@ class CustomPagination(pagination.PageNumberPagination):
 
     page_size_query_param = "limit"
 
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() that counts and fetches with the async ORM"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.page.object_list = [
+            obj async for obj in self.page.object_list.aiterator(chunk_size=page_size)
+        ]
+        return list(self.page)
+
     def get_paginated_response(self, data):
         limit = self.get_page_size(self.request)
         next_page = None
@@ -29,3 +65,46 @@ class CustomPagination(pagination.PageNumberPagination):
                 "results": data,
             }
         )
+
+
+class HistoryCursorPagination(pagination.CursorPagination):
+    """Newest first cursor pagination, which does not count the rows"""
+
+    ordering = ("-date", "-id")
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of large tables. Unfiltered lists use
+    the planner's row estimate on PostgreSQL once it passes
+    ``ADMIN_EXACT_COUNT_LIMIT``, other counts are cached for
+    ``ADMIN_COUNT_CACHE_SECONDS``.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # -1 until the table is analyzed
+            if row and row[0] >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                return row[0]
+
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = hashlib.sha256(f"{queryset.db}:{sql}:{params}".encode()).hexdigest()
+        return cache.get_or_set(
+            f"admin-count:{key}",
+            lambda: Paginator.count.func(self),
+            settings.ADMIN_COUNT_CACHE_SECONDS,
+        )
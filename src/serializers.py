@@ -1,9 +1,262 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+import threading
+from functools import lru_cache
+from operator import attrgetter, methodcaller
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from django.utils import timezone
+
+from rest_framework import fields, relations, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import ISO_8601, api_settings
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+
+from core.revocation import RevocableRefreshToken
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RevocableRefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
         token["user_type"] = user.user_type
         return token
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocableRefreshToken
+
+
+# <-----Compiled Serializers----> #
+
+CONTEXT_FIELDS = (fields.FileField, relations.HyperlinkedRelatedField)
+
+_state = threading.local()
+
+
+def _is_iso_format(field, setting):
+    output_format = getattr(field, "format", setting)
+    return isinstance(output_format, str) and output_format.lower() == ISO_8601
+
+
+def _datetime_representation(field):
+    if not _is_iso_format(field, api_settings.DATETIME_FORMAT):
+        return field.to_representation
+
+    def represent(value):
+        # Same as field.enforce_timezone(), with the current timezone looked
+        # up once per CompiledSerializer.data instead of once per value
+        if hasattr(field, "timezone"):
+            field_timezone = field.timezone
+        else:
+            field_timezone = getattr(_state, "timezone", None)
+        if field_timezone is not None and timezone.is_aware(value):
+            value = value.astimezone(field_timezone)
+        else:
+            value = field.enforce_timezone(value)
+
+        value = value.isoformat()
+        if value.endswith("+00:00"):
+            return value[:-6] + "Z"
+        return value
+
+    return represent
+
+
+def _iso_representation(field, setting):
+    if not _is_iso_format(field, setting):
+        return field.to_representation
+    return methodcaller("isoformat")
+
+
+def _choice_representation(field):
+    choices = field.choice_strings_to_values
+
+    def represent(value):
+        if value == "":
+            return value
+        return choices.get(str(value), value)
+
+    return represent
+
+
+def _representation(field):
+    """Return a function equal to ``field.to_representation`` for non-null values"""
+    if isinstance(field, fields.DateTimeField):
+        return _datetime_representation(field)
+    if isinstance(field, fields.DateField):
+        return _iso_representation(field, api_settings.DATE_FORMAT)
+    if isinstance(field, fields.TimeField):
+        return _iso_representation(field, api_settings.TIME_FORMAT)
+    if isinstance(field, fields.ChoiceField):
+        return _choice_representation(field)
+    if type(field) in (fields.CharField, fields.SlugField):
+        return str
+    if type(field) is fields.IntegerField:
+        return int
+    if isinstance(field, serializers.BaseSerializer):
+        return compile_representation(field)
+    return field.to_representation
+
+
+def _model_field(serializer, field):
+    """Return the concrete model field a serializer field reads directly, if any"""
+    model = getattr(getattr(serializer, "Meta", None), "model", None)
+    if model is None or len(field.source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(field.source_attrs[0])
+    except FieldDoesNotExist:
+        return None
+    return model_field if model_field.concrete else None
+
+
+def compile_representation(serializer):
+    """
+    Build a function that returns the same primitives as
+    ``serializer.to_representation(instance)``.
+
+    Field lookups and converters are resolved once, so serializing many
+    instances skips the per-field dispatch of DRF serializers.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        child = compile_representation(serializer.child)
+
+        def represent_many(data):
+            if isinstance(data, models.manager.BaseManager):
+                data = data.all()
+            return [child(item) for item in data]
+
+        return represent_many
+
+    readers = []
+    for field in serializer._readable_fields:
+        if isinstance(field, CONTEXT_FIELDS):
+            raise ImproperlyConfigured(
+                f"{field.field_name} needs the request and cannot be compiled."
+            )
+
+        model_field = _model_field(serializer, field)
+        if isinstance(field, relations.PrimaryKeyRelatedField) and model_field:
+            if field.pk_field is None and model_field.many_to_one:
+                readers.append((field.field_name, attrgetter(model_field.attname), None))
+                continue
+        elif model_field and not model_field.is_relation:
+            readers.append(
+                (field.field_name, attrgetter(model_field.attname), _representation(field))
+            )
+            continue
+
+        readers.append((field.field_name, field.get_attribute, _representation(field)))
+
+    def represent(instance):
+        ret = {}
+        for name, get_attribute, to_representation in readers:
+            try:
+                attribute = get_attribute(instance)
+            except SkipField:
+                continue
+
+            if isinstance(attribute, PKOnlyObject):
+                check_for_none = attribute.pk
+            else:
+                check_for_none = attribute
+            if check_for_none is None:
+                ret[name] = None
+            elif to_representation is None:
+                ret[name] = attribute
+            else:
+                ret[name] = to_representation(attribute)
+        return ret
+
+    return represent
+
+
+class CompiledSerializer:
+    """
+    Read-only stand-in for a DRF serializer that builds ``data`` with a
+    representation compiled once per serializer class.
+    """
+
+    serializer_class = None
+    _represent = None
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def get_representation(cls):
+        if cls._represent is None:
+            cls._represent = compile_representation(cls.serializer_class())
+        return cls._represent
+
+    @property
+    def data(self):
+        represent = self.get_representation()
+        _state.timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        try:
+            if self.many:
+                return [represent(instance) for instance in self.instance]
+            return represent(self.instance)
+        finally:
+            del _state.timezone
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    """Return a ``CompiledSerializer`` class for ``serializer_class``"""
+    return type(
+        f"Compiled{serializer_class.__name__}",
+        (CompiledSerializer,),
+        {"serializer_class": serializer_class},
+    )
+
+
+# <-----Expandable Serializers----> #
+
+
+@lru_cache(maxsize=None)
+def expand_serializer(serializer_class, expand):
+    """
+    Return a subclass of ``serializer_class`` that nests only the
+    ``expandable_fields`` listed in ``expand``. The others are written as
+    primary keys when they are forward relations and left out otherwise.
+    """
+    model = serializer_class.Meta.model
+    attrs = {}
+    for name in serializer_class.expandable_fields:
+        if name in expand:
+            continue
+        if model._meta.get_field(name).concrete:
+            attrs[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+        else:
+            attrs[name] = None
+
+    if not attrs:
+        return serializer_class
+    return type(serializer_class.__name__, (serializer_class,), attrs)
+
+
+def collapse_expanded(serializer_class, data, expand):
+    """
+    Reduce ``data`` rendered with every expandable field nested to what
+    ``expand_serializer(serializer_class, expand)`` would render
+    """
+    model = serializer_class.Meta.model
+    data = dict(data)
+    for name in serializer_class.expandable_fields:
+        if name in expand:
+            continue
+        if model._meta.get_field(name).concrete:
+            value = data[name]
+            data[name] = None if value is None else value["id"]
+        else:
+            data.pop(name, None)
+    return data
@@ -0,0 +1,203 @@
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from src.serializers import CustomTokenObtainPairSerializer
+from src.management.models import (
+    Admin,
+    Doctor,
+    Patient,
+    Specialty,
+    Service,
+    InitialRecord,
+    Rating,
+)
+from src.treatment.models import Appointment, Report, Profit, Consumption, Salary
+
+
+SEED_DATE = date(2024, 5, 1)
+SEED_ROWS = 25
+FAST_PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+def seed_dataset(rows=SEED_ROWS, start_date=SEED_DATE):
+    """Create a small but representative dataset covering every API model"""
+    admin = Admin.objects.create(phone="+998900000000", first_name="Admin")
+
+    specialties = [
+        Specialty.objects.create(
+            name_en=f"Specialty {i}",
+            name_ru=f"Специальность {i}",
+            name_uz=f"Mutaxassislik {i}",
+            image="specialties/seed.png",
+            is_published=True,
+        )
+        for i in range(rows)
+    ]
+    services = [
+        Service.objects.create(
+            name_en=f"Service {i}",
+            name_ru=f"Услуга {i}",
+            name_uz=f"Xizmat {i}",
+            category="therapy",
+            price_start=Decimal("100.00"),
+            price_end=Decimal("500.00"),
+            kpi_percent=30,
+        )
+        for i in range(rows)
+    ]
+
+    doctors = []
+    for i in range(rows):
+        doctor = Doctor.objects.create(
+            phone=f"+99891{i:07d}", first_name=f"Doctor{i}", last_name=f"Doc{i}"
+        )
+        doctor.specialties.set(specialties[: i % 3 + 1])
+        doctors.append(doctor)
+
+    patients = [
+        Patient.objects.create(
+            phone=f"+99893{i:07d}", first_name=f"Patient{i}", last_name=f"Pat{i}"
+        )
+        for i in range(rows)
+    ]
+
+    reports = [
+        Report.objects.create(date=start_date + timedelta(days=i)) for i in range(3)
+    ]
+
+    appointments = []
+    for i, patient in enumerate(patients):
+        report = reports[i % len(reports)]
+        appointment = Appointment.objects.create(
+            patient=patient,
+            doctor=doctors[i % 3],
+            service=services[i % len(services)],
+            price=Decimal("300.00"),
+            start_time=time(9 + i % 8),
+            date=report.date,
+        )
+        for amount in (Decimal("100.00"), Decimal("50.00")):
+            Profit.objects.create(report=report, appointment=appointment, amount=amount)
+        appointments.append(appointment)
+
+    salaries, initial_records, ratings = [], [], []
+    for i in range(rows):
+        report = reports[i % len(reports)]
+        Consumption.objects.create(
+            report=report, title=f"Consumption {i}", amount=Decimal("10.00")
+        )
+        salary = Salary.objects.create(
+            report=report,
+            title=f"Salary {i}",
+            amount=Decimal("20.00"),
+            doctor=doctors[i % 3],
+        )
+        salaries.append(salary)
+        initial_records.append(
+            InitialRecord.objects.create(
+                first_name=f"Record{i}", last_name=f"Rec{i}", phone=f"+99894{i:07d}"
+            )
+        )
+        ratings.append(
+            Rating.objects.create(
+                first_name=f"Rater{i}",
+                last_name=f"Rat{i}",
+                doctor=doctors[i % 3],
+                rate=5,
+                review="Great",
+            )
+        )
+
+    return {
+        "admin": admin,
+        "specialties": specialties,
+        "services": services,
+        "doctors": doctors,
+        "patients": patients,
+        "reports": reports,
+        "appointments": appointments,
+        "salaries": salaries,
+        "initial_records": initial_records,
+        "ratings": ratings,
+    }
+
+
+class QueryBudgetMixin:
+    """
+    Mixin for API test cases that checks every endpoint against a declared
+    query budget.
+
+    ``query_budgets`` maps router url names to the maximum number of queries a
+    single request may run, authentication included. List endpoints are called
+    with several page sizes and must run the same number of queries for each.
+    """
+
+    router = None
+    query_budgets = {}
+    page_sizes = (5, 20)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def setUp(self):
+        self.authenticate(self.data["admin"])
+
+    def authenticate(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_every_endpoint_has_budget(self):
+        if self.router is None:
+            return
+        names = {url.name for url in self.router.urls} - {"api-root"}
+        self.assertEqual(names - set(self.query_budgets), set())
+
+    def assertQueryBudget(self, name, method="get", kwargs=None, data=None, **extra):
+        """Call the named endpoint and check it stays within its query budget"""
+        budget = self.query_budgets[name]
+        url = reverse(name, kwargs=kwargs)
+        status_code = extra.pop("status_code", 200)
+        if method != "get":
+            extra.setdefault("format", "json")
+
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, **extra)
+
+        self.assertEqual(response.status_code, status_code, response.content)
+        self.assertLessEqual(
+            len(context),
+            budget,
+            "%s ran %d queries, budget is %d:\n%s"
+            % (
+                name,
+                len(context),
+                budget,
+                "\n".join(query["sql"] for query in context.captured_queries),
+            ),
+        )
+        return response, len(context)
+
+    def assertListBudget(self, name, params=None, page_sizes=None):
+        """Check a list endpoint budget for several page sizes"""
+        counts = []
+        for limit in page_sizes or self.page_sizes:
+            response, count = self.assertQueryBudget(
+                name, data={**(params or {}), "limit": limit}
+            )
+            self.assertEqual(len(response.data["results"]), limit)
+            counts.append(count)
+
+        self.assertEqual(
+            len(set(counts)), 1, f"{name} query count grows with page size: {counts}"
+        )
@@ -0,0 +1,385 @@
+import gzip
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import redis
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import revocation, throttling
+from core.storage import CompressedManifestStaticFilesStorage
+from src.management.models import Admin, Doctor, Patient
+from src.serializers import CustomTokenObtainPairSerializer
+from src.testing import FAST_PASSWORD_HASHERS
+from src.views import load_schema
+
+
+class SchemaViewTests(TestCase):
+    """The schema is built once and served from the file"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "schema.yml"
+        self.addCleanup(load_schema.cache_clear)
+
+        settings = override_settings(SCHEMA_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def build(self, *args):
+        call_command("build_schema", *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_build_and_check(self):
+        with self.assertRaises(CommandError):
+            self.build("--check")
+
+        self.build()
+        self.assertIn(b"/appointments/", self.path.read_bytes())
+        self.build("--check")
+
+        self.path.write_bytes(b"openapi: 3.0.3\n")
+        with self.assertRaises(CommandError):
+            self.build("--check")
+
+    def test_serves_file_with_etag_and_gzip(self):
+        self.build()
+        content = self.path.read_bytes()
+
+        response = self.client.get(reverse("schema"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, content)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get(
+            reverse("schema"), headers={"Accept-Encoding": "br, gzip"}
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), content)
+
+        etag = response["ETag"]
+        response = self.client.get(reverse("schema"), headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_missing_schema(self):
+        response = self.client.get(reverse("schema"))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(THROTTLE_REDIS_URL="redis://throttle.invalid/1")
+class ThrottlingTests(TestCase):
+    """Login, public writes and report ranges take tokens from Redis buckets"""
+
+    def setUp(self):
+        patcher = mock.patch.object(throttling, "get_token_bucket")
+        self.bucket = patcher.start().return_value
+        self.bucket.return_value = [1, "0"]
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, throttling, "_redis_down_until", 0)
+
+    def taken(self):
+        """Bucket keys and costs the requests took tokens with"""
+        return [
+            (call.kwargs["keys"][0], call.kwargs["args"][2])
+            for call in self.bucket.call_args_list
+        ]
+
+    def test_empty_bucket(self):
+        self.bucket.return_value = [0, "4.2"]
+        response = self.client.post(
+            reverse("token_obtain_pair"), {"phone": "+998900000000", "password": "x"}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "5")
+        self.assertEqual(self.taken(), [("throttle:login:127.0.0.1", 1)])
+
+    def test_forwarded_for_is_not_trusted(self):
+        url = reverse("token_obtain_pair")
+        data = {"phone": "+998900000000", "password": "x"}
+        self.client.post(url, data, HTTP_X_FORWARDED_FOR="203.0.113.7")
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 1}
+        ):
+            # The proxy appends the address it saw after the spoofed one
+            self.client.post(url, data, HTTP_X_FORWARDED_FOR="203.0.113.7, 10.0.0.2")
+        self.assertEqual(
+            self.taken(),
+            [("throttle:login:127.0.0.1", 1), ("throttle:login:10.0.0.2", 1)],
+        )
+
+    @override_settings(THROTTLE_EXEMPT_ADDRESSES=["127.0.0.1"])
+    def test_exempt_addresses(self):
+        self.bucket.return_value = [0, "4.2"]
+        response = self.client.post(
+            reverse("token_obtain_pair"), {"phone": "+998900000000", "password": "x"}
+        )
+        self.assertNotEqual(response.status_code, 429)
+        self.assertEqual(self.taken(), [])
+
+    def test_public_reads_are_free(self):
+        self.client.get(reverse("rating-list"))
+        self.assertEqual(self.taken(), [])
+        self.client.post(reverse("rating-list"), {})
+        self.assertEqual(self.taken(), [("throttle:public_write:127.0.0.1", 1)])
+
+    def test_range_cost_grows_with_span(self):
+        admin = Admin.objects.create(phone="+998900000000", first_name="Admin")
+        token = CustomTokenObtainPairSerializer.get_token(admin).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+        url = reverse("report-get-reports-in-range")
+        for end_date in ("2024-05-01", "2024-07-31", "2030-01-01"):
+            self.client.get(url, {"start_date": "2024-05-01", "end_date": end_date})
+        self.assertEqual(
+            self.taken()[0][0], f"throttle:heavy_read:{admin.pk}"
+        )
+        self.assertEqual(
+            [cost for _, cost in self.taken()],
+            [1, 3, throttling.HeavyReadThrottle().num_requests],
+        )
+
+    def test_fails_open_without_redis(self):
+        self.bucket.side_effect = redis.ConnectionError("refused")
+        url = reverse("rating-list")
+        self.assertNotEqual(self.client.post(url, {}).status_code, 429)
+        self.assertNotEqual(self.client.post(url, {}).status_code, 429)
+        # Redis is not retried on every request while it is down
+        self.assertEqual(self.bucket.call_count, 1)
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        items = [f"jti-{i}" for i in range(2000)]
+        bloom = revocation.BloomFilter.from_items(items)
+        self.assertTrue(all(item in bloom for item in items))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+@override_settings(REVOKED_TOKENS_REDIS_URL="redis://revoked.invalid/3")
+class TokenRevocationTests(TestCase):
+    """Logout revokes tokens, other tokens are checked without Redis"""
+
+    def setUp(self):
+        patcher = mock.patch.object(revocation, "get_redis")
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.redis.get.return_value = b"0"
+        self.redis.zrange.return_value = []
+        self.redis.zscore.return_value = None
+
+        patcher = mock.patch.object(
+            revocation, "revoked_tokens", revocation.RevokedTokens()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        admin = Admin.objects.create(phone="+998900000000", first_name="Admin")
+        self.refresh = CustomTokenObtainPairSerializer.get_token(admin)
+        self.access = self.refresh.access_token
+
+    def me(self, token):
+        return self.client.get(
+            reverse("user-me"), HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_logout_revokes_tokens(self):
+        self.assertEqual(self.me(self.access).status_code, 200)
+        self.redis.zscore.assert_not_called()
+
+        response = self.client.post(
+            reverse("logout"),
+            {"refresh": str(self.refresh)},
+            HTTP_AUTHORIZATION=f"Bearer {self.access}",
+        )
+        self.assertEqual(response.status_code, 200)
+        zadd = self.redis.pipeline.return_value.__enter__.return_value.zadd
+        self.assertEqual(
+            [call.args[1] for call in zadd.call_args_list],
+            [
+                {self.access["jti"]: self.access["exp"]},
+                {self.refresh["jti"]: self.refresh["exp"]},
+            ],
+        )
+
+        self.redis.zscore.return_value = self.access["exp"]
+        # Session authentication comes first, so failures are 403 and not 401
+        self.assertEqual(self.me(self.access).status_code, 403)
+        response = self.client.post(
+            reverse("token_refresh"), {"refresh": str(self.refresh)}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_logout_needs_no_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(
+            reverse("logout"),
+            {"refresh": str(self.refresh)},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access}",
+        )
+        self.assertEqual(response.status_code, 200)
+        zadd = self.redis.pipeline.return_value.__enter__.return_value.zadd
+        self.assertEqual(zadd.call_count, 2)
+
+        # Session logouts are still checked
+        response = client.post(reverse("logout"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_logout_without_redis(self):
+        self.redis.pipeline.side_effect = redis.ConnectionError("refused")
+        response = self.client.post(
+            reverse("logout"),
+            {"refresh": str(self.refresh)},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_workers_sync(self):
+        worker = revocation.RevokedTokens()
+        self.redis.get.return_value = b"1"
+        self.redis.zrange.return_value = [self.access["jti"].encode()]
+        self.redis.zscore.return_value = self.access["exp"]
+
+        self.assertTrue(worker.is_revoked(self.access["jti"]))
+        self.redis.zscore.reset_mock()
+        self.assertFalse(worker.is_revoked(self.refresh["jti"]))
+        self.redis.zscore.assert_not_called()
+
+    def test_expired_revocations_are_ignored(self):
+        self.redis.zrange.return_value = [self.access["jti"].encode()]
+        self.redis.zscore.return_value = 0
+        self.assertEqual(self.me(self.access).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class FileServingTests(TestCase):
+    """Media is checked before it is sent, static files are cached for good"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(
+            phone="+998901110001", last_name="One", avatar="avatars/one.png"
+        )
+        cls.other = Patient.objects.create(phone="+998901110002", last_name="Two")
+        cls.doctor = Doctor.objects.create(
+            phone="+998901110003", last_name="Doc", avatar="avatars/doc.png"
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for name in (
+            "media/avatars/one.png",
+            "media/avatars/doc.png",
+            "media/avatars/orphan.png",
+            "media/specialties/tooth.png",
+            "static/app.0123456789ab.css",
+            "static/app.0123456789ab.css.gz",
+            "static/app.0123456789ab.css.br",
+        ):
+            (self.root / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / name).write_bytes(name.encode())
+
+        settings = override_settings(
+            MEDIA_ROOT=self.root / "media", STATIC_ROOT=self.root / "static"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get(self, name, path, user=None, accept_encoding=""):
+        data = {}
+        if user is not None:
+            token = CustomTokenObtainPairSerializer.get_token(user).access_token
+            data["token"] = str(token)
+        return self.client.get(
+            reverse(name, args=[path]),
+            data,
+            headers={"Accept-Encoding": accept_encoding},
+        )
+
+    def test_public_media(self):
+        for path in ("specialties/tooth.png", "avatars/doc.png"):
+            response = self.get("media", path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.getvalue(), f"media/{path}".encode())
+            self.assertIn("public", response["Cache-Control"])
+
+        self.assertEqual(self.get("media", "avatars/orphan.png").status_code, 404)
+        self.assertEqual(self.get("media", "specialties/none.png").status_code, 404)
+        self.assertEqual(
+            self.get("media", "../static/app.0123456789ab.css").status_code, 404
+        )
+
+    def test_patient_avatar(self):
+        self.assertEqual(self.get("media", "avatars/one.png").status_code, 403)
+        self.assertEqual(
+            self.get("media", "avatars/one.png", self.other).status_code, 403
+        )
+        for user in (self.patient, self.doctor):
+            response = self.get("media", "avatars/one.png", user)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("private", response["Cache-Control"])
+
+    def test_proxy_transfer(self):
+        with override_settings(FILE_TRANSFER="x-accel"):
+            response = self.get("media", "avatars/one.png", self.patient)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected/media/avatars/one.png"
+        )
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response.getvalue(), b"")
+
+        with override_settings(FILE_TRANSFER="x-sendfile"):
+            response = self.get("media", "specialties/tooth.png")
+        self.assertEqual(
+            response["X-Sendfile"], str(self.root / "media/specialties/tooth.png")
+        )
+
+    def test_static(self):
+        name = "app.0123456789ab.css"
+        with mock.patch("src.views.hashed_static_names", return_value={name}):
+            response = self.get("static", name, accept_encoding="gzip, br")
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(response["Content-Type"], "text/css")
+            self.assertIn("immutable", response["Cache-Control"])
+            self.assertIn("Accept-Encoding", response["Vary"])
+
+            response = self.get("static", name, accept_encoding="gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(response.getvalue(), f"static/{name}.gz".encode())
+
+        response = self.get("static", name)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_compressed_manifest_storage(self):
+        source = self.root / "source"
+        source.mkdir()
+        (source / "app.css").write_text("body { color: red; }\n" * 50)
+        (source / "tiny.css").write_text("a {}")
+        (source / "logo.png").write_bytes(b"\x89PNG" * 100)
+
+        storage = CompressedManifestStaticFilesStorage(location=self.root / "collected")
+        paths = {
+            name: (FileSystemStorage(location=source), name)
+            for name in ("app.css", "tiny.css", "logo.png")
+        }
+        list(storage.post_process(paths))
+
+        hashed = storage.hashed_files["app.css"]
+        self.assertNotEqual(hashed, "app.css")
+        content = storage.open(hashed).read()
+        self.assertEqual(gzip.decompress(storage.open(hashed + ".gz").read()), content)
+        self.assertFalse(storage.exists(storage.hashed_files["tiny.css"] + ".gz"))
+        self.assertFalse(storage.exists(storage.hashed_files["logo.png"] + ".gz"))
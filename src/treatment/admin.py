@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+
+from src.pagination import EstimatedCountPaginator
 from .models import Appointment, Report
 
 
@@ -11,13 +13,22 @@ class AppointmentAdmin(admin.ModelAdmin):
         "doctor",
         "service",
         "price",
+        "status",
+        "date",
         "start_time",
         "end_time",
     )
-    search_fields = ("patient__phone", "doctor__phone", "service__name")
-    list_filter = ("doctor", "service", "start_time")
+    list_select_related = ("patient", "doctor", "service")
+    search_fields = ("^patient__phone", "^doctor__phone", "service__name_en")
+    # Every doctor, service or start time would be a query over the table
+    list_filter = ("status", "date")
+    autocomplete_fields = ("patient", "doctor", "service")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("id", "date", "updated_at")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,182 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+
+from .choices import StatusChoices
+from .models import (
+    Appointment,
+    Report,
+    Profit,
+    Salary,
+    ArchivedReport,
+    ArchivedEarning,
+    ArchivedAppointment,
+)
+from .repository import (
+    AnalyticsRepository,
+    AppointmentRepository,
+    ArchiveRepository,
+    ReportRepository,
+)
+from .serializers import AppointmentReadCompiledSerializer, ReportCompiledSerializer
+from .signals import batch_tombstones
+
+
+CLOSED_STATUSES = (StatusChoices.FULLY_PAID, StatusChoices.CANCELLED)
+
+
+def select_archivable(cutoff):
+    """
+    Return the ids of the reports and appointments before ``cutoff`` that
+    can leave the live tables together.
+
+    An appointment is closed when it is fully paid or cancelled and has no
+    profits on a report from ``cutoff`` on. A report is closed when all its
+    profits belong to closed appointments and it paid no salaries, which
+    doctor balances and earnings are counted from. Both are kept live while
+    any profit links them to a row that stays, so no live row loses a profit.
+    """
+    appointments = set(
+        Appointment.objects.filter(date__lt=cutoff, status__in=CLOSED_STATUSES)
+        .exclude(profits__report__date__gte=cutoff)
+        .values_list("id", flat=True)
+    )
+    reports = set(Report.objects.filter(date__lt=cutoff).values_list("id", flat=True))
+
+    report_appointments = defaultdict(set)
+    appointment_reports = defaultdict(set)
+    for report_id, appointment_id in Profit.objects.filter(
+        report__date__lt=cutoff
+    ).values_list("report_id", "appointment_id"):
+        report_appointments[report_id].add(appointment_id)
+        appointment_reports[appointment_id].add(report_id)
+
+    blocked_reports = {
+        report_id
+        for report_id, linked in report_appointments.items()
+        if not linked <= appointments
+    }
+    blocked_reports |= reports & set(
+        Salary.objects.filter(report__date__lt=cutoff).values_list(
+            "report_id", flat=True
+        )
+    )
+    while blocked_reports:
+        reports -= blocked_reports
+        blocked_appointments = appointments & {
+            appointment_id
+            for report_id in blocked_reports
+            for appointment_id in report_appointments[report_id]
+        }
+        appointments -= blocked_appointments
+        blocked_reports = reports & {
+            report_id
+            for appointment_id in blocked_appointments
+            for report_id in appointment_reports[appointment_id]
+        }
+
+    appointments = {
+        appointment_id
+        for appointment_id in appointments
+        if appointment_reports[appointment_id] <= reports
+    }
+    return reports, appointments
+
+
+def chunks(ids, size):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+def delete(model, ids, batch_size):
+    for chunk in chunks(ids, batch_size):
+        with batch_tombstones():
+            model.objects.filter(id__in=chunk).delete()
+
+
+def archive_reports(ids, batch_size):
+    for chunk in chunks(ids, batch_size):
+        reports = ReportRepository._annotate(Report.objects.filter(id__in=chunk))
+        archived = {
+            report.id: ArchivedReport(
+                date=report.date,
+                total_profit=report.total_profit,
+                total_consumption=report.total_consumption,
+                data=ArchiveRepository.pack(ReportCompiledSerializer(report).data),
+            )
+            for report in reports
+        }
+        ArchivedReport.objects.bulk_create(archived.values())
+        ArchivedEarning.objects.bulk_create(
+            [
+                ArchivedEarning(
+                    report=archived[report_id], doctor_id=doctor_id, amount=amount
+                )
+                for report_id, doctor_id, amount in (
+                    AnalyticsRepository.get_report_earnings(chunk)
+                )
+            ]
+        )
+
+
+def archive_appointments(ids, batch_size):
+    for chunk in chunks(ids, batch_size):
+        appointments = AppointmentRepository.get().filter(id__in=chunk)
+        ArchivedAppointment.objects.bulk_create(
+            [
+                ArchivedAppointment(
+                    id=appointment.id,
+                    patient_id=appointment.patient_id,
+                    doctor_id=appointment.doctor_id,
+                    status=appointment.status,
+                    start_time=appointment.start_time,
+                    end_time=appointment.end_time,
+                    date=appointment.date,
+                    data=ArchiveRepository.pack(
+                        AppointmentReadCompiledSerializer(appointment).data
+                    ),
+                )
+                for appointment in appointments
+            ]
+        )
+
+
+def archive_before(cutoff, batch_size=500, dry_run=False, log=None):
+    """
+    Move closed reports and appointments dated before ``cutoff`` to the
+    archive tables, one month at a time so memory stays bounded.
+    Returns the number of archived reports and appointments.
+    """
+    if dry_run:
+        reports, appointments = select_archivable(cutoff)
+        return len(reports), len(appointments)
+
+    first = Report.objects.order_by("date").values_list("date", flat=True).first()
+    archived_reports = archived_appointments = 0
+    if first is None:
+        return archived_reports, archived_appointments
+
+    window = first
+    while window < cutoff:
+        window = min((window.replace(day=1) + timedelta(days=32)).replace(day=1), cutoff)
+        with transaction.atomic():
+            reports, appointments = select_archivable(window)
+            # Snapshot both before deleting, each snapshot nests the profits
+            archive_reports(reports, batch_size)
+            archive_appointments(appointments, batch_size)
+            # Deleting reports cascades to their profits and consumptions,
+            # neither of which adjusts doctor balances on delete
+            delete(Report, reports, batch_size)
+            delete(Appointment, appointments, batch_size)
+
+        archived_reports += len(reports)
+        archived_appointments += len(appointments)
+        if log:
+            log(
+                f"Before {window}: {len(reports)} reports, "
+                f"{len(appointments)} appointments"
+            )
+
+    return archived_reports, archived_appointments
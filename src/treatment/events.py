@@ -0,0 +1,130 @@
+import json
+import logging
+import time
+from functools import lru_cache, partial
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.db import transaction
+
+from core.renderers import ORJSONRenderer
+
+
+logger = logging.getLogger(__name__)
+
+# Events are published once, on the channel of their doctor and date.
+# Subscribers pick theirs with a pattern, so Redis does the filtering.
+CHANNEL = "events:doctor:{doctor}:date:{date}"
+
+# Events are dropped without trying Redis until then, after it failed
+_redis_down_until = 0
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """Client of the events Redis, one per process"""
+    return redis.Redis.from_url(
+        settings.EVENTS_REDIS_URL,
+        socket_timeout=settings.EVENTS_REDIS_TIMEOUT,
+        socket_connect_timeout=settings.EVENTS_REDIS_TIMEOUT,
+    )
+
+
+def get_async_redis():
+    """
+    Client for one stream. Pub/sub holds a connection per subscriber, and
+    async clients can not be shared between event loops.
+    """
+    return redis.asyncio.Redis.from_url(
+        settings.EVENTS_REDIS_URL,
+        socket_connect_timeout=settings.EVENTS_REDIS_TIMEOUT,
+    )
+
+
+def channel_pattern(doctor=None, date=None):
+    """Pattern of the channels with events of a doctor and a date, any if None"""
+    return CHANNEL.format(
+        doctor="*" if doctor is None else doctor,
+        date="*" if date is None else date,
+    )
+
+
+def _send(channel, message):
+    global _redis_down_until
+    if time.monotonic() < _redis_down_until:
+        return
+    try:
+        get_redis().publish(channel, message)
+    except redis.RedisError as e:
+        _redis_down_until = time.monotonic() + settings.EVENTS_REDIS_RETRY
+        logger.warning("Events are off for %ss: %s", settings.EVENTS_REDIS_RETRY, e)
+
+
+def publish(event, appointment, **data):
+    """Publish an event of ``appointment`` once the transaction commits"""
+    if not settings.EVENTS_REDIS_URL:
+        return
+    message = ORJSONRenderer().render(
+        {
+            "event": event,
+            "appointment": appointment.pk,
+            "doctor": appointment.doctor_id,
+            "date": appointment.date,
+            "status": appointment.status,
+            **data,
+        }
+    )
+    channel = CHANNEL.format(doctor=appointment.doctor_id or "", date=appointment.date)
+    transaction.on_commit(partial(_send, channel, message))
+
+
+def publish_appointment(appointment, created, old_status):
+    """Publish the create, update or status change of an appointment"""
+    if created:
+        publish("appointment.created", appointment)
+    elif old_status is not None and old_status != appointment.status:
+        publish("appointment.status", appointment, old_status=old_status)
+    else:
+        publish("appointment.updated", appointment)
+
+
+def publish_payment(profit):
+    publish(
+        "payment.created",
+        profit.appointment,
+        payment=profit.pk,
+        amount=profit.amount,
+        report_date=profit.report.date,
+    )
+
+
+async def stream(pattern):
+    """
+    Server-Sent Events of the channels matching ``pattern``. A comment is
+    sent when nothing happened for ``EVENTS_HEARTBEAT_SECONDS``, which
+    keeps proxies from closing the connection and ends the stream once the
+    client is gone. Missed events are not replayed, clients reload after
+    reconnecting.
+    """
+    client = get_async_redis()
+    pubsub = client.pubsub()
+    try:
+        await pubsub.psubscribe(pattern)
+        yield f"retry: {settings.EVENTS_RETRY_MILLISECONDS}\n\n"
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+            )
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            data = json.loads(message["data"])
+            yield f"event: {data['event']}\ndata: {message['data'].decode()}\n\n"
+    except redis.RedisError as e:
+        # The client reconnects after the retry delay
+        logger.warning("Event stream closed: %s", e)
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
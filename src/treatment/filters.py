@@ -40,7 +40,7 @@ class ReportFilter(filters.FilterSet):
 
 class SalaryFilter(filters.FilterSet):
     search = filters.CharFilter(
-        method="filter_search",
+        method="filter_doctor_by_names",
         label="Search by doctor's first_name, last_name, middle_name and date",
     )
 
@@ -48,7 +48,7 @@ class SalaryFilter(filters.FilterSet):
         model = Salary
         fields = ["doctor",]
 
-    def filter_patient_by_names(self, queryset, name, value):
+    def filter_doctor_by_names(self, queryset, name, value):
         return queryset.filter(
             Q(doctor__first_name__icontains=value)
             | Q(doctor__last_name__icontains=value)
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.renderers import ORJSONRenderer
+from .models import IdempotencyKey
+
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+
+
+def fingerprint(request):
+    """
+    Hash of what makes two requests the same write. The parsed data is
+    hashed rather than the body, which can not be read again once a CSRF
+    check has parsed a form.
+    """
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    digest = hashlib.sha256()
+    for part in (
+        request.method,
+        request.get_full_path(),
+        json.dumps(data, sort_keys=True, default=str),
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def replay(record, request_fingerprint):
+    if record.fingerprint != request_fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response, status=record.status_code)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(view_method):
+    """
+    Let clients retry a write action safely with an ``Idempotency-Key``
+    header. The first request runs in a transaction together with storing
+    its response, so a retry either waits for it and gets the same
+    response, or runs again when the first one failed.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_fingerprint = fingerprint(request)
+        records = IdempotencyKey.objects.filter(user=request.user, key=key)
+        expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        records.filter(created_at__lt=expired).delete()
+
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=request.user, key=key, fingerprint=request_fingerprint
+                )
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    # Forget the key and the writes, so a retry runs again
+                    transaction.set_rollback(True)
+                    return response
+
+                record.status_code = response.status_code
+                record.response = json.loads(ORJSONRenderer().render(response.data))
+                record.save(update_fields=["status_code", "response"])
+                return response
+        except IntegrityError:
+            record = records.first()
+            if record is None:
+                raise
+            return replay(record, request_fingerprint)
+
+    return wrapper
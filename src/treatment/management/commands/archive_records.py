@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from src.treatment.archive import archive_before
+
+
+class Command(BaseCommand):
+    help = (
+        "Move closed appointments and reports older than ARCHIVE_AFTER_DAYS "
+        "into the archive tables"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            type=date.fromisoformat,
+            help="Archive rows dated before this day, YYYY-MM-DD",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the rows that would be archived",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = options["before"] or timezone.localdate() - timedelta(
+            days=settings.ARCHIVE_AFTER_DAYS
+        )
+        reports, appointments = archive_before(
+            cutoff,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            log=self.stdout.write,
+        )
+
+        verb = "Would archive" if options["dry_run"] else "Archived"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {reports} reports and {appointments} appointments "
+                f"before {cutoff}"
+            )
+        )
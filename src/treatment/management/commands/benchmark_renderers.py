@@ -0,0 +1,88 @@
+import io
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer, orjson
+from src.treatment.models import Report
+from src.treatment.repository import ReportRepository
+from src.treatment.serializers import ReportCompiledSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSON renderer and parser with the orjson ones on a "
+        "report range payload, and check both render the same bytes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=31)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write(
+                self.style.WARNING("orjson is not installed, both sides use json")
+            )
+
+        dates = Report.objects.aggregate(first=Min("date"), last=Max("date"))
+        if dates["first"] is None:
+            raise CommandError("No reports found, run seed_load_data first.")
+
+        end_date = dates["last"]
+        start_date = max(
+            dates["first"], end_date - timedelta(days=options["days"] - 1)
+        )
+        data = ReportRepository.get_reports_in_range(start_date, end_date)
+        payload = {
+            "aggregated_totals": data["aggregated_totals"],
+            "reports": ReportCompiledSerializer(data["reports"], many=True).data,
+        }
+
+        repeat = options["repeat"]
+        json_time, json_output = self.measure(
+            lambda: JSONRenderer().render(payload), repeat
+        )
+        orjson_time, orjson_output = self.measure(
+            lambda: ORJSONRenderer().render(payload), repeat
+        )
+        if json_output != orjson_output:
+            raise CommandError("ORJSONRenderer output differs from JSONRenderer")
+
+        self.stdout.write(
+            f"{len(data['reports'])} reports from {start_date} to {end_date}, "
+            f"{len(json_output)} bytes"
+        )
+        self.report("render", json_time, orjson_time)
+
+        json_time, json_data = self.measure(
+            lambda: JSONParser().parse(io.BytesIO(json_output)), repeat
+        )
+        orjson_time, orjson_data = self.measure(
+            lambda: ORJSONParser().parse(io.BytesIO(json_output)), repeat
+        )
+        if json_data != orjson_data:
+            raise CommandError("ORJSONParser output differs from JSONParser")
+        self.report("parse", json_time, orjson_time)
+
+    def measure(self, function, repeat):
+        """Return the best time and the result of a function"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return min(timings), result
+
+    def report(self, name, json_time, orjson_time):
+        self.stdout.write(
+            f"{name:<8} json {json_time * 1000:>9.2f} ms  "
+            f"orjson {orjson_time * 1000:>9.2f} ms  "
+            f"speedup {json_time / orjson_time:.1f}x"
+        )
@@ -0,0 +1,83 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from rest_framework.renderers import JSONRenderer
+
+from src.treatment.models import Report
+from src.treatment.repository import AppointmentRepository, ReportRepository
+from src.treatment.serializers import (
+    AppointmentReadSerializer,
+    AppointmentReadCompiledSerializer,
+    ReportSerializer,
+    ReportCompiledSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF and compiled serializers for reports and appointments on "
+        "already fetched rows, and check both render the same JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=31)
+        parser.add_argument("--appointments", type=int, default=5_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        dates = Report.objects.aggregate(first=Min("date"), last=Max("date"))
+        if dates["first"] is None:
+            raise CommandError("No reports found, run seed_load_data first.")
+
+        end_date = dates["last"]
+        start_date = max(
+            dates["first"], end_date - timedelta(days=options["days"] - 1)
+        )
+        reports = list(
+            ReportRepository.get_reports_in_range(start_date, end_date)["reports"]
+        )
+        appointments = list(AppointmentRepository.get()[: options["appointments"]])
+
+        self.stdout.write(
+            f"{len(reports)} reports from {start_date} to {end_date}, "
+            f"{len(appointments)} appointments"
+        )
+        self.compare(
+            "reports",
+            ReportSerializer,
+            ReportCompiledSerializer,
+            reports,
+            options["repeat"],
+        )
+        self.compare(
+            "appointments",
+            AppointmentReadSerializer,
+            AppointmentReadCompiledSerializer,
+            appointments,
+            options["repeat"],
+        )
+
+    def measure(self, serializer_class, instances, repeat):
+        """Return the best time and the rendered output of a serializer"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serializer_class(instances, many=True).data
+            timings.append(time.perf_counter() - started)
+        return min(timings), JSONRenderer().render(data)
+
+    def compare(self, name, serializer_class, compiled_class, instances, repeat):
+        drf_time, drf_output = self.measure(serializer_class, instances, repeat)
+        compiled_time, compiled_output = self.measure(compiled_class, instances, repeat)
+
+        if drf_output != compiled_output:
+            raise CommandError(f"Compiled {name} output differs from DRF output")
+
+        self.stdout.write(
+            f"{name:<14} drf {drf_time * 1000:>9.2f} ms  "
+            f"compiled {compiled_time * 1000:>9.2f} ms  "
+            f"speedup {drf_time / compiled_time:.1f}x  ({len(drf_output)} bytes)"
+        )
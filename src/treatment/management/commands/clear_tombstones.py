@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from src.treatment.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = "Delete change feed tombstones older than CHANGE_FEED_TOMBSTONE_DAYS"
+
+    def handle(self, *args, **options):
+        expired = timezone.now() - timedelta(days=settings.CHANGE_FEED_TOMBSTONE_DAYS)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=expired).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones"))
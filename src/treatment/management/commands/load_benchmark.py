@@ -0,0 +1,328 @@
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from src.management.models import Admin, Doctor, Service
+from src.treatment.models import Appointment, Report
+from .seed_load_data import LOAD_PASSWORD
+
+
+SCENARIOS = [
+    "login",
+    "browse_doctors",
+    "browse_services",
+    "doctor_appointments",
+    "add_profit",
+    "report_range",
+]
+
+
+class InProcessDriver:
+    """Send requests through the WSGI handler without a network hop"""
+
+    name = "in-process"
+    # REMOTE_ADDR of the test client
+    address = "127.0.0.1"
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, data=None, token=None):
+        if not hasattr(self.local, "client"):
+            self.local.client = Client()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        if method == "get":
+            response = self.local.client.get(path, data, headers=headers)
+        else:
+            response = self.local.client.post(
+                path, data, content_type="application/json", headers=headers
+            )
+        return response.status_code, response.content
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpDriver:
+    """
+    Send requests to a running server. Requests that fail or time out get
+    status 0, which counts as an error instead of stopping the run.
+    """
+
+    def __init__(self, url, timeout):
+        self.name = url
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, data=None, token=None):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        try:
+            if method == "get":
+                response = self.local.session.get(
+                    self.url + path, params=data, headers=headers, timeout=self.timeout
+                )
+            else:
+                response = self.local.session.post(
+                    self.url + path, json=data, headers=headers, timeout=self.timeout
+                )
+        except requests.RequestException as e:
+            return 0, str(e).encode()
+        return response.status_code, response.content
+
+    def close(self):
+        pass
+
+
+def percentile(samples, n):
+    if len(samples) < 2:
+        return samples[0] if samples else None
+    return statistics.quantiles(samples, n=100, method="inclusive")[n - 1]
+
+
+def rounded(value):
+    return None if value is None else round(value, 2)
+
+
+def change(after, before):
+    """Relative change in percent, or None when a side has no value"""
+    if not after or not before:
+        return None
+    return (after / before - 1) * 100
+
+
+def format_number(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Run load scenarios against the API and report latency percentiles and "
+        "throughput. Expects data from seed_load_data; add_profit writes rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help=(
+                "Base url of a running server, requests go in-process if omitted. "
+                "Its THROTTLE_EXEMPT_ADDRESSES must include this host."
+            ),
+        )
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="Seconds to wait for a response with --url",
+        )
+        parser.add_argument("--output", help="Save results to this JSON file")
+        parser.add_argument("--compare", help="Previous JSON results to compare")
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write(
+                self.style.WARNING("DEBUG is on, results will not match production")
+            )
+
+        self.random = random.Random(options["seed"])
+        if options["url"]:
+            # Set up on the server, see --url
+            self.driver = HttpDriver(options["url"], options["timeout"])
+            exempt = nullcontext()
+        else:
+            self.driver = InProcessDriver()
+            # Scenarios log in far more often than the login throttle allows
+            exempt = override_settings(
+                THROTTLE_EXEMPT_ADDRESSES=[
+                    *settings.THROTTLE_EXEMPT_ADDRESSES,
+                    InProcessDriver.address,
+                ]
+            )
+        with exempt:
+            results = self.run_scenarios(options)
+
+        if options["compare"]:
+            self.compare(results, options["compare"])
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+    def run_scenarios(self, options):
+        self.load_targets()
+
+        results = {
+            "commit": current_commit(),
+            "timestamp": timezone.now().isoformat(),
+            "driver": self.driver.name,
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "scenarios": {},
+        }
+        for scenario in options["scenario"] or SCENARIOS:
+            calls = [
+                getattr(self, f"plan_{scenario}")()
+                for _ in range(options["requests"])
+            ]
+            results["scenarios"][scenario] = self.run(
+                calls, options["concurrency"]
+            )
+            self.report(scenario, results["scenarios"][scenario])
+        self.driver.close()
+        return results
+
+    def load_targets(self):
+        """Pick the users and rows the scenarios will hit"""
+        admin = Admin.objects.first()
+        self.doctors = list(
+            Doctor.objects.filter(appointments__isnull=False)
+            .distinct()
+            .values_list("id", "phone")[:50]
+        )
+        if admin is None or not self.doctors:
+            raise CommandError("No load data found, run seed_load_data first.")
+
+        self.services = list(Service.objects.values_list("slug", flat=True))
+        self.appointments = list(
+            Appointment.objects.order_by("-date").values_list("id", flat=True)[:1000]
+        )
+        self.dates = list(Report.objects.order_by("date").values_list("date", flat=True))
+
+        self.admin_token = self.login(admin.phone)
+        self.doctor_tokens = [self.login(phone) for _, phone in self.doctors[:10]]
+
+    def login(self, phone):
+        status, content = self.driver.request(
+            "post", "/api/token/", {"phone": phone, "password": LOAD_PASSWORD}
+        )
+        if status == 429:
+            raise CommandError(
+                f"Login throttled for {phone}, add this host to the server's "
+                "THROTTLE_EXEMPT_ADDRESSES."
+            )
+        if status != 200:
+            raise CommandError(f"Login failed for {phone}: {status}")
+        return json.loads(content)["access"]
+
+    def plan_login(self):
+        _, phone = self.random.choice(self.doctors)
+        return ("post", "/api/token/", {"phone": phone, "password": LOAD_PASSWORD}, None)
+
+    def plan_browse_doctors(self):
+        if self.random.random() < 0.5:
+            return ("get", "/doctors/", None, None)
+        doctor_id, _ = self.random.choice(self.doctors)
+        return ("get", f"/doctors/{doctor_id}/", None, None)
+
+    def plan_browse_services(self):
+        if self.random.random() < 0.5:
+            return ("get", "/services/", None, None)
+        return ("get", f"/services/{self.random.choice(self.services)}/", None, None)
+
+    def plan_doctor_appointments(self):
+        return (
+            "get",
+            "/appointments/",
+            {"date": str(self.random.choice(self.dates))},
+            self.random.choice(self.doctor_tokens),
+        )
+
+    def plan_add_profit(self):
+        return (
+            "post",
+            f"/appointments/{self.random.choice(self.appointments)}/add_profit/",
+            {"date": str(self.dates[-1]), "amount": "1000.00"},
+            self.admin_token,
+        )
+
+    def plan_report_range(self):
+        start = self.random.randrange(len(self.dates))
+        end_date = min(self.dates[start] + timedelta(days=30), self.dates[-1])
+        return (
+            "get",
+            "/reports/range/",
+            {"start_date": str(self.dates[start]), "end_date": str(end_date)},
+            self.admin_token,
+        )
+
+    def run(self, calls, concurrency):
+        def call(spec):
+            method, path, data, token = spec
+            started = time.perf_counter()
+            status, _ = self.driver.request(method, path, data, token)
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(call, calls))
+        elapsed = time.perf_counter() - started
+
+        # Failed requests have no response to time
+        latencies = [latency * 1000 for latency, status in samples if status]
+        return {
+            "count": len(samples),
+            "errors": sum(1 for _, status in samples if not status or status >= 400),
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(samples) / elapsed, 2) if samples else None,
+            "mean": rounded(statistics.fmean(latencies) if latencies else None),
+            "p50": rounded(percentile(latencies, 50)),
+            "p95": rounded(percentile(latencies, 95)),
+            "p99": rounded(percentile(latencies, 99)),
+        }
+
+    def report(self, scenario, result):
+        self.stdout.write(
+            f"{scenario:<20} {format_number(result['throughput'], '>9.2f')} req/s  "
+            f"p50 {format_number(result['p50'], '>8.2f')} ms  "
+            f"p95 {format_number(result['p95'], '>8.2f')} ms  "
+            f"p99 {format_number(result['p99'], '>8.2f')} ms  "
+            f"errors {result['errors']}"
+        )
+
+    def compare(self, results, path):
+        with open(path) as file:
+            previous = json.load(file)
+
+        self.stdout.write(f"Compared to {previous.get('commit')} ({path}):")
+        for scenario, result in results["scenarios"].items():
+            before = previous["scenarios"].get(scenario)
+            if not before:
+                continue
+            throughput = change(result["throughput"], before["throughput"])
+            p95 = change(result["p95"], before["p95"])
+            self.stdout.write(
+                f"{scenario:<20} throughput {format_number(throughput, '+.1f')}%  "
+                f"p95 {format_number(p95, '+.1f')}%"
+            )
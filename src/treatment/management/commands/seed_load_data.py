@@ -0,0 +1,382 @@
+import random
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.utils.text import slugify
+
+from src.management.choices import CategoryChoices
+from src.management.models import User, Admin, Doctor, Patient, Specialty, Service
+from src.treatment.choices import StatusChoices
+from src.treatment.models import Appointment, Report, Profit, Consumption, Salary
+
+
+PRESETS = {
+    "tiny": {
+        "doctors": 5,
+        "patients": 50,
+        "appointments": 200,
+        "days": 31,
+    },
+    "small": {
+        "doctors": 20,
+        "patients": 2_000,
+        "appointments": 10_000,
+        "days": 90,
+    },
+    "medium": {
+        "doctors": 200,
+        "patients": 50_000,
+        "appointments": 250_000,
+        "days": 365,
+    },
+    "large": {
+        "doctors": 2_000,
+        "patients": 300_000,
+        "appointments": 3_000_000,
+        "days": 3 * 365,
+    },
+}
+
+# Every generated user logs in with this password (see the load benchmark)
+LOAD_PASSWORD = "dr-load"
+ADMIN_PHONE = "+998700000000"
+DOCTOR_PHONE_PREFIX = "+99871"
+PATIENT_PHONE_PREFIX = "+99872"
+
+SPECIALTIES = 12
+SERVICES = 60
+PRICE_STEP = 1_000
+
+
+class Command(BaseCommand):
+    help = "Generate deterministic synthetic data for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", choices=PRESETS, default="small")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--chunk-size", type=int, default=5_000)
+        parser.add_argument(
+            "--start-date",
+            type=date.fromisoformat,
+            default=date(2022, 1, 1),
+            help="First report date, YYYY-MM-DD",
+        )
+        parser.add_argument(
+            "--today",
+            type=date.fromisoformat,
+            help="Appointments after this date are left unpaid, YYYY-MM-DD, "
+            "defaults to the last report date",
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(phone__startswith=DOCTOR_PHONE_PREFIX).exists():
+            raise CommandError(
+                "Load data already exists, run it against an empty database."
+            )
+
+        preset = PRESETS[options["size"]]
+        self.random = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.password = make_password(LOAD_PASSWORD)
+        self.balances = defaultdict(Decimal)
+
+        start_date = options["start_date"]
+        end_date = start_date + timedelta(days=preset["days"] - 1)
+        # A fixed date, so a seed always generates the same data
+        today = options["today"] or end_date
+
+        self.create_admin()
+        specialties = self.create_specialties()
+        services = self.create_services()
+        doctors = self.create_doctors(preset["doctors"], specialties)
+        patients = self.create_patients(preset["patients"])
+        reports = self.create_reports(start_date, end_date)
+        self.create_appointments(
+            preset["appointments"], doctors, patients, services, reports, today
+        )
+        self.create_consumptions(reports)
+        self.create_salaries(doctors, reports)
+        self.update_balances(doctors)
+
+        self.stdout.write(self.style.SUCCESS("Load data generated"))
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def chunks(self, items):
+        for start in range(0, len(items), self.chunk_size):
+            yield items[start : start + self.chunk_size]
+
+    def bulk_create_child(self, model, objs):
+        """
+        bulk_create() refuses multi-table children, so create the parent rows
+        first and insert the child table rows with the parent pks.
+        """
+        parent_model, parent_link = next(iter(model._meta.parents.items()))
+        db = router.db_for_write(model)
+        fields = model._meta.local_concrete_fields
+
+        parents = parent_model.objects.bulk_create(
+            [
+                parent_model(
+                    **{
+                        field.attname: getattr(obj, field.attname)
+                        for field in parent_model._meta.concrete_fields
+                    }
+                )
+                for obj in objs
+            ]
+        )
+        for obj, parent in zip(objs, parents):
+            setattr(obj, parent_link.attname, parent.pk)
+            obj.pk = parent.pk
+            for field in parent_model._meta.concrete_fields:
+                setattr(obj, field.attname, getattr(parent, field.attname))
+
+        batch_size = connections[db].ops.bulk_batch_size(fields, objs)
+        for start in range(0, len(objs), batch_size):
+            model._base_manager._insert(
+                objs[start : start + batch_size], fields=fields, raw=True, using=db
+            )
+        return objs
+
+    def create_admin(self):
+        if not Admin.objects.exists():
+            Admin.objects.create(
+                phone=ADMIN_PHONE, first_name="Admin", password=self.password
+            )
+
+    def create_specialties(self):
+        self.log("Creating specialties")
+        return Specialty.objects.bulk_create(
+            [
+                Specialty(
+                    name_en=f"Specialty {i}",
+                    name_ru=f"Специальность {i}",
+                    name_uz=f"Mutaxassislik {i}",
+                    image=f"specialties/specialty-{i}.png",
+                    is_published=True,
+                )
+                for i in range(SPECIALTIES)
+            ]
+        )
+
+    def create_services(self):
+        self.log("Creating services")
+        categories = CategoryChoices.values
+        services = []
+        for i in range(SERVICES):
+            price_start = self.random.randrange(50, 500) * PRICE_STEP
+            services.append(
+                Service(
+                    name_en=f"Service {i}",
+                    name_ru=f"Услуга {i}",
+                    name_uz=f"Xizmat {i}",
+                    slug=slugify(f"Service {i}"),
+                    category=categories[i % len(categories)],
+                    price_start=price_start,
+                    price_end=price_start + self.random.randrange(0, 500) * PRICE_STEP,
+                    kpi_percent=self.random.randrange(10, 51, 5),
+                )
+            )
+        return Service.objects.bulk_create(services)
+
+    def user_fields(self, phone, first_name, last_name, user_type):
+        return {
+            "phone": phone,
+            "username": phone,
+            "password": self.password,
+            "first_name": first_name,
+            "last_name": last_name,
+            "user_type": user_type,
+            "birth_date": date(1950, 1, 1)
+            + timedelta(days=self.random.randrange(365 * 55)),
+        }
+
+    def create_doctors(self, count, specialties):
+        self.log(f"Creating {count} doctors")
+        doctors = []
+        for chunk in self.chunks(range(count)):
+            with transaction.atomic():
+                objs = self.bulk_create_child(
+                    Doctor,
+                    [
+                        Doctor(
+                            **self.user_fields(
+                                f"{DOCTOR_PHONE_PREFIX}{i:07d}",
+                                f"Doctor{i}",
+                                f"Doc{i}",
+                                "DOCTOR",
+                            ),
+                            experience=self.random.randrange(1, 40),
+                        )
+                        for i in chunk
+                    ],
+                )
+                Doctor.specialties.through.objects.bulk_create(
+                    [
+                        Doctor.specialties.through(
+                            doctor_id=doctor.pk, specialty_id=specialty.pk
+                        )
+                        for doctor in objs
+                        for specialty in self.random.sample(
+                            specialties, self.random.randrange(1, 4)
+                        )
+                    ]
+                )
+            doctors.extend(objs)
+        return doctors
+
+    def create_patients(self, count):
+        self.log(f"Creating {count} patients")
+        patients = []
+        for chunk in self.chunks(range(count)):
+            with transaction.atomic():
+                objs = self.bulk_create_child(
+                    Patient,
+                    [
+                        Patient(
+                            **self.user_fields(
+                                f"{PATIENT_PHONE_PREFIX}{i:07d}",
+                                f"Patient{i}",
+                                f"Pat{i}",
+                                "PATIENT",
+                            )
+                        )
+                        for i in chunk
+                    ],
+                )
+            patients.extend(patient.pk for patient in objs)
+            self.log(f"  {len(patients)}/{count}")
+        return patients
+
+    def create_reports(self, start_date, end_date):
+        self.log(f"Creating reports from {start_date} to {end_date}")
+        days = (end_date - start_date).days + 1
+        reports = Report.objects.bulk_create(
+            [Report(date=start_date + timedelta(days=i)) for i in range(days)],
+            batch_size=self.chunk_size,
+        )
+        return reports
+
+    def generate_profits(self, appointment, service, reports, index):
+        """Split the paid part of an appointment price into profits"""
+        roll = self.random.random()
+        if roll < 0.05:
+            return StatusChoices.CANCELLED, []
+        if roll < 0.15:
+            return StatusChoices.UNPAID, []
+
+        price = int(appointment.price) // PRICE_STEP
+        if roll < 0.35 and price > 1:
+            paid = self.random.randrange(1, price)
+            status = StatusChoices.PARTIALLY_PAID
+        else:
+            paid = price
+            status = StatusChoices.FULLY_PAID
+
+        parts = min(self.random.randrange(1, 4), paid)
+        cuts = sorted(self.random.sample(range(1, paid), parts - 1)) if parts > 1 else []
+        profits = []
+        for start, end in zip([0, *cuts], [*cuts, paid]):
+            offset = min(index + self.random.randrange(0, 3), len(reports) - 1)
+            amount = Decimal((end - start) * PRICE_STEP)
+            profits.append(
+                Profit(report=reports[offset], appointment=appointment, amount=amount)
+            )
+            self.balances[appointment.doctor_id] += amount * service.kpi_percent / 100
+        return status, profits
+
+    def create_appointments(
+        self, count, doctors, patients, services, reports, today
+    ):
+        self.log(f"Creating {count} appointments")
+        created = 0
+        for chunk in self.chunks(range(count)):
+            appointments, payments = [], []
+            for _ in chunk:
+                index = self.random.randrange(len(reports))
+                service = self.random.choice(services)
+                start = self.random.randrange(8 * 60, 19 * 60, 15)
+                appointment = Appointment(
+                    patient_id=self.random.choice(patients),
+                    doctor_id=self.random.choice(doctors).pk,
+                    service_id=service.pk,
+                    price=self.random.randrange(
+                        int(service.price_start), int(service.price_end) + 1, PRICE_STEP
+                    ),
+                    start_time=time(start // 60, start % 60),
+                    end_time=time(start // 60 + 1, start % 60),
+                    date=reports[index].date,
+                )
+                if appointment.date <= today:
+                    appointment.status, profits = self.generate_profits(
+                        appointment, service, reports, index
+                    )
+                    payments.append(profits)
+                else:
+                    payments.append([])
+                appointments.append(appointment)
+
+            with transaction.atomic():
+                Appointment.objects.bulk_create(appointments)
+                profits = []
+                for appointment, appointment_profits in zip(appointments, payments):
+                    for profit in appointment_profits:
+                        profit.appointment = appointment
+                        profits.append(profit)
+                Profit.objects.bulk_create(profits, batch_size=self.chunk_size)
+
+            created += len(appointments)
+            self.log(f"  {created}/{count}")
+
+    def create_consumptions(self, reports):
+        self.log("Creating consumptions")
+        consumptions = [
+            Consumption(
+                report=report,
+                title=f"Consumption {report.date}-{i}",
+                amount=self.random.randrange(10, 500) * PRICE_STEP,
+            )
+            for report in reports
+            for i in range(self.random.randrange(0, 4))
+        ]
+        for chunk in self.chunks(consumptions):
+            Consumption.objects.bulk_create(chunk)
+
+    def create_salaries(self, doctors, reports):
+        """Pay every doctor once a month, on the last report of the month"""
+        self.log("Creating salaries")
+        paydays = [
+            report
+            for report in reports
+            if report.date.day == monthrange(report.date.year, report.date.month)[1]
+        ]
+        salaries = []
+        for report in paydays:
+            for doctor in doctors:
+                amount = Decimal(self.random.randrange(100, 2_000) * PRICE_STEP)
+                salaries.append(
+                    Salary(
+                        report=report,
+                        doctor_id=doctor.pk,
+                        title=f"Salary {report.date:%Y-%m}",
+                        amount=amount,
+                    )
+                )
+                self.balances[doctor.pk] -= amount
+
+        for chunk in self.chunks(salaries):
+            with transaction.atomic():
+                self.bulk_create_child(Salary, chunk)
+
+    def update_balances(self, doctors):
+        self.log("Updating doctor balances")
+        for doctor in doctors:
+            doctor.balance = self.balances[doctor.pk]
+        Doctor.objects.bulk_update(doctors, ["balance"], batch_size=self.chunk_size)
@@ -1,7 +1,8 @@
 from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
-from src.management.models import Patient, Doctor, Service
+from src.management.models import User, Patient, Doctor, Service
 from .choices import StatusChoices
+from .events import publish_appointment, publish_payment
 from .services import (
     update_appointment_status,
     update_doctor_balance_on_profit,
@@ -51,14 +52,30 @@ class Appointment(models.Model):
     class Meta:
         verbose_name = _("Appointment")
         verbose_name_plural = _("Appointments")
+        indexes = [
+            # Patient history, newest first
+            models.Index(fields=["patient", "date"], name="appointment_patient_date"),
+            # Change feed keyset
+            models.Index(fields=["updated_at", "id"], name="appointment_updated_at_id"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.patient.first_name} - {self.service.name_en}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status as loaded, to publish status changes
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
     def save(self, *args, **kwargs):
+        created = self._state.adding
         if self.pk:
             self = update_appointment_status(self)
         super().save(*args, **kwargs)
+        publish_appointment(self, created, getattr(self, "_loaded_status", None))
+        self._loaded_status = self.status
 
 
 class Report(models.Model):
@@ -72,6 +89,10 @@ class Report(models.Model):
     class Meta:
         verbose_name = _("Report")
         verbose_name_plural = _("Reports")
+        indexes = [
+            # Change feed keyset
+            models.Index(fields=["updated_at", "id"], name="report_updated_at_id"),
+        ]
 
 
 class Profit(models.Model):
@@ -104,8 +125,11 @@ class Profit(models.Model):
 
     @transaction.atomic
     def save(self, *args, **kwargs):
+        created = self._state.adding
         self = update_doctor_balance_on_profit(self)
         super().save(*args, **kwargs)
+        if created:
+            publish_payment(self)
 
 
 class Consumption(models.Model):
@@ -157,3 +181,124 @@ class Salary(Consumption):
     def save(self, *args, **kwargs):
         self = update_doctor_balance_on_salary(self)
         super().save(*args, **kwargs)
+
+
+class ArchivedReport(models.Model):
+    """Report of a closed period, moved out of the live tables by archive_records"""
+
+    date = models.DateField(verbose_name=_("Date"), unique=True)
+    total_profit = models.DecimalField(
+        verbose_name=_("Total profit"), max_digits=13, decimal_places=2
+    )
+    total_consumption = models.DecimalField(
+        verbose_name=_("Total consumption"), max_digits=13, decimal_places=2
+    )
+    data = models.BinaryField(verbose_name=_("Compressed report data"))
+
+    archived_at = models.DateTimeField(verbose_name=_("Archived at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Archived report")
+        verbose_name_plural = _("Archived reports")
+
+
+class ArchivedEarning(models.Model):
+    """KPI earnings of a doctor kept by an archived report"""
+
+    report = models.ForeignKey(
+        verbose_name=_("Archived report"),
+        to=ArchivedReport,
+        on_delete=models.CASCADE,
+        related_name="doctor_earnings",
+    )
+    doctor = models.ForeignKey(
+        verbose_name=_("Doctor"),
+        to=Doctor,
+        on_delete=models.CASCADE,
+        related_name="archived_earnings",
+    )
+    amount = models.DecimalField(
+        verbose_name=_("KPI earnings"), max_digits=13, decimal_places=2
+    )
+
+    class Meta:
+        verbose_name = _("Archived earning")
+        verbose_name_plural = _("Archived earnings")
+
+
+class ArchivedAppointment(models.Model):
+    """Closed appointment, moved out of the live tables by archive_records"""
+
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(
+        verbose_name=_("Patient"),
+        to=Patient,
+        on_delete=models.CASCADE,
+        related_name="archived_appointments",
+    )
+    doctor = models.ForeignKey(
+        verbose_name=_("Doctor"),
+        to=Doctor,
+        on_delete=models.SET_NULL,
+        related_name="archived_appointments",
+        null=True,
+    )
+    status = models.CharField(
+        verbose_name=_("Status"), max_length=2, choices=StatusChoices.choices
+    )
+    start_time = models.TimeField(verbose_name=_("Start time"))
+    end_time = models.TimeField(verbose_name=_("End time"), null=True, blank=True)
+    date = models.DateField(verbose_name=_("Date"), db_index=True)
+    data = models.BinaryField(verbose_name=_("Compressed appointment data"))
+
+    archived_at = models.DateTimeField(verbose_name=_("Archived at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Archived appointment")
+        verbose_name_plural = _("Archived appointments")
+
+
+class IdempotencyKey(models.Model):
+    """Response of a write request, replayed when the client retries it"""
+
+    user = models.ForeignKey(
+        verbose_name=_("User"),
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    key = models.CharField(verbose_name=_("Key"), max_length=255)
+    fingerprint = models.CharField(verbose_name=_("Request fingerprint"), max_length=64)
+    status_code = models.PositiveSmallIntegerField(
+        verbose_name=_("Status code"), null=True
+    )
+    response = models.JSONField(verbose_name=_("Response"), null=True)
+
+    created_at = models.DateTimeField(
+        verbose_name=_("Created at"), auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        verbose_name = _("Idempotency key")
+        verbose_name_plural = _("Idempotency keys")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_per_user"
+            )
+        ]
+
+
+class Tombstone(models.Model):
+    """Id of a deleted row, so change feed clients can drop their copy"""
+
+    feed = models.CharField(verbose_name=_("Feed"), max_length=30)
+    object_id = models.BigIntegerField(verbose_name=_("Object id"))
+
+    deleted_at = models.DateTimeField(
+        verbose_name=_("Deleted at"), auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        verbose_name = _("Tombstone")
+        verbose_name_plural = _("Tombstones")
+        indexes = [models.Index(fields=["feed", "id"], name="tombstone_feed_id")]
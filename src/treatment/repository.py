@@ -1,136 +1,234 @@
-from django.db.models import Sum, DecimalField, ExpressionWrapper
+import json
+import zlib
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Max, Sum, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery
 from django.db.models.functions import Coalesce
 from django.db.models import Prefetch
-from .models import Appointment, Report, Profit, Consumption, Salary
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from core.renderers import ORJSONRenderer
+from src.management.models import Doctor
+from .choices import StatusChoices
+from .events import publish_appointment
+from .services import set_appointment_status
+from .models import (
+    Appointment,
+    Report,
+    Profit,
+    Consumption,
+    Salary,
+    ArchivedReport,
+    ArchivedEarning,
+    ArchivedAppointment,
+    Tombstone,
+)
 
 
 class AppointmentRepository:
     @staticmethod
-    def get():
-        """Optimize queryset by selecting related objects."""
-        return Appointment.objects.all().select_related("doctor", "patient", "service")
+    def get(expand=("doctor", "patient", "service", "profits")):
+        """
+        Optimize queryset by selecting the expanded forward relations and
+        prefetching the expanded reverse ones.
+        """
+        queryset = Appointment.objects.all()
+        for name in expand:
+            if Appointment._meta.get_field(name).concrete:
+                queryset = queryset.select_related(name)
+            else:
+                queryset = queryset.prefetch_related(name)
+        return queryset
 
-
-class ReportRepository:
     @staticmethod
-    def get():
-        """Annotate total profit, total consumption, and net profit for reports."""
-        reports = (
-            Report.objects.all()
+    def get_patient_history(patient_id):
+        """
+        Appointments of a patient with doctor, service and payments, and
+        the paid and outstanding amounts summed in a subquery
+        """
+        paid = Coalesce(
+            Subquery(
+                Profit.objects.filter(appointment=OuterRef("pk"))
+                .values("appointment")
+                .annotate(total=Sum("amount"))
+                .values("total")
+            ),
+            0,
+            output_field=DecimalField(max_digits=11, decimal_places=2),
+        )
+        return (
+            Appointment.objects.filter(patient_id=patient_id)
+            .select_related("doctor", "service")
             .prefetch_related(
                 Prefetch(
                     "profits",
-                    queryset=Profit.objects.all().select_related(
-                        "appointment",
-                        "appointment__patient__user_ptr",
-                        "appointment__doctor__user_ptr",
-                        "appointment__service",
-                    ),
-                ),
-                Prefetch(
-                    "consumptions",
-                    queryset=Consumption.objects.all().select_related(
-                        "salary", "salary__doctor__user_ptr"
-                    ),
-                ),
+                    queryset=Profit.objects.select_related("report").order_by("id"),
+                )
             )
             .annotate(
-                total_profit=Coalesce(
-                    Sum("profits__amount"), 0, output_field=DecimalField()
-                ),
-                total_consumption=Coalesce(
-                    Sum("consumptions__amount"), 0, output_field=DecimalField()
-                ),
-                net_profit=ExpressionWrapper(
-                    Coalesce(Sum("profits__amount"), 0, output_field=DecimalField())
-                    - Coalesce(
-                        Sum("consumptions__amount"), 0, output_field=DecimalField()
-                    ),
+                paid=paid,
+                outstanding=ExpressionWrapper(
+                    F("price") - paid,
                     output_field=DecimalField(max_digits=11, decimal_places=2),
                 ),
             )
         )
-        return reports
 
     @staticmethod
-    def get_annotated_report(report_id):
-        """Helper method to get annotated report by id"""
-        report = (
-            Report.objects.filter(id=report_id)
-            .prefetch_related(
-                Prefetch(
-                    "profits",
-                    queryset=Profit.objects.all().select_related(
-                        "appointment",
-                        "appointment__patient__user_ptr",
-                        "appointment__doctor__user_ptr",
-                        "appointment__service",
-                    ),
-                ),
-                Prefetch(
-                    "consumptions",
-                    queryset=Consumption.objects.all().select_related(
-                        "salary", "salary__doctor__user_ptr"
-                    ),
-                ),
+    def get_bookings(keys, exclude_ids):
+        """
+        Start and end times of the appointments booked for the given
+        ``(doctor id, date)`` keys, cancelled and ``exclude_ids`` left out
+        """
+        if not keys:
+            return []
+        bookings = (
+            Appointment.objects.filter(
+                doctor_id__in={doctor_id for doctor_id, _ in keys},
+                date__in={date for _, date in keys},
             )
-            .annotate(
-                total_profit=Coalesce(
-                    Sum("profits__amount"), 0, output_field=DecimalField()
-                ),
-                total_consumption=Coalesce(
-                    Sum("consumptions__amount"), 0, output_field=DecimalField()
+            .exclude(status=StatusChoices.CANCELLED)
+            .exclude(pk__in=exclude_ids)
+            .values_list("doctor_id", "date", "start_time", "end_time")
+        )
+        return [booking for booking in bookings if booking[:2] in keys]
+
+    @staticmethod
+    @transaction.atomic
+    def save_batch(items, instances):
+        """
+        Create the items without an ``id`` and update the ``instances`` of
+        the others, in one ``bulk_create`` and one ``bulk_update``. Statuses
+        of updated appointments follow their payments, as on ``save()``.
+        """
+        now = timezone.now()
+        appointments, created, updated = [], [], []
+        for item in items:
+            item = dict(item)
+            pk = item.pop("id", None)
+            if pk is None:
+                appointment = Appointment(**item)
+                created.append(appointment)
+            else:
+                appointment = instances[pk]
+                for attr, value in item.items():
+                    setattr(appointment, attr, value)
+                # bulk_update() does not touch auto_now fields
+                appointment.updated_at = now
+                updated.append(appointment)
+            appointments.append((appointment, pk is None))
+
+        Appointment.objects.bulk_create(created)
+        if updated:
+            paid = dict(
+                Profit.objects.filter(appointment__in=updated)
+                .values("appointment")
+                .annotate(total=Sum("amount"))
+                .values_list("appointment", "total")
+            )
+            for appointment in updated:
+                set_appointment_status(appointment, paid.get(appointment.pk, 0))
+            Appointment.objects.bulk_update(
+                updated,
+                [
+                    field.name
+                    for field in Appointment._meta.concrete_fields
+                    if not field.primary_key and field.name != "created_at"
+                ],
+            )
+
+        for appointment, is_new in appointments:
+            publish_appointment(
+                appointment, is_new, getattr(appointment, "_loaded_status", None)
+            )
+        return [appointment for appointment, _ in appointments]
+
+
+class ReportRepository:
+    @staticmethod
+    def _sum_amount(model):
+        """Subquery summing ``model.amount`` per report"""
+        return Coalesce(
+            Subquery(
+                model.objects.filter(report=OuterRef("pk"))
+                .values("report")
+                .annotate(total=Sum("amount"))
+                .values("total")
+            ),
+            0,
+            output_field=DecimalField(),
+        )
+
+    @staticmethod
+    def _annotate(queryset):
+        """
+        Prefetch profits and consumptions and annotate total profit, total
+        consumption, and net profit. Totals are subqueries, since summing
+        both joined relations in one query would multiply them.
+        """
+        return queryset.prefetch_related(
+            Prefetch(
+                "profits",
+                queryset=Profit.objects.all().select_related(
+                    "appointment",
+                    "appointment__patient__user_ptr",
+                    "appointment__doctor__user_ptr",
+                    "appointment__service",
                 ),
-                net_profit=ExpressionWrapper(
-                    Coalesce(Sum("profits__amount"), 0, output_field=DecimalField())
-                    - Coalesce(
-                        Sum("consumptions__amount"), 0, output_field=DecimalField()
-                    ),
-                    output_field=DecimalField(max_digits=11, decimal_places=2),
+            ),
+            Prefetch(
+                "consumptions",
+                queryset=Consumption.objects.all().select_related(
+                    "salary", "salary__doctor__user_ptr"
                 ),
-            )
-            .first()
+            ),
+        ).annotate(
+            total_profit=ReportRepository._sum_amount(Profit),
+            total_consumption=ReportRepository._sum_amount(Consumption),
+            net_profit=ExpressionWrapper(
+                F("total_profit") - F("total_consumption"),
+                output_field=DecimalField(max_digits=11, decimal_places=2),
+            ),
+        )
+
+    @staticmethod
+    def get():
+        """Annotate total profit, total consumption, and net profit for reports."""
+        return ReportRepository._annotate(Report.objects.all())
+
+    @staticmethod
+    def get_or_create_for_date(date):
+        """
+        Return the report for ``date``, creating it or touching its
+        ``updated_at`` in one ``INSERT ... ON CONFLICT`` statement, so
+        concurrent first writes of a day do not collide on the unique date.
+        """
+        report = Report(date=date)
+        Report.objects.bulk_create(
+            [report],
+            update_conflicts=True,
+            unique_fields=["date"],
+            update_fields=["updated_at"],
         )
+        if report.pk is None:
+            # Backends without RETURNING on upserts
+            report = Report.objects.get(date=date)
         return report
 
+    @staticmethod
+    def get_annotated_report(report_id):
+        """Helper method to get annotated report by id"""
+        return ReportRepository._annotate(Report.objects.filter(id=report_id)).first()
+
     @staticmethod
     def get_reports_in_range(start_date, end_date):
         """Retrieve individual reports and aggregated totals within the specified date range."""
         # Get individual reports within the date range
-        reports = (
+        reports = ReportRepository._annotate(
             Report.objects.filter(date__range=(start_date, end_date))
-            .prefetch_related(
-                Prefetch(
-                    "profits",
-                    queryset=Profit.objects.all().select_related(
-                        "appointment",
-                        "appointment__patient__user_ptr",
-                        "appointment__doctor__user_ptr",
-                        "appointment__service",
-                    ),
-                ),
-                Prefetch(
-                    "consumptions",
-                    queryset=Consumption.objects.all().select_related(
-                        "salary", "salary__doctor__user_ptr"
-                    ),
-                ),
-            )
-            .annotate(
-                total_profit=Coalesce(
-                    Sum("profits__amount"), 0, output_field=DecimalField()
-                ),
-                total_consumption=Coalesce(
-                    Sum("consumptions__amount"), 0, output_field=DecimalField()
-                ),
-                net_profit=ExpressionWrapper(
-                    Coalesce(Sum("profits__amount"), 0, output_field=DecimalField())
-                    - Coalesce(
-                        Sum("consumptions__amount"), 0, output_field=DecimalField()
-                    ),
-                    output_field=DecimalField(max_digits=11, decimal_places=2),
-                ),
-            )
         )
 
         # Calculate aggregated totals across all reports in Python
@@ -153,3 +251,237 @@ class SalaryRepository:
     def get():
         """Optimize queryset by selecting related objects."""
         return Salary.objects.all().select_related("doctor")
+
+
+class DashboardRepository:
+    @staticmethod
+    def get_appointments(doctor, today, limit):
+        """Today's and upcoming appointments of a doctor, cancelled ones left out"""
+        return (
+            Appointment.objects.filter(doctor=doctor, date__gte=today)
+            .exclude(status=StatusChoices.CANCELLED)
+            .select_related("patient", "service")
+            .order_by("date", "start_time")[:limit]
+        )
+
+    @staticmethod
+    def get_earnings(doctor, today):
+        """KPI earnings of a doctor this month and last month, in one query"""
+        this_month = today.replace(day=1)
+        last_month = (this_month - timedelta(days=1)).replace(day=1)
+        next_month = (this_month + timedelta(days=31)).replace(day=1)
+        output_field = DecimalField(max_digits=11, decimal_places=2)
+        earning = ExpressionWrapper(
+            F("amount") * F("appointment__service__kpi_percent") / 100,
+            output_field=output_field,
+        )
+
+        return Profit.objects.filter(
+            appointment__doctor=doctor,
+            report__date__gte=last_month,
+            report__date__lt=next_month,
+        ).aggregate(
+            this_month=Coalesce(
+                Sum(earning, filter=Q(report__date__gte=this_month)),
+                0,
+                output_field=output_field,
+            ),
+            last_month=Coalesce(
+                Sum(earning, filter=Q(report__date__lt=this_month)),
+                0,
+                output_field=output_field,
+            ),
+        )
+
+    @staticmethod
+    def get_salaries(doctor, limit):
+        """Latest salary payouts of a doctor"""
+        return (
+            Salary.objects.filter(doctor=doctor)
+            .select_related("report")
+            .order_by("-report__date", "-id")[:limit]
+        )
+
+
+class AnalyticsRepository:
+    @staticmethod
+    def _kpi_earnings():
+        return Sum(
+            F("amount") * F("appointment__service__kpi_percent") / 100,
+            output_field=DecimalField(max_digits=13, decimal_places=2),
+        )
+
+    @staticmethod
+    def get_report_earnings(report_ids):
+        """``(report, doctor, KPI earnings)`` rows, kept by archived reports"""
+        return (
+            Profit.objects.filter(
+                report_id__in=report_ids, appointment__doctor__isnull=False
+            )
+            .values("report", "appointment__doctor")
+            .annotate(total=AnalyticsRepository._kpi_earnings())
+            .values_list("report", "appointment__doctor", "total")
+        )
+
+    @staticmethod
+    def _sum_by_doctor(queryset, doctor, total):
+        """Subquery summing ``total`` of ``queryset`` per doctor"""
+        return Coalesce(
+            Subquery(
+                queryset.filter(**{doctor: OuterRef("pk")})
+                .values(doctor)
+                .annotate(total=total)
+                .values("total")
+            ),
+            0,
+            output_field=DecimalField(max_digits=13, decimal_places=2),
+        )
+
+    @staticmethod
+    def get_doctor_earnings(start_date, end_date, ordering):
+        """
+        KPI earnings, salary paid and net payable of every doctor within the
+        date range, sorted by ``ordering``. Payments, archived earnings and
+        salaries are each summed per doctor in a subquery over the range,
+        so sorting and paging happen in the database.
+        """
+        date_range = (start_date, end_date)
+        live = AnalyticsRepository._sum_by_doctor(
+            Profit.objects.filter(report__date__range=date_range),
+            "appointment__doctor",
+            AnalyticsRepository._kpi_earnings(),
+        )
+        archived = AnalyticsRepository._sum_by_doctor(
+            ArchivedEarning.objects.filter(report__date__range=date_range),
+            "doctor",
+            Sum("amount"),
+        )
+        salary_paid = AnalyticsRepository._sum_by_doctor(
+            Salary.objects.filter(report__date__range=date_range),
+            "doctor",
+            Sum("amount"),
+        )
+        return (
+            Doctor.objects.annotate(
+                kpi_earnings=live + archived, salary_paid=salary_paid
+            )
+            .annotate(net_payable=F("kpi_earnings") - F("salary_paid"))
+            .values(
+                "id",
+                "first_name",
+                "last_name",
+                "middle_name",
+                "kpi_earnings",
+                "salary_paid",
+                "net_payable",
+            )
+            # Ties stay in id order across pages
+            .order_by(ordering, "id")
+        )
+
+
+class ChangeFeedRepository:
+    @staticmethod
+    def get_changes(queryset, after, until, limit):
+        """
+        Rows updated after the ``(updated_at, id)`` key ``after`` and before
+        ``until``, oldest first, using the ``(updated_at, id)`` index
+        """
+        queryset = queryset.filter(updated_at__lt=until)
+        if after is not None:
+            updated_at, pk = after
+            queryset = queryset.filter(
+                Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk)
+            )
+        return queryset.order_by("updated_at", "pk")[:limit]
+
+    @staticmethod
+    def get_deleted(feed, after, until, limit):
+        """``(tombstone id, object id)`` pairs of a feed after tombstone ``after``"""
+        return list(
+            Tombstone.objects.filter(feed=feed, id__gt=after, deleted_at__lt=until)
+            .order_by("id")
+            .values_list("id", "object_id")[:limit]
+        )
+
+    @staticmethod
+    def last_tombstone():
+        return Tombstone.objects.aggregate(id=Max("id"))["id"] or 0
+
+
+class ArchiveRepository:
+    @staticmethod
+    def pack(data):
+        """Compress serialized data for an archive row"""
+        return zlib.compress(ORJSONRenderer().render(data))
+
+    @staticmethod
+    def unpack(blob):
+        return json.loads(zlib.decompress(blob))
+
+    @staticmethod
+    def reports_until():
+        """Date of the last archived report, None if nothing is archived"""
+        return ArchivedReport.objects.aggregate(date=Max("date"))["date"]
+
+    @staticmethod
+    def appointments_until():
+        """Date of the last archived appointment, None if nothing is archived"""
+        return ArchivedAppointment.objects.aggregate(date=Max("date"))["date"]
+
+    @staticmethod
+    def check_open(date):
+        """Refuse writes to the report of an archived date"""
+        if ArchivedReport.objects.filter(date=date).exists():
+            raise ValidationError({"date": f"The report for {date} is archived."})
+
+    @staticmethod
+    def get_report(date):
+        """Serialized archived report for a date, or None"""
+        try:
+            archived = ArchivedReport.objects.filter(date=date).first()
+        except DjangoValidationError:
+            return None
+        if archived is None:
+            return None
+        return ArchiveRepository.unpack(archived.data)
+
+    @staticmethod
+    def get_appointment(pk, doctor=None):
+        """Archived appointment by id, limited to a doctor when given"""
+        queryset = ArchivedAppointment.objects.all()
+        if doctor is not None:
+            queryset = queryset.filter(doctor=doctor)
+        try:
+            return queryset.filter(pk=pk).first()
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def get_reports_in_range(start_date, end_date):
+        """
+        Serialized archived reports and their totals within the date range,
+        or None when the range starts after the archive.
+        """
+        until = ArchiveRepository.reports_until()
+        if until is None or start_date > until:
+            return None
+
+        archived = ArchivedReport.objects.filter(
+            date__range=(start_date, min(end_date, until))
+        ).order_by("date")
+        totals = archived.aggregate(
+            total_profit=Coalesce(Sum("total_profit"), 0, output_field=DecimalField()),
+            total_consumption=Coalesce(
+                Sum("total_consumption"), 0, output_field=DecimalField()
+            ),
+        )
+        totals["net_profit"] = totals["total_profit"] - totals["total_consumption"]
+
+        return {
+            "aggregated_totals": totals,
+            "reports": [
+                ArchiveRepository.unpack(data)
+                for data in archived.values_list("data", flat=True)
+            ],
+        }
@@ -1,7 +1,13 @@
+from collections import defaultdict
+
 from rest_framework import serializers
 
+from src.serializers import compile_serializer
 from src.management.models import Doctor, Patient, Service
+from .choices import StatusChoices
 from .models import Appointment, Report, Profit, Consumption, Salary
+from .repository import AppointmentRepository
+from .services import overlaps
 
 
 # <-----Base Serializers----> #
@@ -64,6 +70,8 @@ class AppointmentReadSerializer(serializers.ModelSerializer):
     service = ServiceSerializer(read_only=True)
     profits = ProfitReadSerializer(many=True, read_only=True)
 
+    expandable_fields = ("doctor", "patient", "service", "profits")
+
     class Meta:
         model = Appointment
         fields = "__all__"
@@ -81,6 +89,138 @@ class AppointmentNestedSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class PreloadedRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field reading from the objects its batch loaded up front"""
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get("preloaded")
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return preloaded[self.field_name][int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class AppointmentBatchListSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of appointments with one query per related model and
+    one for the existing bookings, and saves it with ``save_batch()``. The
+    ``queryset`` in the context limits which appointments may be updated.
+    """
+
+    related_fields = ("patient", "doctor", "service")
+
+    @staticmethod
+    def collect_ids(data, name):
+        ids = set()
+        for item in data:
+            value = item.get(name) if isinstance(item, dict) else None
+            if isinstance(value, int) and not isinstance(value, bool):
+                ids.add(value)
+            elif isinstance(value, str) and value.isdigit():
+                ids.add(int(value))
+        return ids
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            preloaded = {
+                name: self.child.fields[name]
+                .get_queryset()
+                .in_bulk(self.collect_ids(data, name))
+                for name in self.related_fields
+            }
+            preloaded["id"] = self.context["queryset"].in_bulk(
+                self.collect_ids(data, "id")
+            )
+            self._context = {**self.context, "preloaded": preloaded}
+
+        try:
+            attrs = super().to_internal_value(data)
+            errors = [{} for _ in attrs]
+        except serializers.ValidationError as exc:
+            if not isinstance(exc.detail, list):
+                raise
+            # Check the valid items as well, so all errors come back at once
+            errors = exc.detail
+            attrs = [
+                None if error else self.child.run_validation(item)
+                for item, error in zip(data, errors)
+            ]
+
+        self.check_bookings(attrs, errors)
+        return attrs
+
+    def check_bookings(self, attrs, errors):
+        """
+        Add errors for ids given twice and bookings overlapping an existing
+        one or an earlier item. Done here, as DRF keeps errors per item only
+        for ``to_internal_value()``.
+        """
+        seen = set()
+        for index, item in enumerate(attrs):
+            if item is not None and "id" in item:
+                if item["id"] in seen:
+                    errors[index]["id"] = ["Appears more than once in the batch."]
+                seen.add(item["id"])
+
+        bookings = [
+            index
+            for index, item in enumerate(attrs)
+            if item is not None
+            and item.get("doctor") is not None
+            and item.get("status") != StatusChoices.CANCELLED
+        ]
+        keys = {(attrs[index]["doctor"].pk, attrs[index]["date"]) for index in bookings}
+        booked = defaultdict(list)
+        for doctor_id, date, *slot in AppointmentRepository.get_bookings(keys, seen):
+            booked[doctor_id, date].append(slot)
+
+        for index in bookings:
+            item = attrs[index]
+            slots = booked[item["doctor"].pk, item["date"]]
+            start_time, end_time = item["start_time"], item.get("end_time")
+            if any(overlaps(start_time, end_time, *slot) for slot in slots):
+                errors[index]["start_time"] = ["The doctor is booked at this time."]
+            # Later items must not overlap this one either
+            slots.append((start_time, end_time))
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+    def create(self, validated_data):
+        return AppointmentRepository.save_batch(
+            validated_data, self.context["preloaded"]["id"]
+        )
+
+
+class AppointmentBatchSerializer(serializers.ModelSerializer):
+    """One appointment of a batch, an update when it has an ``id``"""
+
+    id = serializers.IntegerField(required=False)
+    patient = PreloadedRelatedField(queryset=Patient.objects.all())
+    doctor = PreloadedRelatedField(
+        queryset=Doctor.objects.all(), allow_null=True, required=False
+    )
+    service = PreloadedRelatedField(
+        queryset=Service.objects.all(), allow_null=True, required=False
+    )
+
+    class Meta:
+        model = Appointment
+        fields = "__all__"
+        list_serializer_class = AppointmentBatchListSerializer
+
+    def validate_id(self, value):
+        if value not in self.context["preloaded"]["id"]:
+            raise serializers.ValidationError("Not found.")
+        return value
+
+
 # <-----Profit Serializers----> #
 
 class ProfitSerializer(serializers.ModelSerializer):
@@ -198,7 +338,124 @@ class ReportSerializer(serializers.ModelSerializer):
         ]
 
 
+# <-----Dashboard Serializers----> #
+
+class DashboardAppointmentSerializer(serializers.ModelSerializer):
+    """Appointment of the doctor's own dashboard"""
+
+    patient = PatientSerializer(read_only=True)
+    service = ServiceSerializer(read_only=True)
+
+    class Meta:
+        model = Appointment
+        exclude = ["doctor"]
+
+
+class DashboardSalarySerializer(serializers.ModelSerializer):
+    """Salary payout of the doctor's own dashboard"""
+
+    date = serializers.DateField(source="report.date", read_only=True)
+
+    class Meta:
+        model = Salary
+        fields = ["id", "title", "description", "amount", "date", "created_at"]
+
+
+class DashboardEarningsSerializer(serializers.Serializer):
+    """KPI earnings of the doctor's own dashboard"""
+
+    this_month = serializers.DecimalField(max_digits=11, decimal_places=2)
+    last_month = serializers.DecimalField(max_digits=11, decimal_places=2)
+
+
+class DoctorDashboardSerializer(serializers.Serializer):
+    """Doctor dashboard serializer"""
+
+    balance = serializers.DecimalField(max_digits=11, decimal_places=2)
+    earnings = DashboardEarningsSerializer()
+    today = DashboardAppointmentSerializer(many=True)
+    upcoming = DashboardAppointmentSerializer(many=True)
+    salaries = DashboardSalarySerializer(many=True)
+
+
+# <-----Patient History Serializers----> #
+
+class HistoryPaymentSerializer(serializers.ModelSerializer):
+    """Payment of a patient's appointment"""
+
+    date = serializers.DateField(source="report.date", read_only=True)
+
+    class Meta:
+        model = Profit
+        fields = ["id", "amount", "date", "created_at"]
+
+
+class PatientHistorySerializer(serializers.ModelSerializer):
+    """Appointment of a patient's visit history"""
+
+    doctor = DoctorSerializer(read_only=True)
+    service = ServiceSerializer(read_only=True)
+    paid = serializers.DecimalField(max_digits=11, decimal_places=2, read_only=True)
+    outstanding = serializers.DecimalField(
+        max_digits=11, decimal_places=2, read_only=True
+    )
+    payments = HistoryPaymentSerializer(source="profits", many=True, read_only=True)
+
+    class Meta:
+        model = Appointment
+        exclude = ["patient"]
+
+
+# <-----Change Feed Serializers----> #
+
+class ChangeFeedSerializer(serializers.Serializer):
+    """Rows changed and ids deleted since a cursor"""
+
+    results = serializers.ListField(child=serializers.DictField())
+    deleted = serializers.ListField(child=serializers.IntegerField())
+    cursor = serializers.CharField()
+    has_more = serializers.BooleanField()
+
+
+# <-----Analytics Serializers----> #
+
+class DoctorEarningsQuerySerializer(serializers.Serializer):
+    """Date range and ordering of the doctor earnings"""
+
+    orderings = ("kpi_earnings", "salary_paid", "net_payable", "last_name")
+
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    ordering = serializers.ChoiceField(
+        choices=[prefix + name for name in orderings for prefix in ("", "-")],
+        default="-net_payable",
+    )
+
+    def validate(self, attrs):
+        if attrs["start_date"] > attrs["end_date"]:
+            raise serializers.ValidationError(
+                {"end_date": "Must not be before start_date."}
+            )
+        return attrs
+
+
+class DoctorEarningsSerializer(serializers.Serializer):
+    """KPI earnings, salary paid and net payable of a doctor"""
 
+    id = serializers.IntegerField()
+    first_name = serializers.CharField()
+    last_name = serializers.CharField()
+    middle_name = serializers.CharField()
+    kpi_earnings = serializers.DecimalField(max_digits=13, decimal_places=2)
+    salary_paid = serializers.DecimalField(max_digits=13, decimal_places=2)
+    net_payable = serializers.DecimalField(max_digits=13, decimal_places=2)
 
 
+# <-----Compiled Serializers----> #
 
+AppointmentReadCompiledSerializer = compile_serializer(AppointmentReadSerializer)
+ReportCompiledSerializer = compile_serializer(ReportSerializer)
+DashboardAppointmentCompiledSerializer = compile_serializer(
+    DashboardAppointmentSerializer
+)
+DashboardSalaryCompiledSerializer = compile_serializer(DashboardSalarySerializer)
@@ -5,6 +5,10 @@ from .choices import StatusChoices
 
 def update_appointment_status(appointment):
     total_profit = appointment.profits.aggregate(total=Sum("amount"))["total"] or 0
+    return set_appointment_status(appointment, total_profit)
+
+
+def set_appointment_status(appointment, total_profit):
     if total_profit > 0:
         if appointment.price == total_profit:
             appointment.status = StatusChoices.FULLY_PAID
@@ -13,6 +17,13 @@ def update_appointment_status(appointment):
     return appointment
 
 
+def overlaps(start, end, other_start, other_end):
+    """Whether two bookings overlap, one without an end takes only its start"""
+    end = end or start
+    other_end = other_end or other_start
+    return start == other_start or (start < other_end and other_start < end)
+
+
 def update_doctor_balance_on_profit(profit):
     doctor = profit.appointment.doctor
     doctor.balance += (profit.amount * profit.appointment.service.kpi_percent) / 100
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete
+
+from src.management.models import Doctor, Patient, Service
+from .models import Appointment, Report, Tombstone
+
+
+# Models of the change feed, by feed name
+FEEDS = {
+    "patients": Patient,
+    "doctors": Doctor,
+    "appointments": Appointment,
+    "services": Service,
+    "reports": Report,
+}
+
+
+# Tombstones waiting for the end of a batch_tombstones() block
+_pending = ContextVar("pending_tombstones", default=None)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    """Keep the id of a deleted row, archived ones included"""
+    tombstone = Tombstone(feed=FEED_NAMES[sender], object_id=instance.pk)
+    pending = _pending.get()
+    if pending is None:
+        tombstone.save()
+    else:
+        pending.append(tombstone)
+
+
+@contextmanager
+def batch_tombstones():
+    """Insert the tombstones of the rows deleted inside in one query"""
+    pending = []
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    Tombstone.objects.bulk_create(pending)
+
+
+FEED_NAMES = {model: name for name, model in FEEDS.items()}
+
+for name, model in FEEDS.items():
+    post_delete.connect(
+        record_tombstone, sender=model, dispatch_uid=f"tombstone-{name}"
+    )
@@ -1,3 +1,1277 @@
-from django.test import TestCase
+import json
+import tempfile
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from operator import itemgetter
+from unittest import mock
 
-# Create your tests here.
+import redis
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+import core.middleware
+from core.db_routers import ReplicaRouter
+from core.middleware import PRIMARY_COOKIE, ReplicaMiddleware
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+from src.management.models import Doctor, User
+from src.serializers import CustomTokenObtainPairSerializer
+from src.testing import (
+    FAST_PASSWORD_HASHERS,
+    SEED_DATE,
+    QueryBudgetMixin,
+    seed_dataset,
+)
+from . import events
+from .management.commands.load_benchmark import (
+    Command as LoadBenchmarkCommand,
+    HttpDriver,
+)
+from .choices import StatusChoices
+from .models import (
+    Appointment,
+    ArchivedAppointment,
+    ArchivedReport,
+    IdempotencyKey,
+    Profit,
+    Report,
+    Salary,
+    Tombstone,
+)
+from .repository import AppointmentRepository, ReportRepository
+from .serializers import (
+    AppointmentSerializer,
+    AppointmentReadSerializer,
+    AppointmentReadCompiledSerializer,
+    ReportSerializer,
+    ReportCompiledSerializer,
+)
+from .signals import batch_tombstones
+from .urls import router
+
+
+class TreatmentQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """Query budgets for the treatment endpoints"""
+
+    router = router
+    query_budgets = {
+        "appointment-list": 4,
+        "appointment-detail": 3,
+        "appointment-add-profit": 12,
+        "appointment-batch": 11,
+        "report-list": 5,
+        "report-detail": 4,
+        "report-get-reports-in-range": 5,
+        "report-add-profit": 14,
+        "report-add-consumption": 7,
+        "report-add-salary": 13,
+        "salary-list": 3,
+        "salary-detail": 2,
+        "dashboard-doctor": 4,
+        "patient-history-list": 4,
+        "changes-feed": 6,
+        # Live and archived earnings are summed in the count and page queries
+        "analytics-doctors": 3,
+    }
+
+    def test_appointment_endpoints(self):
+        self.assertListBudget("appointment-list")
+        self.assertQueryBudget(
+            "appointment-detail", kwargs={"pk": self.data["appointments"][0].pk}
+        )
+
+    def test_appointment_expand(self):
+        for expand in ("", "profits", "doctor,patient", "doctor,patient,service,profits"):
+            response, _ = self.assertQueryBudget(
+                "appointment-detail",
+                kwargs={"pk": self.data["appointments"][0].pk},
+                data={"expand": expand},
+            )
+            self.assertListBudget("appointment-list", {"expand": expand})
+
+            for name in ("doctor", "patient", "service"):
+                if name in expand:
+                    self.assertIsInstance(response.data[name], dict)
+                else:
+                    self.assertIsInstance(response.data[name], int)
+            self.assertEqual("profits" in response.data, "profits" in expand)
+
+    def test_appointment_expand_unknown_field(self):
+        self.assertQueryBudget(
+            "appointment-list", data={"expand": "report"}, status_code=400
+        )
+
+    def test_appointment_endpoints_as_doctor(self):
+        self.authenticate(self.data["doctors"][0])
+        self.assertListBudget("appointment-list", page_sizes=(2, 5))
+
+    def test_appointment_add_profit(self):
+        self.assertQueryBudget(
+            "appointment-add-profit",
+            "post",
+            kwargs={"pk": self.data["appointments"][0].pk},
+            data={"date": "2024-05-01", "amount": "150.00"},
+        )
+
+    def test_appointment_batch(self):
+        first = self.data["appointments"][0]
+        counts = []
+        for size in (2, 10):
+            items = [
+                {
+                    "patient": self.data["patients"][i].pk,
+                    "doctor": self.data["doctors"][i % 3].pk,
+                    "service": first.service_id,
+                    "price": "300.00",
+                    "start_time": f"{9 + i // 3}:00",
+                    "date": f"2024-06-{size:02d}",
+                }
+                for i in range(size)
+            ]
+            items[0] = {
+                **AppointmentSerializer(first).data,
+                "start_time": "20:00",
+                "price": "250.00",
+            }
+            _, count = self.assertQueryBudget(
+                "appointment-batch", "post", data=items, status_code=201
+            )
+            counts.append(count)
+        self.assertEqual(counts[0], counts[1], "batch query count grows with size")
+
+    def test_report_endpoints(self):
+        date = self.data["reports"][0].date
+        self.assertQueryBudget("report-list", data={"by_date": str(date)})
+        self.assertQueryBudget("report-detail", kwargs={"date": str(date)})
+
+    def test_report_range(self):
+        reports = self.data["reports"]
+        counts = [
+            self.assertQueryBudget(
+                "report-get-reports-in-range",
+                data={"start_date": str(reports[0].date), "end_date": str(end.date)},
+            )[1]
+            for end in (reports[0], reports[-1])
+        ]
+        self.assertEqual(counts[0], counts[1], "range query count grows with days")
+
+    def test_report_add_profit(self):
+        self.assertQueryBudget(
+            "report-add-profit",
+            "post",
+            data={
+                "date": "2024-05-01",
+                "appointment": self.data["appointments"][0].pk,
+                "amount": "150.00",
+            },
+        )
+
+    def test_report_add_consumption(self):
+        self.assertQueryBudget(
+            "report-add-consumption",
+            "post",
+            data={
+                "date": "2024-05-01",
+                "title": "Gloves",
+                "description": "",
+                "amount": "15.00",
+            },
+        )
+
+    def test_report_add_salary(self):
+        self.assertQueryBudget(
+            "report-add-salary",
+            "post",
+            data={
+                "date": "2024-05-01",
+                "title": "Salary",
+                "description": "",
+                "amount": "50.00",
+                "doctor": self.data["doctors"][0].pk,
+            },
+        )
+
+    def test_doctor_dashboard(self):
+        self.addCleanup(cache.clear)
+        doctor = Doctor.objects.get(pk=self.data["doctors"][0].pk)
+        self.authenticate(doctor)
+
+        with mock.patch("django.utils.timezone.localdate", return_value=SEED_DATE):
+            response, _ = self.assertQueryBudget("dashboard-doctor")
+            _, cached = self.assertQueryBudget("dashboard-doctor")
+        self.assertEqual(cached, 1)
+
+        data = response.data
+        self.assertEqual(data["balance"], doctor.balance)
+        # Nine appointments of 150 paid, with a 30% KPI
+        self.assertEqual(data["earnings"], {"this_month": 405, "last_month": 0})
+        self.assertEqual(len(data["today"]), 9)
+        self.assertEqual(data["upcoming"], [])
+        self.assertEqual(len(data["salaries"]), 5)
+
+        self.authenticate(self.data["admin"])
+        self.assertQueryBudget("dashboard-doctor", status_code=403)
+
+    def test_patient_history(self):
+        first = self.data["appointments"][0]
+        patient = first.patient
+        for day in (2, 3, 4):
+            appointment = Appointment.objects.create(
+                patient=patient,
+                doctor=first.doctor,
+                service=first.service,
+                price=Decimal("200.00"),
+                start_time=first.start_time,
+                date=date(2024, 5, day),
+            )
+            Profit.objects.create(
+                report=self.data["reports"][0],
+                appointment=appointment,
+                amount=Decimal("50.00"),
+            )
+        kwargs = {"patient_pk": patient.pk}
+
+        response, count = self.assertQueryBudget(
+            "patient-history-list", kwargs=kwargs, data={"limit": 2}
+        )
+        results = response.data["results"]
+        self.assertEqual([r["date"] for r in results], ["2024-05-04", "2024-05-03"])
+        self.assertEqual(results[0]["paid"], 50)
+        self.assertEqual(results[0]["outstanding"], 150)
+        self.assertEqual(results[0]["doctor"]["id"], first.doctor_id)
+
+        response = self.client.get(response.data["next"])
+        results = response.data["results"]
+        self.assertIsNone(response.data["next"])
+        self.assertEqual([r["id"] for r in results][-1], first.pk)
+        self.assertEqual(results[-1]["paid"], 150)
+        self.assertEqual(results[-1]["outstanding"], 150)
+        self.assertEqual(
+            [p["amount"] for p in results[-1]["payments"]], [100, 50]
+        )
+
+        # Other patients and doctors see nothing of it
+        self.authenticate(self.data["patients"][1])
+        response, _ = self.assertQueryBudget("patient-history-list", kwargs=kwargs)
+        self.assertEqual(response.data["results"], [])
+        self.authenticate(self.data["doctors"][1])
+        response, _ = self.assertQueryBudget("patient-history-list", kwargs=kwargs)
+        self.assertEqual(response.data["results"], [])
+
+        self.authenticate(patient)
+        response, _ = self.assertQueryBudget("patient-history-list", kwargs=kwargs)
+        self.assertEqual(len(response.data["results"]), 4)
+
+    @override_settings(CHANGE_FEED_LAG_SECONDS=0)
+    def test_change_feed(self):
+        for feed in ("patients", "doctors", "appointments", "services", "reports"):
+            response, _ = self.assertQueryBudget(
+                "changes-feed", kwargs={"feed": feed}, data={"limit": 10}
+            )
+            self.assertEqual(
+                len(response.data["results"]), 3 if feed == "reports" else 10
+            )
+            self.assertQueryBudget(
+                "changes-feed",
+                kwargs={"feed": feed},
+                data={"cursor": response.data["cursor"]},
+            )
+
+    def test_analytics_endpoints(self):
+        for limit in (5, 20):
+            response, _ = self.assertQueryBudget(
+                "analytics-doctors",
+                data={
+                    "start_date": "2024-01-01",
+                    "end_date": "2025-12-31",
+                    "limit": limit,
+                },
+            )
+            self.assertEqual(len(response.data["results"]), limit)
+
+    def test_salary_endpoints(self):
+        self.assertListBudget("salary-list")
+        self.assertQueryBudget(
+            "salary-detail", kwargs={"pk": self.data["salaries"][0].pk}
+        )
+
+
+class ReportUpsertTests(TestCase):
+    """Write actions get the day's report from a single upsert"""
+
+    def test_get_or_create_for_date(self):
+        with self.assertNumQueries(1):
+            report = ReportRepository.get_or_create_for_date(date(2024, 5, 1))
+        self.assertIsNotNone(report.pk)
+
+        stale = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        Report.objects.filter(pk=report.pk).update(updated_at=stale)
+        with self.assertNumQueries(1):
+            again = ReportRepository.get_or_create_for_date(date(2024, 5, 1))
+        self.assertEqual(again.pk, report.pk)
+        self.assertEqual(Report.objects.count(), 1)
+        self.assertGreater(Report.objects.get().updated_at, stale)
+
+class SeedLoadDataTests(TestCase):
+    """seed_load_data management command"""
+
+    def test_tiny_preset_is_consistent(self):
+        call_command("seed_load_data", size="tiny", stdout=StringIO())
+
+        self.assertEqual(Doctor.objects.count(), 5)
+        self.assertEqual(Appointment.objects.count(), 200)
+
+        for doctor in Doctor.objects.all():
+            earned = sum(
+                profit.amount * profit.appointment.service.kpi_percent / 100
+                for profit in Profit.objects.filter(
+                    appointment__doctor=doctor
+                ).select_related("appointment__service")
+            )
+            paid = Salary.objects.filter(doctor=doctor).aggregate(
+                total=Sum("amount")
+            )["total"]
+            self.assertEqual(doctor.balance, earned - (paid or 0))
+
+        for appointment in Appointment.objects.filter(
+            status=StatusChoices.FULLY_PAID
+        ).annotate(paid=Sum("profits__amount")):
+            self.assertEqual(appointment.paid, appointment.price)
+
+    def test_today_is_fixed(self):
+        today = date(2022, 1, 10)
+        call_command("seed_load_data", size="tiny", today=today, stdout=StringIO())
+
+        paid = Appointment.objects.filter(profits__isnull=False)
+        self.assertTrue(paid.exists())
+        self.assertFalse(paid.filter(date__gt=today).exists())
+        self.assertTrue(Appointment.objects.filter(date__gt=today).exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class LoadBenchmarkTests(TransactionTestCase):
+    """load_benchmark management command"""
+
+    def test_in_process_run_saves_results(self):
+        call_command("seed_load_data", size="tiny", stdout=StringIO())
+
+        # Empty buckets, the benchmark's own requests are exempt
+        bucket = mock.patch("core.throttling.get_token_bucket")
+        with bucket as get_bucket, tempfile.NamedTemporaryFile(
+            suffix=".json"
+        ) as output:
+            get_bucket.return_value.return_value = [0, "6"]
+            call_command(
+                "load_benchmark",
+                requests=3,
+                concurrency=1,
+                output=output.name,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+            results = json.load(output)
+
+        for name, result in results["scenarios"].items():
+            self.assertEqual(result["count"], 3)
+            self.assertEqual(result["errors"], 0, name)
+            self.assertLessEqual(result["p50"], result["p99"])
+
+    def test_failed_requests_are_errors(self):
+        driver = HttpDriver("http://127.0.0.1:9", timeout=1)
+        self.assertEqual(driver.request("get", "/doctors/")[0], 0)
+
+        command = LoadBenchmarkCommand(stdout=StringIO())
+        command.driver = driver
+        result = command.run([("get", "/doctors/", None, None)] * 2, concurrency=2)
+        self.assertEqual(result["errors"], 2)
+        self.assertIsNone(result["p95"])
+        command.report("browse_doctors", result)
+        self.assertIsNone(command.run([], concurrency=1)["throughput"])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class CompiledSerializerTests(TestCase):
+    """Compiled serializers render the same JSON as the DRF serializers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def assertSameJSON(self, serializer_class, compiled_class, instances):
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(compiled_class(instances, many=True).data),
+            renderer.render(serializer_class(instances, many=True).data),
+        )
+        self.assertEqual(
+            renderer.render(compiled_class(instances[0]).data),
+            renderer.render(serializer_class(instances[0]).data),
+        )
+
+    def test_appointments(self):
+        appointments = list(AppointmentRepository.get())
+        self.assertSameJSON(
+            AppointmentReadSerializer, AppointmentReadCompiledSerializer, appointments
+        )
+
+    def test_reports(self):
+        reports = list(ReportRepository.get())
+        self.assertSameJSON(ReportSerializer, ReportCompiledSerializer, reports)
+
+    def test_report_totals(self):
+        report = ReportRepository.get_annotated_report(self.data["reports"][0].id)
+        profits = sum(profit.amount for profit in report.profits.all())
+        consumptions = sum(item.amount for item in report.consumptions.all())
+
+        self.assertEqual(report.total_profit, profits)
+        self.assertEqual(report.total_consumption, consumptions)
+        self.assertEqual(report.net_profit, profits - consumptions)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class ORJSONRendererTests(TestCase):
+    """orjson renderer and parser match DRF's JSON renderer and parser"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset()
+
+    def assertSameRender(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_report_payload(self):
+        self.assertSameRender(
+            ReportCompiledSerializer(ReportRepository.get(), many=True).data
+        )
+
+    def test_edge_values(self):
+        self.assertSameRender(
+            {
+                "small": Decimal("0.00001"),
+                "big": Decimal("1e20"),
+                "zero": Decimal("-0.00"),
+                "text": "line\u2028separator",
+                1: [None, True, "юникод"],
+            }
+        )
+
+    def test_without_orjson(self):
+        data = {"amount": Decimal("150.00")}
+        with mock.patch("core.renderers.orjson", None):
+            self.assertEqual(ORJSONRenderer().render(data), b'{"amount":150.0}')
+
+    def test_parser(self):
+        body = b'{"amount": 150.5, "id": 123456789012345678901234567890}'
+        self.assertEqual(
+            ORJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body))
+        )
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"amount": NaN}'))
+
+
+# Replica pins in process memory, as there is no Redis here
+@override_settings(
+    DATABASE_REPLICAS=["replica_0"],
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "replica_pin": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+)
+class ReplicaRoutingTests(TestCase):
+    """Reads go to replicas unless the client wrote recently"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = [
+            Doctor.objects.create(phone=f"+9989100000{i}", last_name=f"Doc{i}")
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        caches["replica_pin"].clear()
+        self.addCleanup(setattr, core.middleware, "_redis_down_until", 0)
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware(self.route)
+
+    def route(self, request):
+        response = HttpResponse()
+        response.read_db = ReplicaRouter().db_for_read(Report)
+        response.write_db = ReplicaRouter().db_for_write(Report)
+        return response
+
+    def test_safe_requests_read_from_replica(self):
+        response = self.middleware(self.factory.get("/reports/"))
+        self.assertEqual(response.read_db, "replica_0")
+        self.assertEqual(response.write_db, "default")
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_writes_use_primary_and_pin_the_client(self):
+        response = self.middleware(self.factory.post("/appointments/1/add_profit/"))
+        self.assertEqual(response.read_db, "default")
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        self.factory.cookies[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        response = self.middleware(self.factory.get("/reports/"))
+        self.assertEqual(response.read_db, "default")
+
+    def headers(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_token_clients_are_pinned_without_cookies(self):
+        headers = self.headers(self.first)
+        self.middleware(self.factory.post("/reports/add_profit/", headers=headers))
+
+        response = self.middleware(self.factory.get("/reports/", headers=headers))
+        self.assertEqual(response.read_db, "default")
+        # A refreshed token belongs to the same user
+        response = self.middleware(
+            self.factory.get("/reports/", headers=self.headers(self.first))
+        )
+        self.assertEqual(response.read_db, "default")
+        response = self.middleware(
+            self.factory.get("/reports/", headers=self.headers(self.second))
+        )
+        self.assertEqual(response.read_db, "replica_0")
+
+    def test_invalid_tokens_are_not_pinned(self):
+        headers = {"Authorization": "Bearer invalid"}
+        self.middleware(self.factory.post("/reports/add_profit/", headers=headers))
+        response = self.middleware(self.factory.get("/reports/", headers=headers))
+        self.assertEqual(response.read_db, "replica_0")
+
+    def test_unreachable_pins_read_from_primary(self):
+        headers = self.headers(self.first)
+        with mock.patch.object(
+            caches["replica_pin"], "get", side_effect=redis.ConnectionError
+        ) as get:
+            response = self.middleware(self.factory.get("/reports/", headers=headers))
+            self.assertEqual(response.read_db, "default")
+
+            # Redis is left alone for a while
+            response = self.middleware(self.factory.get("/reports/", headers=headers))
+            self.assertEqual(response.read_db, "default")
+            self.assertEqual(get.call_count, 1)
+
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 5):
+            response = self.middleware(self.factory.get("/reports/", headers=headers))
+        self.assertEqual(response.read_db, "replica_0")
+
+    def test_instances_keep_their_database(self):
+        report = Report(date="2024-01-01")
+        report._state.db = "default"
+        response = self.middleware(self.factory.get("/reports/"))
+        self.assertEqual(response.read_db, "replica_0")
+        self.assertEqual(ReplicaRouter().db_for_read(Report, instance=report), "default")
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        response = self.middleware(self.factory.post("/reports/add_profit/"))
+        self.assertEqual(response.read_db, "default")
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class ArchiveTests(APITestCase):
+    """Archived rows keep being served by the history endpoints"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+        first, second, _ = cls.data["reports"]
+        Appointment.objects.filter(date__in=[first.date, second.date]).update(
+            status=StatusChoices.FULLY_PAID
+        )
+        # Salaries keep a day live too
+        Salary.objects.filter(report=first).delete()
+        # One open appointment keeps the second day live
+        cls.open_appointment = Appointment.objects.filter(date=second.date).first()
+        cls.open_appointment.status = StatusChoices.PARTIALLY_PAID
+        cls.open_appointment.save(update_fields=["status"])
+
+    def setUp(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.data["admin"])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+        self.first, self.second, self.third = self.data["reports"]
+
+    def history(self):
+        """Responses of the endpoints that read archived rows"""
+        appointments = {}
+        for expand in (None, "service"):
+            params = {"date": str(self.first.date), "limit": 100}
+            if expand:
+                params["expand"] = expand
+            response = self.client.get(reverse("appointment-list"), params)
+            appointments[expand] = sorted(
+                response.json()["results"], key=itemgetter("id")
+            )
+
+        return {
+            "range": self.client.get(
+                reverse("report-get-reports-in-range"),
+                {"start_date": str(self.first.date), "end_date": str(self.third.date)},
+            ).json(),
+            "detail": self.client.get(
+                reverse("report-detail", kwargs={"date": str(self.first.date)})
+            ).json(),
+            "list": self.client.get(
+                reverse("report-list"), {"by_date": str(self.first.date)}
+            ).json(),
+            "appointments": appointments,
+            "appointment": self.client.get(
+                reverse(
+                    "appointment-detail",
+                    kwargs={"pk": self.data["appointments"][0].pk},
+                )
+            ).json(),
+        }
+
+    def test_archive_is_read_transparently(self):
+        balances = list(Doctor.objects.values_list("balance", flat=True))
+        before = self.history()
+
+        out = StringIO()
+        call_command("archive_records", before=self.third.date, stdout=out)
+
+        self.assertIn("Archived 1 reports and 9 appointments", out.getvalue())
+        self.assertEqual(
+            list(ArchivedReport.objects.values_list("date", flat=True)),
+            [self.first.date],
+        )
+        self.assertFalse(Report.objects.filter(date=self.first.date).exists())
+        self.assertTrue(Report.objects.filter(date=self.second.date).exists())
+        self.assertFalse(ArchivedAppointment.objects.filter(date=self.second.date))
+        self.assertEqual(list(Doctor.objects.values_list("balance", flat=True)), balances)
+
+        self.assertEqual(self.history(), before)
+        archived = ArchivedReport.objects.get()
+        self.assertEqual(archived.total_profit, Decimal("1350.00"))
+        self.assertEqual(
+            dict(archived.doctor_earnings.values_list("doctor", "amount")),
+            {self.data["doctors"][0].pk: Decimal("405.00")},
+        )
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command(
+            "archive_records", before=self.third.date, dry_run=True, stdout=out
+        )
+        self.assertIn("Would archive 1 reports and 9 appointments", out.getvalue())
+        self.assertFalse(ArchivedReport.objects.exists())
+
+    def test_archived_appointments_are_ordered(self):
+        def ids(ordering):
+            response = self.client.get(
+                reverse("appointment-list"),
+                {"date": str(self.first.date), "ordering": ordering, "limit": 100},
+            )
+            return [appointment["id"] for appointment in response.json()["results"]]
+
+        orderings = ["-id", "patient,-start_time", "-doctor,id"]
+        before = {ordering: ids(ordering) for ordering in orderings}
+        call_command("archive_records", before=self.third.date, stdout=StringIO())
+        self.assertEqual({ordering: ids(ordering) for ordering in orderings}, before)
+        self.assertEqual(before["-id"], sorted(before["-id"], reverse=True))
+
+    def test_reports_with_salaries_stay(self):
+        Salary.objects.create(
+            report=self.first,
+            doctor=self.data["doctors"][0],
+            title="Salary",
+            amount=Decimal("20.00"),
+        )
+
+        call_command("archive_records", before=self.third.date, stdout=StringIO())
+        self.assertTrue(Report.objects.filter(date=self.first.date).exists())
+        self.assertTrue(Salary.objects.filter(report=self.first).exists())
+        self.assertFalse(ArchivedReport.objects.exists())
+
+    def test_archived_dates_refuse_writes(self):
+        call_command("archive_records", before=self.third.date, stdout=StringIO())
+        response = self.client.post(
+            reverse("report-add-consumption"),
+            {
+                "date": str(self.first.date),
+                "title": "Gloves",
+                "description": "",
+                "amount": "5.00",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Report.objects.filter(date=self.first.date).exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class IdempotencyKeyTests(APITestCase):
+    """Retried payment writes with the same Idempotency-Key apply once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def setUp(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.data["admin"])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+        self.appointment = self.data["appointments"][0]
+        self.url = reverse("appointment-add-profit", kwargs={"pk": self.appointment.pk})
+
+    def add_profit(self, amount="50.00", **headers):
+        return self.client.post(
+            self.url,
+            {"date": "2024-05-01", "amount": amount},
+            format="json",
+            headers=headers,
+        )
+
+    def test_retry_is_replayed(self):
+        doctor = self.appointment.doctor
+        first = self.add_profit(**{"Idempotency-Key": "profit-1"})
+        balance = Doctor.objects.get(pk=doctor.pk).balance
+
+        retry = self.add_profit(**{"Idempotency-Key": "profit-1"})
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(self.appointment.profits.count(), 3)
+        self.assertEqual(Doctor.objects.get(pk=doctor.pk).balance, balance)
+
+    def test_reused_key_for_another_request(self):
+        self.add_profit(**{"Idempotency-Key": "profit-1"})
+        response = self.add_profit("60.00", **{"Idempotency-Key": "profit-1"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.appointment.profits.count(), 3)
+
+    def test_keys_are_per_user(self):
+        self.add_profit(**{"Idempotency-Key": "profit-1"})
+        token = CustomTokenObtainPairSerializer.get_token(self.appointment.doctor)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+        response = self.add_profit(**{"Idempotency-Key": "profit-1"})
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(self.appointment.profits.count(), 4)
+
+    def test_without_key(self):
+        self.add_profit()
+        self.add_profit()
+        self.assertEqual(self.appointment.profits.count(), 4)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_failed_validation_is_not_stored(self):
+        response = self.add_profit("-", **{"Idempotency-Key": "profit-1"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.add_profit(**{"Idempotency-Key": "profit-1"}).status_code, 200)
+
+    def test_session_form_post(self):
+        # The CSRF check reads the form, so the body can not be read again
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.data["admin"])
+        client.cookies["csrftoken"] = "a" * 32
+        data = {"date": "2024-05-01", "amount": "50.00"}
+        data["csrfmiddlewaretoken"] = "a" * 32
+        headers = {"Idempotency-Key": "profit-1"}
+        first = client.post(self.url, data, headers=headers)
+        self.assertEqual(first.status_code, 200, first.content)
+
+        retry = client.post(self.url, data, headers=headers)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(self.appointment.profits.count(), 3)
+
+    def test_expired_keys(self):
+        self.add_profit(**{"Idempotency-Key": "profit-1"})
+        with override_settings(IDEMPOTENCY_KEY_TTL=0):
+            response = self.add_profit(**{"Idempotency-Key": "profit-1"})
+            self.assertNotIn("Idempotent-Replayed", response)
+            self.assertEqual(self.appointment.profits.count(), 4)
+
+            out = StringIO()
+            call_command("clear_idempotency_keys", stdout=out)
+            self.assertIn("Deleted 1 idempotency keys", out.getvalue())
+
+
+@override_settings(
+    EVENTS_REDIS_URL="redis://events.invalid/4",
+    REVOKED_TOKENS_REDIS_URL="",
+    THROTTLE_REDIS_URL="",
+)
+class EventStreamTests(APITestCase):
+    """Appointment and payment saves are pushed to Server-Sent Events streams"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset(rows=3)
+
+    def setUp(self):
+        patcher = mock.patch.object(events, "get_redis")
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, events, "_redis_down_until", 0)
+
+    def token(self, user):
+        return str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+
+    def published(self):
+        return [
+            (call.args[0], json.loads(call.args[1])["event"])
+            for call in self.redis.publish.call_args_list
+        ]
+
+    def test_save_paths_publish_after_commit(self):
+        appointment = self.data["appointments"][0]
+        channel = f"events:doctor:{appointment.doctor_id}:date:{appointment.date}"
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.token(self.data['admin'])}"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("appointment-add-profit", kwargs={"pk": appointment.pk}),
+                {"date": "2024-05-01", "amount": "150.00"},
+                format="json",
+            )
+            self.assertEqual(self.published(), [])
+        self.assertEqual(
+            self.published(),
+            [(channel, "payment.created"), (channel, "appointment.status")],
+        )
+        message = json.loads(self.redis.publish.call_args.args[1])
+        self.assertEqual(message["old_status"], StatusChoices.PENDING)
+        self.assertEqual(message["status"], StatusChoices.FULLY_PAID)
+
+        self.redis.publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.get(pk=appointment.pk)
+            appointment.end_time = appointment.start_time
+            appointment.save()
+            Appointment.objects.create(
+                patient=appointment.patient,
+                doctor=None,
+                price=Decimal("100.00"),
+                start_time=appointment.start_time,
+                date=appointment.date,
+            )
+        self.assertEqual(
+            self.published(),
+            [
+                (channel, "appointment.updated"),
+                (f"events:doctor::date:{appointment.date}", "appointment.created"),
+            ],
+        )
+
+    def test_redis_down(self):
+        self.redis.publish.side_effect = redis.ConnectionError("refused")
+        appointment = self.data["appointments"][0]
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+            appointment.save()
+        # Redis is not retried on every save while it is down
+        self.assertEqual(self.redis.publish.call_count, 1)
+
+    def test_only_served_over_asgi(self):
+        response = self.client.get(reverse("events"))
+        self.assertEqual(response.status_code, 501)
+
+    async def read_stream(self, user, messages, **params):
+        """First chunks of the stream ``user`` gets, and the pattern it subscribed"""
+        pubsub = mock.MagicMock()
+        pubsub.psubscribe = mock.AsyncMock()
+        pubsub.aclose = mock.AsyncMock()
+        pubsub.get_message = mock.AsyncMock(side_effect=messages)
+        client = mock.MagicMock(aclose=mock.AsyncMock())
+        client.pubsub.return_value = pubsub
+
+        token = await sync_to_async(self.token)(user)
+        with mock.patch.object(events, "get_async_redis", return_value=client):
+            response = await self.async_client.get(
+                reverse("events"), {"token": token, **params}
+            )
+            self.assertEqual(response.status_code, 200)
+            # The stream ends on the last message, a Redis error
+            chunks = [chunk async for chunk in response.streaming_content]
+        pubsub.aclose.assert_awaited_once()
+        return [chunk.decode() for chunk in chunks], pubsub.psubscribe.call_args.args[0]
+
+    async def test_stream(self):
+        payload = b'{"event":"payment.created","appointment":1}'
+        chunks, pattern = await self.read_stream(
+            self.data["admin"],
+            [
+                {"type": "pmessage", "data": payload},
+                None,
+                redis.ConnectionError("closed"),
+            ],
+            date="2024-05-01",
+        )
+        self.assertEqual(pattern, "events:doctor:*:date:2024-05-01")
+        self.assertEqual(
+            chunks,
+            [
+                "retry: 3000\n\n",
+                f"event: payment.created\ndata: {payload.decode()}\n\n",
+                ": keep-alive\n\n",
+            ],
+        )
+
+        # Doctors only get their own events
+        doctor = self.data["doctors"][0]
+        _, pattern = await self.read_stream(
+            doctor, [redis.ConnectionError("closed")], doctor=doctor.pk + 1
+        )
+        self.assertEqual(pattern, f"events:doctor:{doctor.pk}:date:*")
+
+    async def test_stream_permissions(self):
+        response = await self.async_client.get(reverse("events"))
+        self.assertEqual(response.status_code, 403)
+        patient = self.data["patients"][0]
+        token = await sync_to_async(self.token)(patient)
+        response = await self.async_client.get(reverse("events"), {"token": token})
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(reverse("events"), {"token": "bad"})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CHANGE_FEED_LAG_SECONDS=0, PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class ChangeFeedTests(APITestCase):
+    """Clients sync what changed since their cursor, deletions included"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def setUp(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.data["admin"])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def sync(self, feed, cursor=None, limit=10):
+        """Fetch pages until the feed is drained"""
+        results, deleted = [], []
+        while True:
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get(
+                reverse("changes-feed", kwargs={"feed": feed}), params
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+            results += [row["id"] for row in response.data["results"]]
+            deleted += response.data["deleted"]
+            cursor = response.data["cursor"]
+            if not response.data["has_more"]:
+                return results, deleted, cursor
+
+    def test_sync(self):
+        appointments = self.data["appointments"]
+        results, deleted, cursor = self.sync("appointments")
+        self.assertEqual(results, [appointment.pk for appointment in appointments])
+        self.assertEqual(deleted, [])
+
+        ids = [appointment.pk for appointment in appointments]
+        patient_id = self.data["patients"][7].pk
+        appointments[3].save()
+        appointments[5].delete()
+        # Deleting a patient deletes their appointments
+        self.data["patients"][7].delete()
+        results, deleted, cursor = self.sync("appointments", cursor)
+        self.assertEqual(results, [ids[3]])
+        self.assertEqual(deleted, [ids[5], ids[7]])
+
+        results, deleted, _ = self.sync("patients", cursor)
+        self.assertEqual(deleted, [patient_id])
+
+        self.assertEqual(self.sync("appointments", cursor)[:2], ([], []))
+
+    def test_batched_tombstones(self):
+        ids = [appointment.pk for appointment in self.data["appointments"][:5]]
+        with CaptureQueriesContext(connection) as queries, batch_tombstones():
+            Appointment.objects.filter(id__in=ids).delete()
+        inserts = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith("INSERT")
+            and Tombstone._meta.db_table in query["sql"]
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            sorted(Tombstone.objects.values_list("object_id", flat=True)), ids
+        )
+
+    def test_tombstones_before_first_sync_are_skipped(self):
+        self.data["services"][0].delete()
+        results, deleted, _ = self.sync("services")
+        self.assertEqual(len(results), len(self.data["services"]) - 1)
+        self.assertEqual(deleted, [])
+
+    def test_bad_cursors(self):
+        url = reverse("changes-feed", kwargs={"feed": "reports"})
+        response = self.client.get(url, {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+        _, _, cursor = self.sync("reports")
+        with override_settings(CHANGE_FEED_TOMBSTONE_DAYS=-1):
+            response = self.client.get(url, {"cursor": cursor})
+        self.assertEqual(response.status_code, 410)
+
+        token = CustomTokenObtainPairSerializer.get_token(self.data["doctors"][0])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_clear_tombstones(self):
+        report_id = self.data["reports"][1].pk
+        self.data["reports"][0].delete()
+        Tombstone.objects.update(deleted_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        self.data["reports"][1].delete()
+
+        out = StringIO()
+        call_command("clear_tombstones", stdout=out)
+        self.assertIn("Deleted", out.getvalue())
+        self.assertEqual(
+            list(Tombstone.objects.values_list("object_id", flat=True)),
+            [report_id],
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class AppointmentBatchTests(APITestCase):
+    """Treatment plans book several appointments at once, all or none"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset(rows=6)
+
+    def setUp(self):
+        self.authenticate(self.data["admin"])
+        self.url = reverse("appointment-batch")
+        self.doctor = self.data["doctors"][0]
+
+    def authenticate(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def item(self, start_time, **fields):
+        return {
+            "patient": self.data["patients"][1].pk,
+            "doctor": self.doctor.pk,
+            "service": self.data["services"][0].pk,
+            "price": "300.00",
+            "start_time": start_time,
+            "end_time": None,
+            "date": "2024-05-01",
+            **fields,
+        }
+
+    def test_creates_and_updates(self):
+        paid = self.data["appointments"][0]
+        count = Appointment.objects.count()
+        response = self.client.post(
+            self.url,
+            [
+                self.item("17:00", end_time="17:30"),
+                self.item("17:30"),
+                # Paid 150 of 300, the new price is paid in full
+                {**AppointmentSerializer(paid).data, "price": "150.00"},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Appointment.objects.count(), count + 2)
+        self.assertEqual([item["id"] for item in response.data][2], paid.pk)
+        paid.refresh_from_db()
+        self.assertEqual(paid.price, Decimal("150.00"))
+        self.assertEqual(paid.status, StatusChoices.FULLY_PAID)
+        self.assertGreater(paid.updated_at, paid.created_at)
+
+    def test_errors_are_per_item_and_nothing_is_saved(self):
+        count = Appointment.objects.count()
+        booked = self.data["appointments"][0]
+        response = self.client.post(
+            self.url,
+            [
+                self.item("18:00", end_time="19:00"),
+                # Overlaps the first item
+                self.item("18:30"),
+                # Overlaps a seeded appointment
+                self.item(str(booked.start_time)),
+                self.item("20:00", patient=0),
+                self.item("21:00", status=StatusChoices.CANCELLED),
+                {**AppointmentSerializer(booked).data, "id": 0},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [sorted(errors) for errors in response.data],
+            [[], ["start_time"], ["start_time"], ["patient"], [], ["id"]],
+        )
+        self.assertEqual(Appointment.objects.count(), count)
+
+    def test_duplicate_ids(self):
+        data = AppointmentSerializer(self.data["appointments"][1]).data
+        response = self.client.post(self.url, [data, data], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[1]["id"][0], "Appears more than once in the batch.")
+
+    def test_doctors_update_only_their_own(self):
+        self.authenticate(self.doctor)
+        other = self.data["appointments"][1]
+        self.assertNotEqual(other.doctor_id, self.doctor.pk)
+        response = self.client.post(
+            self.url, [AppointmentSerializer(other).data], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("id", response.data[0])
+
+    def test_size_limit(self):
+        response = self.client.post(
+            self.url, [self.item(f"{i % 24}:00") for i in range(51)], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class AdminChangelistTests(TestCase):
+    """Changelists of large tables run a fixed number of cheap queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+        cls.superuser = User.objects.create(
+            phone="+998990000000", is_staff=True, is_superuser=True
+        )
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.superuser)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in context.captured_queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        urls = [
+            reverse("admin:treatment_appointment_changelist"),
+            reverse("admin:management_rating_changelist"),
+        ]
+        few = [self.get(url) for url in urls]
+        for appointment in self.data["appointments"]:
+            appointment.pk = None
+            appointment.save()
+        for rating in self.data["ratings"]:
+            rating.pk = None
+            rating.save()
+        cache.clear()
+        many = [self.get(url) for url in urls]
+
+        for url, few_queries, many_queries in zip(urls, few, many):
+            self.assertEqual(len(few_queries), len(many_queries), url)
+            self.assertLessEqual(len(few_queries), 6, "\n".join(few_queries))
+
+    def test_counts_are_cached(self):
+        url = reverse("admin:treatment_appointment_changelist")
+        self.get(url, status__exact=StatusChoices.PENDING)
+        queries = self.get(url, status__exact=StatusChoices.PENDING)
+        self.assertFalse(any("COUNT(" in sql for sql in queries), queries)
+
+    def test_search_and_autocomplete(self):
+        url = reverse("admin:treatment_appointment_changelist")
+        self.get(url, q=self.data["patients"][0].phone[:8])
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "app_label": "treatment",
+                "model_name": "appointment",
+                "field_name": "patient",
+                "term": self.data["patients"][0].phone,
+            },
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class DoctorAnalyticsTests(APITestCase):
+    """KPI earnings, salaries and net payable are summed per doctor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+
+    def setUp(self):
+        self.client.force_authenticate(self.data["admin"])
+
+    def get(self, **params):
+        return self.client.get(reverse("analytics-doctors"), params)
+
+    def test_totals(self):
+        doctors = self.data["doctors"]
+        response = self.get(start_date=str(SEED_DATE), end_date="2024-05-31")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["count"], len(doctors))
+
+        # Doctor i%3 gets appointment i, paid 150 at 30% KPI, and salary i
+        # of 20, both on report i%3
+        first, second, third = response.data["results"][:3]
+        self.assertEqual(first["id"], doctors[0].pk)
+        self.assertEqual(first["kpi_earnings"], 9 * 45)
+        self.assertEqual(first["salary_paid"], 9 * 20)
+        self.assertEqual(first["net_payable"], 9 * 25)
+        self.assertEqual([second["id"], third["id"]], [doctors[1].pk, doctors[2].pk])
+        self.assertEqual(second["net_payable"], 8 * 25)
+        self.assertEqual(response.data["results"][3]["net_payable"], 0)
+
+        response = self.get(start_date="2024-05-02", end_date="2024-05-02")
+        earnings = {row["id"]: row for row in response.data["results"]}
+        self.assertEqual(earnings[doctors[0].pk]["kpi_earnings"], 0)
+        self.assertEqual(earnings[doctors[1].pk]["kpi_earnings"], 8 * 45)
+
+    def test_archived_reports_are_counted(self):
+        first, _, third = self.data["reports"]
+        Appointment.objects.filter(date=first.date).update(
+            status=StatusChoices.FULLY_PAID
+        )
+        Salary.objects.filter(report=first).delete()
+        params = {"start_date": str(SEED_DATE), "end_date": "2024-05-31"}
+        before = self.get(**params).data["results"]
+
+        call_command("archive_records", before=third.date, stdout=StringIO())
+        self.assertTrue(ArchivedReport.objects.filter(date=first.date).exists())
+        self.assertEqual(self.get(**params).data["results"], before)
+        self.assertEqual(before[0]["kpi_earnings"], 9 * 45)
+
+    def test_ordering(self):
+        doctors = self.data["doctors"]
+        response = self.get(
+            start_date=str(SEED_DATE), end_date="2024-05-31", ordering="salary_paid"
+        )
+        ids = [row["id"] for row in response.data["results"]]
+        self.assertEqual(ids[-3:], [doctors[1].pk, doctors[2].pk, doctors[0].pk])
+        self.assertEqual(ids[:3], [doctors[3].pk, doctors[4].pk, doctors[5].pk])
+
+        response = self.get(
+            start_date=str(SEED_DATE), end_date="2024-05-31", ordering="id"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_range(self):
+        self.assertEqual(self.get(start_date=str(SEED_DATE)).status_code, 400)
+        response = self.get(start_date="2024-05-31", end_date=str(SEED_DATE))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("end_date", response.data)
+
+    def test_admins_only(self):
+        self.client.force_authenticate(self.data["doctors"][0])
+        response = self.get(start_date=str(SEED_DATE), end_date="2024-05-31")
+        self.assertEqual(response.status_code, 403)
@@ -1,6 +1,14 @@
 from rest_framework import routers
 
-from .views import AppointmentViewSet, ReportViewSet, SalaryViewSet
+from .views import (
+    AppointmentViewSet,
+    ReportViewSet,
+    SalaryViewSet,
+    DashboardViewSet,
+    PatientHistoryViewSet,
+    ChangeFeedViewSet,
+    AnalyticsViewSet,
+)
 
 
 router = routers.DefaultRouter()
@@ -8,3 +16,11 @@ router = routers.DefaultRouter()
 router.register(r"appointments", AppointmentViewSet)
 router.register(r"reports", ReportViewSet)
 router.register(r"salaries", SalaryViewSet)
+router.register(r"dashboard", DashboardViewSet, basename="dashboard")
+router.register(
+    r"patients/(?P<patient_pk>[0-9]+)/history",
+    PatientHistoryViewSet,
+    basename="patient-history",
+)
+router.register(r"changes", ChangeFeedViewSet, basename="changes")
+router.register(r"analytics", AnalyticsViewSet, basename="analytics")
@@ -1,29 +1,81 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from functools import partial
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
 from dateutil import parser as date_parser
 from django.utils.dateparse import parse_date
-from django.http import Http404
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views import View
 from rest_framework import viewsets, mixins, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
-
-from src.base import MultiSerializerMixin
-from src.treatment.models import Report, Profit, Consumption, Salary
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.filters import OrderingFilter
+
+from core.authentication import authenticate_query_token
+from core.permissions import IsAdmin, IsDoctor
+from core.throttling import HeavyReadThrottle
+from src.base import MultiSerializerMixin, CompiledSerializerMixin, ExpandMixin
+from src.management.repositories import (
+    DoctorRepository,
+    PatientRepository,
+    ServiceRepository,
+)
+from src.management.serializers import (
+    DoctorSerializer,
+    PatientSerializer,
+    ServiceSerializer,
+)
+from src.pagination import HistoryCursorPagination
+from src.serializers import collapse_expanded
+from src.treatment.models import Profit, Consumption, Salary, ArchivedAppointment
 from .serializers import (
     AppointmentSerializer,
+    AppointmentBatchSerializer,
     AppointmentReadSerializer,
     ReportSerializer,
+    ReportCompiledSerializer,
     ProfitReadSerializer,
     ProfitWriteSerializer,
     ProfitAddSerializer,
     ConsumptionWriteSerializer,
     SalarySerializer,
     SalaryWriteSerializer,
+    DashboardAppointmentCompiledSerializer,
+    DashboardSalaryCompiledSerializer,
+    DoctorDashboardSerializer,
+    PatientHistorySerializer,
+    ChangeFeedSerializer,
+    DoctorEarningsQuerySerializer,
+    DoctorEarningsSerializer,
 )
+from .events import channel_pattern, stream
 from .filters import AppointmentFilter, ReportFilter, SalaryFilter
-from .repository import AppointmentRepository, ReportRepository, SalaryRepository
+from .idempotency import idempotent
+from .repository import (
+    AnalyticsRepository,
+    AppointmentRepository,
+    ArchiveRepository,
+    ChangeFeedRepository,
+    DashboardRepository,
+    ReportRepository,
+    SalaryRepository,
+)
 
 
-class AppointmentViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
+class AppointmentViewSet(
+    ExpandMixin,
+    MultiSerializerMixin,
+    CompiledSerializerMixin,
+    viewsets.ModelViewSet,
+):
     """Appointment model viewset"""
 
     queryset = AppointmentRepository.get()
@@ -34,16 +86,99 @@ class AppointmentViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
     }
     filterset_class = AppointmentFilter
     permission_classes = [permissions.IsAuthenticated]
+    batch_max_size = 50
 
     def get_queryset(self):
-        if self.request.user.user_type == "DOCTOR":
-            qs = super().get_queryset().filter(doctor=self.request.user)
+        expand = self.get_expand()
+        if expand is None:
+            qs = AppointmentRepository.get()
         else:
-            qs = super().get_queryset()
+            qs = AppointmentRepository.get(expand)
 
+        if self.request.user.user_type == "DOCTOR":
+            qs = qs.filter(doctor=self.request.user)
+
+        return qs
+
+    def get_archived(self):
+        """
+        Archived appointments matching the filters, or None unless the
+        ``date`` filter reaches into the archive
+        """
+        if not self.request.query_params.get("date"):
+            return None
+
+        filterset = self.filterset_class(
+            self.request.query_params,
+            queryset=ArchivedAppointment.objects.all(),
+            request=self.request,
+        )
+        if not filterset.is_valid():
+            return None
+        date = filterset.form.cleaned_data["date"]
+        until = ArchiveRepository.appointments_until()
+        if until is None or date > until:
+            return None
+
+        qs = filterset.qs
+        if self.request.user.user_type == "DOCTOR":
+            qs = qs.filter(doctor=self.request.user)
         return qs
 
+    def archived_data(self, archived):
+        return collapse_expanded(
+            AppointmentReadSerializer,
+            ArchiveRepository.unpack(archived.data),
+            self.get_expand(),
+        )
+
+    def list(self, request, *args, **kwargs):
+        archived = self.get_archived()
+        if archived is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        data = self.get_serializer(queryset, many=True).data
+        data += [self.archived_data(appointment) for appointment in archived]
+        self.sort_merged(data, queryset)
+        page = self.paginate_queryset(data)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(data)
+
+    def sort_merged(self, data, queryset):
+        """
+        Sort live and archived appointments together by ``?ordering=``, by
+        start time without one. Expanded relations sort by their id.
+        """
+
+        def value(row, field):
+            value = row[field]
+            if isinstance(value, dict):
+                value = value.get("id")
+            # Nulls first, like ascending ORDER BY on SQLite
+            return value is not None, value
+
+        ordering = OrderingFilter().get_ordering(self.request, queryset, self)
+        # Stable sorts, from the last term to the first
+        for term in reversed(ordering or ["start_time"]):
+            field = term.lstrip("-")
+            if field == "profits":
+                continue
+            data.sort(key=partial(value, field=field), reverse=term.startswith("-"))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            doctor = request.user if request.user.user_type == "DOCTOR" else None
+            archived = ArchiveRepository.get_appointment(kwargs["pk"], doctor)
+            if archived is None:
+                raise
+            return Response(self.archived_data(archived))
+
     @action(detail=True, methods=["post"], serializer_class=ProfitAddSerializer)
+    @idempotent
     def add_profit(self, request, pk=None):
         """Add profit report action"""
         serializer = self.get_serializer(data=request.data)
@@ -52,9 +187,10 @@ class AppointmentViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
         appointment = self.get_object()
         date = serializer.validated_data["date"]
         amount = serializer.validated_data["amount"]
+        ArchiveRepository.check_open(date)
 
         try:
-            report, created = Report.objects.update_or_create(date=date)
+            report = ReportRepository.get_or_create_for_date(date)
             profit = Profit.objects.create(
                 report=report, appointment=appointment, amount=amount
             )
@@ -63,9 +199,36 @@ class AppointmentViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
+    @action(detail=False, methods=["post"], serializer_class=AppointmentBatchSerializer)
+    @idempotent
+    def batch(self, request):
+        """
+        Create the appointments without an ``id`` and update the others, all
+        or none. Errors are returned per item, in the order of the request.
+        """
+        queryset = AppointmentRepository.get(expand=())
+        if request.user.user_type == "DOCTOR":
+            queryset = queryset.filter(doctor=request.user)
+
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            max_length=self.batch_max_size,
+            context={**self.get_serializer_context(), "queryset": queryset},
+        )
+        serializer.is_valid(raise_exception=True)
+        appointments = serializer.save()
+        return Response(
+            AppointmentSerializer(appointments, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class ReportViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    CompiledSerializerMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
 ):
     """Report model viewset"""
 
@@ -98,6 +261,11 @@ class ReportViewSet(
             raise ValidationError(detail="Your should set by_date query param")
 
         page = self.paginate_queryset(queryset)
+        if page == []:
+            archived = ArchiveRepository.get_report(by_date)
+            if archived is not None:
+                page = self.paginate_queryset([archived])
+                return self.get_paginated_response(page)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
@@ -111,10 +279,18 @@ class ReportViewSet(
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         except Http404:
+            archived = ArchiveRepository.get_report(kwargs["date"])
+            if archived is not None:
+                return Response(archived)
             # Return an empty response if the object is not found
             return Response({}, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=["get"], url_path="range")
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="range",
+        throttle_classes=[HeavyReadThrottle],
+    )
     def get_reports_in_range(self, request):
         """Retrieve aggregated totals and a list of reports within a specified date range."""
         start_date_str = request.query_params.get("start_date")
@@ -154,16 +330,22 @@ class ReportViewSet(
         data = ReportRepository.get_reports_in_range(start_date, end_date)
 
         # Serialize the list of reports
-        report_serializer = ReportSerializer(data["reports"], many=True)
-
-        return Response(
-            {
-                "aggregated_totals": data["aggregated_totals"],
-                "reports": report_serializer.data,
+        totals = data["aggregated_totals"]
+        reports = ReportCompiledSerializer(data["reports"], many=True).data
+
+        # Merge the archived reports when the range reaches into the archive
+        archived = ArchiveRepository.get_reports_in_range(start_date, end_date)
+        if archived is not None:
+            totals = {
+                key: value + archived["aggregated_totals"][key]
+                for key, value in totals.items()
             }
-        )
+            reports = sorted(reports + archived["reports"], key=itemgetter("date"))
+
+        return Response({"aggregated_totals": totals, "reports": reports})
 
     @action(detail=False, methods=["post"], serializer_class=ProfitWriteSerializer)
+    @idempotent
     def add_profit(self, request):
         """Add profit report action"""
         serializer = self.get_serializer(data=request.data)
@@ -172,19 +354,21 @@ class ReportViewSet(
         date = serializer.validated_data["date"]
         appointment = serializer.validated_data["appointment"]
         amount = serializer.validated_data["amount"]
+        ArchiveRepository.check_open(date)
 
         try:
-            report, _ = Report.objects.update_or_create(date=date)
+            report = ReportRepository.get_or_create_for_date(date)
             Profit.objects.create(report=report, appointment=appointment, amount=amount)
 
             report = ReportRepository.get_annotated_report(report.id)
-            return Response(ReportSerializer(report).data)
+            return Response(ReportCompiledSerializer(report).data)
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
     @action(detail=False, methods=["post"], serializer_class=ConsumptionWriteSerializer)
+    @idempotent
     def add_consumption(self, request):
         """Add consumption report action"""
         serializer = self.get_serializer(data=request.data)
@@ -194,21 +378,23 @@ class ReportViewSet(
         title = serializer.validated_data["title"]
         description = serializer.validated_data["description"]
         amount = serializer.validated_data["amount"]
+        ArchiveRepository.check_open(date)
 
         try:
-            report, _ = Report.objects.update_or_create(date=date)
+            report = ReportRepository.get_or_create_for_date(date)
             Consumption.objects.create(
                 report=report, title=title, description=description, amount=amount
             )
 
             report = ReportRepository.get_annotated_report(report.id)
-            return Response(ReportSerializer(report).data)
+            return Response(ReportCompiledSerializer(report).data)
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
     @action(detail=False, methods=["post"], serializer_class=SalaryWriteSerializer)
+    @idempotent
     def add_salary(self, request):
         """Add consumption report action"""
         serializer = self.get_serializer(data=request.data)
@@ -219,9 +405,10 @@ class ReportViewSet(
         description = serializer.validated_data["description"]
         amount = serializer.validated_data["amount"]
         doctor = serializer.validated_data["doctor"]
+        ArchiveRepository.check_open(date)
 
         try:
-            report, _ = Report.objects.update_or_create(date=date)
+            report = ReportRepository.get_or_create_for_date(date)
             Salary.objects.create(
                 report=report,
                 title=title,
@@ -231,7 +418,7 @@ class ReportViewSet(
             )
 
             report = ReportRepository.get_annotated_report(report.id)
-            return Response(ReportSerializer(report).data)
+            return Response(ReportCompiledSerializer(report).data)
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -263,6 +450,7 @@ class SalaryViewSet(
 
         return qs
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         """Create a new salary instance"""
 
@@ -274,11 +462,12 @@ class SalaryViewSet(
         description = serializer.validated_data["description"]
         amount = serializer.validated_data["amount"]
         doctor = serializer.validated_data["doctor"]
+        ArchiveRepository.check_open(date)
 
         headers = self.get_success_headers(serializer.data)
 
         try:
-            report, _ = Report.objects.update_or_create(date=date)
+            report = ReportRepository.get_or_create_for_date(date)
             Salary.objects.create(
                 report=report,
                 title=title,
@@ -294,3 +483,258 @@ class SalaryViewSet(
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class PatientHistoryViewSet(
+    CompiledSerializerMixin, mixins.ListModelMixin, viewsets.GenericViewSet
+):
+    """Visit history of a patient with payments, newest first"""
+
+    serializer_class = PatientHistorySerializer
+    pagination_class = HistoryCursorPagination
+    filter_backends = []
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        patient_pk = self.kwargs.get("patient_pk")
+        user = self.request.user
+        qs = AppointmentRepository.get_patient_history(patient_pk)
+
+        if user.user_type == "DOCTOR":
+            qs = qs.filter(doctor=user)
+        elif user.user_type == "PATIENT" and str(user.pk) != patient_pk:
+            qs = qs.none()
+
+        return qs
+
+
+class DashboardViewSet(viewsets.GenericViewSet):
+    """Dashboard view set"""
+
+    appointments_limit = 20
+    salaries_limit = 5
+
+    @action(
+        detail=False,
+        methods=["get"],
+        serializer_class=DoctorDashboardSerializer,
+        permission_classes=[IsDoctor],
+    )
+    def doctor(self, request):
+        """The signed in doctor's home screen, in one request"""
+        doctor = request.user
+        key = f"doctor-dashboard:{doctor.pk}"
+        data = cache.get(key)
+        if data is None:
+            data = self.get_doctor_dashboard(doctor)
+            cache.set(key, data, settings.DOCTOR_DASHBOARD_CACHE_SECONDS)
+        return Response(data)
+
+    def get_doctor_dashboard(self, doctor):
+        today = timezone.localdate()
+        appointments = DashboardRepository.get_appointments(
+            doctor, today, self.appointments_limit
+        )
+        salaries = DashboardRepository.get_salaries(doctor, self.salaries_limit)
+
+        data = {
+            "balance": doctor.balance,
+            "earnings": DashboardRepository.get_earnings(doctor, today),
+            "today": [],
+            "upcoming": [],
+            "salaries": DashboardSalaryCompiledSerializer(salaries, many=True).data,
+        }
+        for appointment, item in zip(
+            appointments,
+            DashboardAppointmentCompiledSerializer(appointments, many=True).data,
+        ):
+            data["today" if appointment.date == today else "upcoming"].append(item)
+        return data
+
+
+class ChangeFeedViewSet(viewsets.GenericViewSet):
+    """
+    Rows changed and ids deleted since a cursor, for clients that keep a
+    local copy. Without a cursor every row is sent. Clients fetch pages
+    until ``has_more`` is false and keep the last ``cursor`` for the next
+    sync, which then costs as much as the number of changes.
+    """
+
+    serializer_class = ChangeFeedSerializer
+    permission_classes = [IsAdmin]
+    filter_backends = []
+    pagination_class = None
+
+    feeds = {
+        "patients": (PatientRepository.get, PatientSerializer),
+        "doctors": (DoctorRepository.get, DoctorSerializer),
+        "appointments": (
+            partial(AppointmentRepository.get, expand=()),
+            AppointmentSerializer,
+        ),
+        "services": (ServiceRepository.get, ServiceSerializer),
+        "reports": (ReportRepository.get, ReportCompiledSerializer),
+    }
+    limit = 100
+    max_limit = 500
+
+    @staticmethod
+    def encode_cursor(updated_at, pk, tombstone, issued_at):
+        if updated_at is not None:
+            updated_at = updated_at.isoformat()
+        data = json.dumps([updated_at, pk, tombstone, issued_at])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            updated_at, pk, tombstone, issued_at = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+            if updated_at is not None:
+                updated_at = datetime.fromisoformat(updated_at)
+            return updated_at, int(pk), int(tombstone), float(issued_at)
+        except (TypeError, ValueError):
+            raise ValidationError({"cursor": "Invalid cursor."})
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get("limit", self.limit))
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+        return max(1, min(limit, self.max_limit))
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="(?P<feed>patients|doctors|appointments|services|reports)",
+        url_name="feed",
+    )
+    def feed(self, request, feed=None):
+        """Changes of one model since ``cursor``"""
+        now = timezone.now()
+        until = now - timedelta(seconds=settings.CHANGE_FEED_LAG_SECONDS)
+        limit = self.get_limit()
+
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            updated_at, pk, tombstone, issued_at = self.decode_cursor(cursor)
+            expired = now - timedelta(days=settings.CHANGE_FEED_TOMBSTONE_DAYS)
+            if issued_at < expired.timestamp():
+                return Response(
+                    {"error": "The cursor is too old, sync again without it."},
+                    status=status.HTTP_410_GONE,
+                )
+        else:
+            # A client without data has nothing to delete
+            updated_at, pk = None, 0
+            tombstone = ChangeFeedRepository.last_tombstone()
+
+        get_queryset, serializer_class = self.feeds[feed]
+        rows = list(
+            ChangeFeedRepository.get_changes(
+                get_queryset(),
+                None if updated_at is None else (updated_at, pk),
+                until,
+                limit + 1,
+            )
+        )
+        deleted = ChangeFeedRepository.get_deleted(feed, tombstone, until, limit + 1)
+        has_more = len(rows) > limit or len(deleted) > limit
+        rows, deleted = rows[:limit], deleted[:limit]
+
+        if rows:
+            updated_at, pk = rows[-1].updated_at, rows[-1].pk
+        if deleted:
+            tombstone = deleted[-1][0]
+
+        return Response(
+            {
+                "results": serializer_class(rows, many=True).data,
+                "deleted": [object_id for _, object_id in deleted],
+                "cursor": self.encode_cursor(
+                    updated_at, pk, tombstone, now.timestamp()
+                ),
+                "has_more": has_more,
+            }
+        )
+
+
+class AnalyticsViewSet(viewsets.GenericViewSet):
+    """Analytics for the clinic's owners"""
+
+    permission_classes = [IsAdmin]
+    filter_backends = []
+
+    @action(
+        detail=False,
+        methods=["get"],
+        serializer_class=DoctorEarningsSerializer,
+        throttle_classes=[HeavyReadThrottle],
+    )
+    def doctors(self, request):
+        """
+        KPI earnings, salary paid and net payable of each doctor between
+        ``start_date`` and ``end_date``, sorted by ``ordering``
+        """
+        query = DoctorEarningsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start_date, end_date, ordering = itemgetter(
+            "start_date", "end_date", "ordering"
+        )(query.validated_data)
+
+        doctors = AnalyticsRepository.get_doctor_earnings(
+            start_date, end_date, ordering
+        )
+        page = self.paginate_queryset(doctors)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class EventStreamView(View):
+    """
+    Server-Sent Events of appointment and payment changes. Admins may
+    filter by ``doctor`` and ``date``, doctors only get their own events.
+    ``EventSource`` can not send headers, so the access token may be given
+    in the ``token`` parameter.
+    """
+
+    http_method_names = ["get"]
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"error": "Events are only served by the ASGI application."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+
+        try:
+            user = await sync_to_async(authenticate_query_token)(request)
+        except APIException as e:
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+
+        if not user.is_authenticated or user.user_type == "PATIENT":
+            return JsonResponse(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        doctor = request.GET.get("doctor") or None
+        date = request.GET.get("date") or None
+        if user.user_type == "DOCTOR":
+            doctor = user.pk
+        elif doctor is not None and not doctor.isdigit():
+            return JsonResponse({"doctor": "A valid integer is required."}, status=400)
+        try:
+            if date is not None and parse_date(date) is None:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({"date": "Use the YYYY-MM-DD format."}, status=400)
+
+        response = StreamingHttpResponse(
+            stream(channel_pattern(doctor, date)), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Let nginx pass events through as they come
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -1,10 +1,257 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
 from django.contrib.auth import views
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import (
+    add_never_cache_headers,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+
+from core.authentication import authenticate_query_token
+from core.revocation import RevocableAccessToken, RevocableRefreshToken
+from src.management.models import User
+
 
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+ACCEPTS_BROTLI = re.compile(r"\bbr\b")
 
+
+@method_decorator(csrf_exempt, name="dispatch")
 class LogoutView(views.LogoutView):
-    """ """
+    """
+    Log out of the session, or revoke the bearer access token and a refresh
+    token in the body. Token logouts leave the session alone, so only
+    session logouts need a CSRF token.
+    """
 
     http_method_names = ["get", "post", "options"]
 
+    def dispatch(self, request, *args, **kwargs):
+        access, refresh = self.get_tokens(request)
+        if request.method not in ("GET", "POST") or not (access or refresh):
+            return super().dispatch(request, *args, **kwargs)
+
+        for token_class, raw_token in (
+            (RevocableAccessToken, access),
+            (RevocableRefreshToken, refresh),
+        ):
+            if not raw_token:
+                continue
+            try:
+                token_class(raw_token).revoke()
+            except TokenError:
+                pass  # Invalid, expired or already revoked
+
+        response = JsonResponse({"detail": "Logged out."})
+        add_never_cache_headers(response)
+        return response
+
     def get(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
+
+    def get_tokens(self, request):
+        """Raw bearer access token and refresh token of the request"""
+        header = JWTAuthentication().get_header(request)
+        try:
+            access = header and JWTAuthentication().get_raw_token(header)
+        except AuthenticationFailed:
+            access = None
+
+        refresh = request.POST.get("refresh")
+        if refresh is None and request.content_type == "application/json":
+            try:
+                refresh = json.loads(request.body).get("refresh")
+            except (ValueError, AttributeError):
+                refresh = None
+        return access, refresh
+
+
+@lru_cache(maxsize=None)
+def load_schema(path):
+    """Read a built schema once per worker, with its gzipped body and ETag"""
+    content = Path(path).read_bytes()
+    etag = f'W/"{hashlib.sha256(content).hexdigest()[:32]}"'
+    return content, gzip.compress(content, mtime=0), etag
+
+
+class SchemaView(View):
+    """Serve the OpenAPI schema written by ``manage.py build_schema``"""
+
+    http_method_names = ["get", "head", "options"]
+    content_type = "application/vnd.oai.openapi; charset=utf-8"
+
+    def get(self, request, *args, **kwargs):
+        try:
+            content, compressed, etag = load_schema(settings.SCHEMA_PATH)
+        except FileNotFoundError:
+            raise Http404("The schema is not built, run manage.py build_schema.")
+
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
+        elif ACCEPTS_GZIP.search(request.headers.get("Accept-Encoding", "")):
+            response = HttpResponse(compressed, content_type=self.content_type)
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(content, content_type=self.content_type)
+
+        response["ETag"] = etag
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+
+# <-----File Views----> #
+
+def find_file(root, path):
+    """Absolute path and name under ``root`` of a file, 404 if there is none"""
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    return full_path, Path(os.path.relpath(full_path, root)).as_posix()
+
+
+def send_file(full_path, name, accel_prefix, encoding=None):
+    """
+    Response with a file, sent by the front proxy when ``FILE_TRANSFER`` is
+    set. ``name`` is the file's path under ``accel_prefix``, ``full_path``
+    may be a compressed copy.
+    """
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if settings.FILE_TRANSFER == "x-accel":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = quote(accel_prefix + name)
+    elif settings.FILE_TRANSFER == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+    else:
+        response = FileResponse(
+            open(full_path, "rb"),
+            content_type=content_type,
+            filename=os.path.basename(name),
+        )
+    if encoding is not None:
+        response["Content-Encoding"] = encoding
+    return response
+
+
+@lru_cache(maxsize=None)
+def hashed_static_names():
+    """Names given by the manifest storage, which change with the content"""
+    return frozenset(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+
+class StaticView(View):
+    """
+    Serve collected static files. Hashed names are cached for good, and the
+    ``.br`` or ``.gz`` copy is sent to clients accepting it.
+    """
+
+    http_method_names = ["get", "head"]
+    encodings = ((".br", "br", ACCEPTS_BROTLI), (".gz", "gzip", ACCEPTS_GZIP))
+
+    def get(self, request, path):
+        full_path, name = find_file(settings.STATIC_ROOT, path)
+
+        encoding = None
+        # nginx picks the copy itself
+        if settings.FILE_TRANSFER != "x-accel":
+            accept_encoding = request.headers.get("Accept-Encoding", "")
+            for extension, coding, accepts in self.encodings:
+                if accepts.search(accept_encoding) and os.path.isfile(
+                    full_path + extension
+                ):
+                    full_path, encoding = full_path + extension, coding
+                    break
+
+        response = send_file(full_path, name, settings.STATIC_ACCEL_PREFIX, encoding)
+        if name in hashed_static_names():
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.STATIC_CACHE_SECONDS,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+
+class MediaView(View):
+    """
+    Serve uploaded files the user may see. Catalog images and the avatars of
+    doctors and admins are public, a patient's avatar is only served to the
+    patient and to staff. ``<img>`` can not send headers, so the access token
+    may be given in the ``token`` parameter.
+    """
+
+    http_method_names = ["get", "head"]
+    public_prefixes = ("specialties/", "services/", "CACHE/")
+    staff = ("ADMIN", "DOCTOR")
+
+    def get_owner(self, name):
+        """Id and type of the user the file is the avatar of, None if public"""
+        if name.startswith(self.public_prefixes):
+            return None
+        if name == settings.NO_AVATAR.lstrip("/"):
+            return None
+        owner = User.objects.filter(avatar=name).values_list("pk", "user_type").first()
+        if owner is None:
+            raise Http404
+        return owner
+
+    def get(self, request, path):
+        full_path, name = find_file(settings.MEDIA_ROOT, path)
+        owner = self.get_owner(name)
+
+        if owner is None or owner[1] in self.staff:
+            cache_control = {"public": True}
+        else:
+            try:
+                user = authenticate_query_token(request)
+            except APIException as e:
+                return JsonResponse({"detail": e.detail}, status=e.status_code)
+            if not user.is_authenticated or (
+                user.pk != owner[0] and user.user_type not in self.staff
+            ):
+                return JsonResponse(
+                    {"detail": "You do not have permission to perform this action."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+            cache_control = {"private": True}
+
+        response = send_file(full_path, name, settings.MEDIA_ACCEL_PREFIX)
+        patch_cache_control(
+            response, max_age=settings.MEDIA_CACHE_SECONDS, **cache_control
+        )
+        return response